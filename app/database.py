@@ -1,20 +1,77 @@
 """
 数据库连接模块
-SQLite 异步连接配置和会话管理
+异步连接配置和会话管理, 支持 SQLite (默认, 单机) 和 PostgreSQL (asyncpg, 多节点部署)
+
+- engine: 通用连接池, 供大部分路由读写
+- read_engine: 只读连接池, 供列表、统计、导出等只读页面使用
+  (SQLite 为 query_only, PostgreSQL 为 default_transaction_read_only)
+- write_engine: 供 app.db_writer 写入队列使用; SQLite 下为单条写连接,
+  PostgreSQL 并发写入依靠行锁, 连接池大小与通用连接池相同
 """
-from sqlalchemy import text
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import declarative_base
 from app.config import settings
+from app.db_profile import sqlite_profile
+
+# 数据库类型: sqlite / postgresql
+DATABASE_BACKEND = make_url(settings.database_url).get_backend_name()
+IS_SQLITE = DATABASE_BACKEND == "sqlite"
+
+
+def _engine_options(pool_size: int, max_overflow: int, read_only: bool = False) -> dict:
+    """
+    按数据库类型生成引擎参数
+
+    Args:
+        pool_size: 连接池大小
+        max_overflow: 溢出连接数
+        read_only: 是否为只读连接池
+
+    Returns:
+        create_async_engine 的关键字参数
+    """
+    options = {
+        "echo": settings.debug,  # 开发环境打印 SQL
+        "future": True,
+        "pool_size": pool_size,
+        "max_overflow": max_overflow,
+        "pool_timeout": settings.database_pool_timeout,
+    }
+    if IS_SQLITE:
+        options["connect_args"] = {"timeout": 30}
+    else:
+        options["pool_pre_ping"] = True
+        options["pool_recycle"] = settings.database_pool_recycle
+        if read_only:
+            options["connect_args"] = {"server_settings": {"default_transaction_read_only": "on"}}
+    return options
+
 
 # 创建异步引擎
 engine = create_async_engine(
     settings.database_url,
-    echo=settings.debug,  # 开发环境打印 SQL
-    future=True,
-    connect_args={"timeout": 30}
+    **_engine_options(settings.database_pool_size, settings.database_max_overflow)
 )
 
+read_engine = create_async_engine(
+    settings.database_url,
+    **_engine_options(settings.database_read_pool_size, 0, read_only=True)
+)
+
+# 写入单元在调用方仍持有通用连接时执行, 必须使用独立的连接池, 否则并发时会耗尽连接池互相等待
+if IS_SQLITE:
+    write_engine = create_async_engine(settings.database_url, **_engine_options(1, 0))
+
+    sqlite_profile.install(engine)
+    sqlite_profile.install(read_engine, read_only=True)
+    sqlite_profile.install(write_engine, immediate=True)
+else:
+    write_engine = create_async_engine(
+        settings.database_url,
+        **_engine_options(settings.database_pool_size, settings.database_max_overflow)
+    )
+
 # 创建异步会话工厂
 AsyncSessionLocal = async_sessionmaker(
     engine,
@@ -24,10 +81,43 @@ AsyncSessionLocal = async_sessionmaker(
     autoflush=False
 )
 
+ReadSessionLocal = async_sessionmaker(
+    read_engine,
+    class_=AsyncSession,
+    expire_on_commit=False,
+    autocommit=False,
+    autoflush=False
+)
+
+WriteSessionLocal = async_sessionmaker(
+    write_engine,
+    class_=AsyncSession,
+    expire_on_commit=False,
+    autocommit=False,
+    autoflush=False
+)
+
 # 创建 Base 类
 Base = declarative_base()
 
 
+def dialect_insert(entity):
+    """
+    当前数据库方言的 INSERT 构造, 支持 on_conflict_do_nothing / on_conflict_do_update
+
+    Args:
+        entity: 模型类或表
+
+    Returns:
+        方言 Insert 语句
+    """
+    if IS_SQLITE:
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        from sqlalchemy.dialects.postgresql import insert
+    return insert(entity)
+
+
 async def get_db() -> AsyncSession:
     """
     获取数据库会话
@@ -40,13 +130,30 @@ async def get_db() -> AsyncSession:
             await session.close()
 
 
+async def get_read_db() -> AsyncSession:
+    """
+    获取只读数据库会话
+    用于只读页面的 FastAPI 依赖注入, 会话内的写入会被拒绝
+    """
+    async with ReadSessionLocal() as session:
+        try:
+            yield session
+        finally:
+            await session.close()
+
+
 async def init_db():
     """
     初始化数据库
     创建所有表
     """
+    # SQLite 的 journal_mode=WAL 等 PRAGMA 由 sqlite_profile 在每个连接建立时设置
+    from app.db_migrations import lock_schema
+
     async with engine.begin() as conn:
-        await conn.execute(text("PRAGMA journal_mode=WAL"))
+        if not IS_SQLITE:
+            # 多个节点同时启动时串行建表
+            await conn.run_sync(lock_schema)
         await conn.run_sync(Base.metadata.create_all)
 
 
@@ -55,3 +162,5 @@ async def close_db():
     关闭数据库连接
     """
     await engine.dispose()
+    await read_engine.dispose()
+    await write_engine.dispose()
@@ -1,121 +1,289 @@
 """
 数据库自动迁移模块
-在应用启动时自动检测并执行必要的数据库迁移
+按版本号顺序执行迁移脚本, 已执行的版本记录在 schema_version 表中;
+启动时结构已是最新版本则只做一次版本查询, 直接跳过
+
+支持 SQLite 和 PostgreSQL: 迁移通过 SQLAlchemy 同步连接 (run_sync) 执行,
+结构查询按方言分别实现
 """
+import asyncio
 import logging
-import sqlite3
+import time
 from pathlib import Path
 from datetime import datetime
+from typing import Callable, List, NamedTuple, Optional
+
+from sqlalchemy import DateTime, bindparam, inspect, text
+from sqlalchemy.engine import Connection, make_url
 
 logger = logging.getLogger(__name__)
 
+# PostgreSQL 建表和迁移使用的事务级 advisory lock 键, 多个节点同时启动时串行执行
+PG_MIGRATION_LOCK_KEY = 7304_2025
+
 
-def get_db_path():
-    """获取数据库文件路径"""
+def get_db_path() -> Optional[Path]:
+    """获取 SQLite 数据库文件路径, 其他数据库 (或内存数据库) 返回 None"""
     from app.config import settings
-    db_file = settings.database_url.split("///")[-1]
-    return Path(db_file)
+    url = make_url(settings.database_url)
+    if url.get_backend_name() != "sqlite" or not url.database or url.database == ":memory:":
+        return None
+    return Path(url.database)
+
+
+def is_sqlite(conn: Connection) -> bool:
+    """连接是否为 SQLite"""
+    return conn.dialect.name == "sqlite"
 
 
-def column_exists(cursor, table_name, column_name):
+def column_exists(conn: Connection, table_name: str, column_name: str) -> bool:
     """检查表中是否存在指定列"""
-    cursor.execute(f"PRAGMA table_info({table_name})")
-    columns = [row[1] for row in cursor.fetchall()]
-    return column_name in columns
+    return any(column["name"] == column_name for column in inspect(conn).get_columns(table_name))
+
+
+def index_exists(conn: Connection, index_name: str) -> bool:
+    """检查是否存在指定索引"""
+    if is_sqlite(conn):
+        sql = "SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = :name"
+    else:
+        sql = "SELECT 1 FROM pg_indexes WHERE schemaname = current_schema() AND indexname = :name"
+    return conn.execute(text(sql), {"name": index_name}).first() is not None
+
+
+def add_column(conn: Connection, table_name: str, column_name: str, column_ddl: str):
+    """
+    添加列 (已存在时跳过)
+
+    引入版本号之前的数据库可能已经执行过部分旧迁移, 因此加列步骤需要保持幂等;
+    PostgreSQL 数据库由 create_all 按当前模型建表, 这些列已存在
+
+    Args:
+        conn: 数据库连接
+        table_name: 表名
+        column_name: 列名
+        column_ddl: 列类型及默认值, 如 "INTEGER DEFAULT 0"
+    """
+    if column_exists(conn, table_name, column_name):
+        return
+    logger.info(f"添加 {table_name}.{column_name} 字段")
+    conn.exec_driver_sql(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {column_ddl}")
+
+
+def create_index(conn: Connection, index_name: str, table_name: str, columns: str, using: Optional[str] = None):
+    """
+    创建索引 (已存在时跳过)
+
+    Args:
+        conn: 数据库连接
+        index_name: 索引名
+        table_name: 表名
+        columns: 索引列表达式, 如 "lower(email), team_id"
+        using: 索引类型 (仅 PostgreSQL), 如 "gin"
+    """
+    if index_exists(conn, index_name):
+        return
+    logger.info(f"添加 {table_name}({columns}) 索引 {index_name}")
+    method = f" USING {using}" if using else ""
+    conn.exec_driver_sql(f"CREATE INDEX IF NOT EXISTS {index_name} ON {table_name}{method} ({columns})")
+
+
+# ==================== 迁移脚本 ====================
+# 新迁移追加到 MIGRATIONS 末尾, 版本号递增; 已发布的迁移不要修改或调整顺序
+
+def _migrate_warranty_columns(conn):
+    add_column(conn, "redemption_codes", "has_warranty", "BOOLEAN DEFAULT 0")
+    add_column(conn, "redemption_codes", "warranty_expires_at", "DATETIME")
+    add_column(conn, "redemption_codes", "warranty_days", "INTEGER DEFAULT 30")
+    add_column(conn, "redemption_records", "is_warranty_redemption", "BOOLEAN DEFAULT 0")
+
+
+def _migrate_token_refresh_columns(conn):
+    add_column(conn, "teams", "refresh_token_encrypted", "TEXT")
+    add_column(conn, "teams", "session_token_encrypted", "TEXT")
+    add_column(conn, "teams", "client_id", "VARCHAR(100)")
+    add_column(conn, "teams", "error_count", "INTEGER DEFAULT 0")
+    add_column(conn, "teams", "account_role", "VARCHAR(50)")
+
+
+def _migrate_email_lower_team_index(conn):
+    create_index(conn, "idx_email_lower_team", "redemption_records", "lower(email), team_id")
+
+
+def _migrate_redeemed_at_index(conn):
+    create_index(conn, "idx_redeemed_at", "redemption_records", "redeemed_at")
+
+
+def _migrate_code_created_at_index(conn):
+    create_index(conn, "idx_code_created_at", "redemption_codes", "created_at")
+
+
+def _migrate_search_indexes(conn):
+    from app.services.search_index import search_index_service
+    search_index_service.ensure_indexes(conn)
+
+
+def _migrate_hot_path_indexes(conn):
+    create_index(conn, "idx_team_available", "teams", "status, expires_at, id, current_members, max_members")
+    create_index(conn, "idx_code_status_created", "redemption_codes", "status, created_at")
+    create_index(conn, "idx_record_code_redeemed", "redemption_records", "code, redeemed_at")
+    create_index(conn, "idx_record_team_redeemed", "redemption_records", "team_id, redeemed_at")
+
+
+def _migrate_retry_email_team_index(conn):
+    create_index(conn, "idx_retry_email_team", "invite_retry_queue", "lower(email), team_id, status")
+
 
+def _migrate_settings_generation_column(conn):
+    add_column(conn, "settings", "generation", "INTEGER DEFAULT 0")
 
-def run_auto_migration():
+
+class Migration(NamedTuple):
+    """单个迁移脚本"""
+    version: int
+    description: str
+    apply: Callable[[Connection], None]
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, "兑换码质保字段", _migrate_warranty_columns),
+    Migration(2, "Team Token 刷新字段", _migrate_token_refresh_columns),
+    Migration(3, "redemption_records(lower(email), team_id) 索引", _migrate_email_lower_team_index),
+    Migration(4, "redemption_records(redeemed_at) 索引", _migrate_redeemed_at_index),
+    Migration(5, "redemption_codes(created_at) 索引", _migrate_code_created_at_index),
+    Migration(6, "全文搜索索引 (SQLite FTS5 / PostgreSQL pg_trgm)", _migrate_search_indexes),
+    Migration(7, "热点查询组合索引", _migrate_hot_path_indexes),
+    Migration(8, "invite_retry_queue(lower(email), team_id, status) 索引", _migrate_retry_email_team_index),
+    Migration(9, "settings.generation 设置代数字段", _migrate_settings_generation_column),
+]
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+def get_schema_version(conn: Connection) -> int:
+    """获取当前数据库结构版本, schema_version 表不存在时返回 0"""
+    if not inspect(conn).has_table("schema_version"):
+        return 0
+    return conn.execute(text("SELECT MAX(version) FROM schema_version")).scalar() or 0
+
+
+def _ensure_version_table(conn: Connection):
+    conn.exec_driver_sql("""
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            description VARCHAR(255) NOT NULL,
+            applied_at TIMESTAMP NOT NULL,
+            duration_ms INTEGER NOT NULL
+        )
+    """)
+
+
+def lock_schema(conn: Connection):
+    """
+    获取表结构变更锁 (在事务开始后调用, 建表和迁移共用)
+
+    SQLite 的写连接以 BEGIN IMMEDIATE 开始事务, 已持有写锁;
+    PostgreSQL 使用事务级 advisory lock, 提交或回滚时自动释放
+    """
+    if not is_sqlite(conn):
+        conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": PG_MIGRATION_LOCK_KEY})
+
+
+def _apply_pending(conn: Connection) -> List[int]:
+    """
+    执行未应用的迁移
+
+    每个迁移在独立事务中执行并记录版本号; 多个进程同时启动时,
+    后拿到锁的进程会重新读取版本号, 不会重复执行
+
+    Returns:
+        本次执行的迁移版本号列表
+    """
+    applied: List[int] = []
+    with conn.begin():
+        lock_schema(conn)
+        _ensure_version_table(conn)
+        current = get_schema_version(conn)
+
+    record = text(
+        "INSERT INTO schema_version (version, description, applied_at, duration_ms) "
+        "VALUES (:version, :description, :applied_at, :duration_ms)"
+    ).bindparams(bindparam("applied_at", type_=DateTime()))
+
+    for migration in MIGRATIONS:
+        if migration.version <= current:
+            continue
+
+        step_started = time.perf_counter()
+        try:
+            with conn.begin():
+                lock_schema(conn)
+                # 等待锁期间其他进程可能已执行了该迁移
+                current = get_schema_version(conn)
+                if migration.version <= current:
+                    continue
+
+                migration.apply(conn)
+                duration_ms = int((time.perf_counter() - step_started) * 1000)
+                conn.execute(record, {
+                    "version": migration.version,
+                    "description": migration.description,
+                    "applied_at": datetime.now(),
+                    "duration_ms": duration_ms,
+                })
+        except Exception:
+            logger.error(f"迁移 {migration.version} ({migration.description}) 执行失败")
+            raise
+
+        current = migration.version
+        applied.append(migration.version)
+        logger.info(f"迁移 {migration.version} ({migration.description}) 完成，耗时 {duration_ms}ms")
+
+    return applied
+
+
+async def run_migrations() -> List[int]:
     """
-    自动运行数据库迁移
-    检测缺失的列并自动添加
+    运行数据库迁移
+
+    版本查询使用通用连接池; 需要迁移时在写连接上执行 (SQLite 为 BEGIN IMMEDIATE 的单写连接)
+
+    Returns:
+        本次执行的迁移版本号列表
     """
+    from app.database import engine, write_engine
+    from app.services.search_index import search_index_service
+
     db_path = get_db_path()
-    
-    if not db_path.exists():
+    if db_path is not None and not db_path.exists():
         logger.info("数据库文件不存在，跳过迁移")
-        return
-    
-    logger.info("开始检查数据库迁移...")
-    
+        return []
+
+    started = time.perf_counter()
+    applied: List[int] = []
     try:
-        conn = sqlite3.connect(str(db_path))
-        cursor = conn.cursor()
-        
-        migrations_applied = []
-        
-        # 检查并添加质保相关字段
-        if not column_exists(cursor, "redemption_codes", "has_warranty"):
-            logger.info("添加 redemption_codes.has_warranty 字段")
-            cursor.execute("""
-                ALTER TABLE redemption_codes 
-                ADD COLUMN has_warranty BOOLEAN DEFAULT 0
-            """)
-            migrations_applied.append("redemption_codes.has_warranty")
-        
-        if not column_exists(cursor, "redemption_codes", "warranty_expires_at"):
-            logger.info("添加 redemption_codes.warranty_expires_at 字段")
-            cursor.execute("""
-                ALTER TABLE redemption_codes 
-                ADD COLUMN warranty_expires_at DATETIME
-            """)
-            migrations_applied.append("redemption_codes.warranty_expires_at")
-        
-        if not column_exists(cursor, "redemption_codes", "warranty_days"):
-            logger.info("添加 redemption_codes.warranty_days 字段")
-            cursor.execute("""
-                ALTER TABLE redemption_codes 
-                ADD COLUMN warranty_days INTEGER DEFAULT 30
-            """)
-            migrations_applied.append("redemption_codes.warranty_days")
-        
-        if not column_exists(cursor, "redemption_records", "is_warranty_redemption"):
-            logger.info("添加 redemption_records.is_warranty_redemption 字段")
-            cursor.execute("""
-                ALTER TABLE redemption_records 
-                ADD COLUMN is_warranty_redemption BOOLEAN DEFAULT 0
-            """)
-            migrations_applied.append("redemption_records.is_warranty_redemption")
-
-        # 检查并添加 Token 刷新相关字段
-        if not column_exists(cursor, "teams", "refresh_token_encrypted"):
-            logger.info("添加 teams.refresh_token_encrypted 字段")
-            cursor.execute("ALTER TABLE teams ADD COLUMN refresh_token_encrypted TEXT")
-            migrations_applied.append("teams.refresh_token_encrypted")
-
-        if not column_exists(cursor, "teams", "session_token_encrypted"):
-            logger.info("添加 teams.session_token_encrypted 字段")
-            cursor.execute("ALTER TABLE teams ADD COLUMN session_token_encrypted TEXT")
-            migrations_applied.append("teams.session_token_encrypted")
-
-        if not column_exists(cursor, "teams", "client_id"):
-            logger.info("添加 teams.client_id 字段")
-            cursor.execute("ALTER TABLE teams ADD COLUMN client_id VARCHAR(100)")
-            migrations_applied.append("teams.client_id")
-
-        if not column_exists(cursor, "teams", "error_count"):
-            logger.info("添加 teams.error_count 字段")
-            cursor.execute("ALTER TABLE teams ADD COLUMN error_count INTEGER DEFAULT 0")
-            migrations_applied.append("teams.error_count")
-
-        if not column_exists(cursor, "teams", "account_role"):
-            logger.info("添加 teams.account_role 字段")
-            cursor.execute("ALTER TABLE teams ADD COLUMN account_role VARCHAR(50)")
-            migrations_applied.append("teams.account_role")
-        
-        # 提交更改
-        conn.commit()
-        
-        if migrations_applied:
-            logger.info(f"数据库迁移完成，应用了 {len(migrations_applied)} 个迁移: {', '.join(migrations_applied)}")
-        else:
-            logger.info("数据库已是最新版本，无需迁移")
-        
-        conn.close()
-        
+        async with engine.connect() as conn:
+            current = await conn.run_sync(get_schema_version)
+
+        if current < LATEST_VERSION:
+            logger.info(f"数据库结构版本 {current}，最新版本 {LATEST_VERSION}，开始迁移...")
+            async with write_engine.connect() as conn:
+                applied = await conn.run_sync(_apply_pending)
+
+        # 确认全文索引是否可用
+        async with engine.connect() as conn:
+            await conn.run_sync(search_index_service.detect)
+
     except Exception as e:
         logger.error(f"数据库迁移失败: {e}")
         raise
 
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    if applied:
+        logger.info(f"数据库迁移完成，应用了 {len(applied)} 个迁移，当前版本 {LATEST_VERSION}，总耗时 {elapsed_ms:.1f}ms")
+    else:
+        logger.info(f"数据库已是最新版本 ({LATEST_VERSION})，无需迁移，耗时 {elapsed_ms:.1f}ms")
+    return applied
+
 
 if __name__ == "__main__":
     # 允许直接运行此脚本进行迁移
@@ -123,5 +291,13 @@ if __name__ == "__main__":
         level=logging.INFO,
         format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
     )
-    run_auto_migration()
+
+    async def _main():
+        from app.database import close_db
+        try:
+            await run_migrations()
+        finally:
+            await close_db()
+
+    asyncio.run(_main())
     print("迁移完成")
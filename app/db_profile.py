@@ -0,0 +1,113 @@
+"""
+SQLite 连接配置模块
+连接池每建立一个新连接都执行同一组 PRAGMA, 保证所有连接行为一致
+"""
+import logging
+from typing import Dict, List, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+SYNCHRONOUS_MODES = ("OFF", "NORMAL", "FULL", "EXTRA")
+TEMP_STORE_MODES = ("DEFAULT", "FILE", "MEMORY")
+
+
+def _choice(name: str, value: str, allowed: Tuple[str, ...], default: str) -> str:
+    value = (value or "").strip().upper()
+    if value in allowed:
+        return value
+    logger.warning(f"无效的 {name} 配置 {value!r}, 使用默认值 {default}")
+    return default
+
+
+class SQLiteProfile:
+    """
+    SQLite 连接配置
+
+    - journal_mode=WAL: 读写互不阻塞
+    - synchronous=NORMAL: WAL 模式下只在检查点时 fsync, 掉电最多丢失最近的事务, 不会损坏数据库
+    - cache_size / mmap_size: 热数据页留在内存, 列表和统计查询少走系统调用
+    - temp_store=MEMORY: 排序和临时索引不落盘
+    - busy_timeout: 写锁冲突时等待而不是立即报 database is locked
+    - wal_autocheckpoint / journal_size_limit: 自动检查点作为兜底,
+      主要由后台检查点任务在请求路径之外完成 (见 app.services.wal_checkpoint)
+    """
+
+    def __init__(self):
+        self.synchronous = _choice("sqlite_synchronous", settings.sqlite_synchronous, SYNCHRONOUS_MODES, "NORMAL")
+        self.temp_store = _choice("sqlite_temp_store", settings.sqlite_temp_store, TEMP_STORE_MODES, "MEMORY")
+        self.cache_size_kb = max(0, int(settings.sqlite_cache_size_kb))
+        self.mmap_size_mb = max(0, int(settings.sqlite_mmap_size_mb))
+        self.busy_timeout_ms = max(0, int(settings.sqlite_busy_timeout_ms))
+        self.wal_autocheckpoint = max(0, int(settings.sqlite_wal_autocheckpoint))
+        self.journal_size_limit_mb = max(0, int(settings.sqlite_journal_size_limit_mb))
+
+    def pragmas(self) -> List[Tuple[str, str]]:
+        """按执行顺序返回 (名称, 值) 列表"""
+        return [
+            ("journal_mode", "WAL"),
+            ("synchronous", self.synchronous),
+            ("busy_timeout", str(self.busy_timeout_ms)),
+            # 负数表示以 KiB 为单位
+            ("cache_size", str(-self.cache_size_kb)),
+            ("mmap_size", str(self.mmap_size_mb * 1024 * 1024)),
+            ("temp_store", self.temp_store),
+            ("wal_autocheckpoint", str(self.wal_autocheckpoint)),
+            ("journal_size_limit", str(self.journal_size_limit_mb * 1024 * 1024)),
+        ]
+
+    def apply(self, dbapi_connection):
+        """
+        在新建的 DBAPI 连接上执行全部 PRAGMA
+
+        Args:
+            dbapi_connection: sqlite3 连接或 SQLAlchemy 包装的 aiosqlite 连接
+        """
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in self.pragmas():
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
+
+    def install(self, engine: AsyncEngine, read_only: bool = False, immediate: bool = False):
+        """
+        注册连接事件, 连接池新建连接时自动应用配置
+
+        Args:
+            engine: 异步引擎
+            read_only: 开启 query_only, 该引擎上的任何写入都会被 SQLite 拒绝
+            immediate: 事务以 BEGIN IMMEDIATE 开始, 读取前先拿到写锁 (单写入者连接使用)
+        """
+        def _on_connect(dbapi_connection, connection_record):
+            self.apply(dbapi_connection)
+            if read_only:
+                cursor = dbapi_connection.cursor()
+                cursor.execute("PRAGMA query_only=ON")
+                cursor.close()
+            if immediate:
+                # 关闭驱动自带的事务管理, 由 begin 事件显式发出 BEGIN
+                dbapi_connection.isolation_level = None
+
+        event.listen(engine.sync_engine, "connect", _on_connect)
+
+        if immediate:
+            def _on_begin(conn):
+                conn.exec_driver_sql("BEGIN IMMEDIATE")
+
+            event.listen(engine.sync_engine, "begin", _on_begin)
+
+        logger.debug(f"SQLite 连接配置: {self.as_dict()}")
+
+    def as_dict(self) -> Dict[str, str]:
+        """配置内容 (用于日志和统计接口)"""
+        return dict(self.pragmas())
+
+
+# 创建全局实例
+sqlite_profile = SQLiteProfile()
@@ -0,0 +1,237 @@
+"""
+单写入者队列模块
+SQLite 同一时刻只允许一个写事务, 热点写入 (兑换占位、Team 状态、系统设置) 统一交给
+一条写连接串行执行, 写锁竞争从 database is locked / 30 秒超时变为有界排队;
+PostgreSQL 支持并发写事务, 写入单元各自在独立事务中直接执行, 由行锁保证一致性
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, TypeVar
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.config import settings
+from app.database import IS_SQLITE, WriteSessionLocal
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+WriteUnit = Callable[[AsyncSession], Awaitable[T]]
+
+
+class _WriteRequest:
+    """排队中的写入单元"""
+
+    __slots__ = ("unit", "label", "future", "enqueued_at")
+
+    def __init__(self, unit: WriteUnit, label: str, future: asyncio.Future):
+        self.unit = unit
+        self.label = label
+        self.future = future
+        self.enqueued_at = time.perf_counter()
+
+
+class DatabaseWriter:
+    """
+    单写入者队列
+
+    - 写入单元在写连接上按提交顺序串行执行, 事务以 BEGIN IMMEDIATE 开始,
+      单元内的读取-判断-写入在写锁保护下完成, 不会出现并发覆盖
+    - 执行期间到达的单元合并为一个事务提交 (group commit), 每个单元在独立的 SAVEPOINT 中执行,
+      单元抛出异常只回滚自身; 整批提交成功后各调用方才拿到结果
+    - serialize=False (PostgreSQL) 时不排队, 每个单元在独立事务中并发执行, 单元内用
+      SELECT ... FOR UPDATE 锁定要修改的行
+    - 写入单元内不要 commit / rollback, 不要发起网络请求; 返回值应为普通数据而不是 ORM 对象
+    """
+
+    def __init__(
+        self,
+        session_factory: async_sessionmaker,
+        max_batch: int = 32,
+        max_queue: int = 1000,
+        serialize: bool = True
+    ):
+        """
+        Args:
+            session_factory: 绑定写连接的会话工厂
+            max_batch: 每个事务最多合并的写入单元数
+            max_queue: 队列长度上限, 队列满时提交方等待
+            serialize: 是否经队列串行执行; 为 False 时每个单元在独立事务中直接执行
+        """
+        self.session_factory = session_factory
+        self.max_batch = max(1, int(max_batch))
+        self.max_queue = max(1, int(max_queue))
+        self.serialize = serialize
+        self._queue: Optional[asyncio.Queue] = None
+        self._loop_task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+        self.batches = 0
+        self.batch_failures = 0
+        self.max_batch_seen = 0
+        self.total_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+
+    def _ensure_worker(self):
+        """在当前事件循环中启动写入循环 (首次使用或事件循环变化时)"""
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and self._loop_task and not self._loop_task.done():
+            return
+        self._loop = loop
+        self._queue = asyncio.Queue(maxsize=self.max_queue)
+        self._loop_task = loop.create_task(self._worker_loop())
+
+    async def run(self, unit: WriteUnit, label: str = "write") -> T:
+        """
+        提交写入单元并等待其所在的事务提交
+
+        Args:
+            unit: 接收写会话的协程函数
+            label: 单元名称 (用于日志)
+
+        Returns:
+            unit 的返回值
+
+        Raises:
+            unit 抛出的异常, 或整批提交失败时的异常
+        """
+        if not self.serialize:
+            return await self._run_direct(unit, label)
+
+        self._ensure_worker()
+        future = self._loop.create_future()
+        await self._queue.put(_WriteRequest(unit, label, future))
+        self.submitted += 1
+        return await future
+
+    async def _run_direct(self, unit: WriteUnit, label: str) -> T:
+        """在独立事务中直接执行写入单元 (不排队)"""
+        self.submitted += 1
+        try:
+            async with self.session_factory() as session:
+                async with session.begin():
+                    result = await unit(session)
+        except Exception as e:
+            self.failed += 1
+            logger.warning(f"写入单元 {label} 失败, 已回滚: {e}")
+            raise
+
+        self.completed += 1
+        self.batches += 1
+        self.max_batch_seen = max(self.max_batch_seen, 1)
+        return result
+
+    async def _worker_loop(self):
+        queue = self._queue
+        while True:
+            batch = [await queue.get()]
+            while len(batch) < self.max_batch and not queue.empty():
+                batch.append(queue.get_nowait())
+            try:
+                await self._run_batch(batch)
+            except Exception as e:
+                logger.error(f"写入队列处理异常: {e}")
+
+    async def _run_batch(self, batch: List[_WriteRequest]):
+        """在一个事务中执行一批写入单元"""
+        started = time.perf_counter()
+        pending = [request for request in batch if not request.future.done()]
+        if not pending:
+            return
+
+        for request in pending:
+            wait_ms = (started - request.enqueued_at) * 1000
+            self.total_wait_ms += wait_ms
+            self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+
+        outcomes: List[tuple] = []
+        try:
+            async with self.session_factory() as session:
+                async with session.begin():
+                    for request in pending:
+                        try:
+                            async with session.begin_nested():
+                                result = await request.unit(session)
+                            outcomes.append((request, result, None))
+                        except Exception as e:
+                            logger.warning(f"写入单元 {request.label} 失败, 已回滚该单元: {e}")
+                            outcomes.append((request, None, e))
+        except Exception as e:
+            self.batch_failures += 1
+            self.failed += len(pending)
+            logger.error(f"写入批次提交失败 ({len(pending)} 个单元): {e}")
+            for request in pending:
+                if not request.future.done():
+                    request.future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.max_batch_seen = max(self.max_batch_seen, len(pending))
+        for request, result, error in outcomes:
+            if error is None:
+                self.completed += 1
+            else:
+                self.failed += 1
+            if request.future.done():
+                continue
+            if error is None:
+                request.future.set_result(result)
+            else:
+                request.future.set_exception(error)
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        if len(pending) > 1:
+            logger.debug(f"合并提交 {len(pending)} 个写入单元, 耗时 {elapsed_ms:.1f}ms")
+
+    async def stop(self):
+        """停止写入循环 (队列中未执行的单元会被取消)"""
+        task = self._loop_task
+        if not task:
+            return
+        if not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        if self._queue:
+            while not self._queue.empty():
+                request = self._queue.get_nowait()
+                if not request.future.done():
+                    request.future.cancel()
+        self._loop_task = None
+        self._loop = None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取写入队列统计信息"""
+        executed = self.completed + self.failed
+        return {
+            "serialize": self.serialize,
+            "running": bool(self._loop_task and not self._loop_task.done()),
+            "queued": self._queue.qsize() if self._queue else 0,
+            "max_queue": self.max_queue,
+            "max_batch": self.max_batch,
+            "submitted": self.submitted,
+            "completed": self.completed,
+            "failed": self.failed,
+            "batches": self.batches,
+            "batch_failures": self.batch_failures,
+            "avg_batch_size": round(executed / self.batches, 2) if self.batches else 0,
+            "max_batch_seen": self.max_batch_seen,
+            "avg_wait_ms": round(self.total_wait_ms / executed, 2) if executed else 0,
+            "max_wait_ms": round(self.max_wait_ms, 2),
+        }
+
+
+# 创建全局实例
+db_writer = DatabaseWriter(
+    WriteSessionLocal,
+    max_batch=settings.database_write_batch_size,
+    max_queue=settings.database_write_queue_size,
+    serialize=IS_SQLITE
+)
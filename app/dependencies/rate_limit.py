@@ -0,0 +1,147 @@
+"""
+限流依赖
+用于在公开接口访问数据库前拦截过于频繁的请求
+"""
+import ipaddress
+import logging
+import math
+from typing import Callable, List, Optional, Sequence, Union
+
+from fastapi import HTTPException, Request, status
+
+from app.config import settings
+from app.utils.rate_limiter import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+
+# 各公开接口的限流器 (按客户端 IP)
+redeem_verify_limiter = RateLimiter(capacity=30, period=60)
+redeem_confirm_limiter = RateLimiter(capacity=10, period=60)
+login_limiter = RateLimiter(capacity=5, period=60)
+
+# 按邮箱限制兑换提交频率
+redeem_email_limiter = RateLimiter(capacity=5, period=60)
+
+
+IPNetwork = Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
+
+
+def parse_trusted_proxies(value: str) -> List[IPNetwork]:
+    """
+    解析可信代理配置
+
+    Args:
+        value: 逗号分隔的 IP 或网段, 如 "127.0.0.1,172.16.0.0/12"
+
+    Returns:
+        网段列表 (无效项会被忽略并记录警告)
+    """
+    networks = []
+    for item in (value or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        try:
+            networks.append(ipaddress.ip_network(item, strict=False))
+        except ValueError:
+            logger.warning(f"忽略无效的可信代理配置: {item}")
+    return networks
+
+
+TRUSTED_PROXY_NETWORKS = parse_trusted_proxies(settings.trusted_proxies)
+
+
+def _parse_ip(value: str) -> Optional[str]:
+    try:
+        return str(ipaddress.ip_address(value.strip()))
+    except ValueError:
+        return None
+
+
+def _is_trusted(ip: str, networks: Sequence[IPNetwork]) -> bool:
+    address = ipaddress.ip_address(ip)
+    return any(address in network for network in networks)
+
+
+def get_client_ip(request: Request, trusted_networks: Optional[Sequence[IPNetwork]] = None) -> Optional[str]:
+    """
+    获取客户端 IP
+
+    直连地址是可信代理时, 从 X-Forwarded-For 由右向左跳过可信代理, 取第一个不可信的地址
+    (更靠左的部分可以被客户端伪造); 没有 X-Forwarded-For 时使用 X-Real-IP。
+    直连地址不是可信代理时忽略这些请求头, 防止客户端伪造 IP 绕过限流
+
+    Args:
+        request: FastAPI Request 对象
+        trusted_networks: 可信代理网段, 默认使用 TRUSTED_PROXIES 配置
+
+    Returns:
+        客户端 IP, 无法获取时返回 None
+    """
+    peer = request.client.host if request.client else None
+    if not peer:
+        return None
+
+    networks = TRUSTED_PROXY_NETWORKS if trusted_networks is None else trusted_networks
+    peer_ip = _parse_ip(peer)
+    if peer_ip is None or not _is_trusted(peer_ip, networks):
+        return peer
+
+    hops = [
+        hop.strip()
+        for value in request.headers.getlist("x-forwarded-for")
+        for hop in value.split(",")
+        if hop.strip()
+    ]
+    if hops:
+        for hop in reversed(hops):
+            hop_ip = _parse_ip(hop)
+            if hop_ip is None:
+                # 格式错误的地址无法判断来源, 回退到直连地址
+                return peer
+            if not _is_trusted(hop_ip, networks):
+                return hop_ip
+        return _parse_ip(hops[0])
+
+    real_ip = _parse_ip(request.headers.get("x-real-ip", ""))
+    return real_ip or peer
+
+
+def raise_rate_limited(retry_after: float, detail: str = "请求过于频繁，请稍后再试"):
+    """
+    抛出 429 限流异常
+
+    Args:
+        retry_after: 需要等待的秒数
+        detail: 错误信息
+    """
+    raise HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail=detail,
+        headers={"Retry-After": str(max(1, math.ceil(retry_after)))}
+    )
+
+
+def rate_limit_by_ip(limiter: RateLimiter, scope: str) -> Callable[[Request], None]:
+    """
+    创建按客户端 IP 限流的依赖
+
+    Args:
+        limiter: 限流器
+        scope: 限流范围名称 (用于日志)
+
+    Returns:
+        FastAPI 依赖函数
+    """
+    def dependency(request: Request) -> None:
+        client_ip = get_client_ip(request)
+        if not client_ip:
+            return
+
+        allowed, retry_after = limiter.hit(client_ip)
+        if not allowed:
+            logger.warning(f"{scope} 请求过于频繁: IP {client_ip}")
+            raise_rate_limited(retry_after)
+
+    return dependency
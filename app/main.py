@@ -16,8 +16,12 @@ from contextlib import asynccontextmanager
 from app.routes import redeem, auth, admin, api, user, warranty
 from app.config import settings
 from app.database import init_db, close_db, AsyncSessionLocal
+from app.db_writer import db_writer
 from app.services.auth import auth_service
+from app.services.code_filter import code_lookup_filter
 from app.tasks.cf_refresh import start_cf_refresh_task, stop_cf_refresh_task
+from app.tasks.invite_retry import start_invite_retry_task, stop_invite_retry_task
+from app.tasks.wal_checkpoint import start_wal_checkpoint_task, stop_wal_checkpoint_task
 
 # 获取项目根目录
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -33,23 +37,35 @@ async def lifespan(app: FastAPI):
     """
     logger.info("系统正在启动，正在初始化数据库...")
     try:
-        # 0. 确保数据库目录存在
-        db_file = settings.database_url.split("///")[-1]
-        Path(db_file).parent.mkdir(parents=True, exist_ok=True)
+        from app.db_migrations import get_db_path, run_migrations
+
+        # 0. 确保数据库目录存在 (仅 SQLite)
+        db_path = get_db_path()
+        if db_path is not None:
+            db_path.parent.mkdir(parents=True, exist_ok=True)
         
         # 1. 创建数据库表
         await init_db()
         
-        # 2. 运行自动数据库迁移
-        from app.db_migrations import run_auto_migration
-        run_auto_migration()
+        # 2. 运行数据库迁移 (结构已是最新时直接跳过)
+        await run_migrations()
         
         # 3. 初始化管理员密码（如果不存在）
         async with AsyncSessionLocal() as session:
             await auth_service.initialize_admin_password(session)
 
-        # 4. 启动 cf_clearance 自动刷新任务
+        # 4. 构建兑换码存在性过滤器
+        async with AsyncSessionLocal() as session:
+            await code_lookup_filter.rebuild(session)
+
+        # 5. 启动 cf_clearance 自动刷新任务
         await start_cf_refresh_task()
+
+        # 6. 启动邀请重试任务
+        await start_invite_retry_task()
+
+        # 7. 启动 WAL 检查点任务 (仅 SQLite)
+        await start_wal_checkpoint_task()
         logger.info("数据库初始化完成")
     except Exception as e:
         logger.error(f"数据库初始化失败: {e}")
@@ -57,7 +73,10 @@ async def lifespan(app: FastAPI):
     yield
     
     # 停止后台任务并关闭连接
+    await stop_invite_retry_task()
     await stop_cf_refresh_task()
+    await stop_wal_checkpoint_task()
+    await db_writer.stop()
     await close_db()
     logger.info("系统正在关闭，已释放数据库连接")
 
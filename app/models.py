@@ -40,6 +40,9 @@ class Team(Base):
     # 索引
     __table_args__ = (
         Index("idx_status", "status"),
+        # 选择可用 Team: status = 'active' 且未满, 按 (expires_at, id) 排序; 成员数列放进索引,
+        # 未满条件在索引上判断, 只回表读取命中的行
+        Index("idx_team_available", "status", "expires_at", "id", "current_members", "max_members"),
     )
 
 
@@ -85,6 +88,10 @@ class RedemptionCode(Base):
     # 索引
     __table_args__ = (
         Index("idx_code_status", "code", "status"),
+        # 兑换码列表按 (created_at, id) 游标分页
+        Index("idx_code_created_at", "created_at"),
+        # 按状态分组统计 (覆盖索引) 和按状态列出兑换码
+        Index("idx_code_status_created", "status", "created_at"),
     )
 
 
@@ -107,9 +114,52 @@ class RedemptionRecord(Base):
     # 索引
     __table_args__ = (
         Index("idx_email", "email"),
+        # 按规范化 (小写) 邮箱 + Team 的组合索引, 用于自动选择 Team 时排除已加入的 Team
+        Index("idx_email_lower_team", func.lower(email), team_id),
+        # 使用记录页按兑换时间排序和按日期范围筛选
+        Index("idx_redeemed_at", "redeemed_at"),
+        # 按兑换码 / Team 查记录并按兑换时间排序
+        Index("idx_record_code_redeemed", "code", "redeemed_at"),
+        Index("idx_record_team_redeemed", "team_id", "redeemed_at"),
     )
 
 
+class InviteRetryJob(Base):
+    """邀请重试队列表"""
+    __tablename__ = "invite_retry_queue"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    email = Column(String(255), nullable=False, comment="用户邮箱")
+    code = Column(String(32), ForeignKey("redemption_codes.code"), nullable=False, comment="兑换码")
+    team_id = Column(Integer, ForeignKey("teams.id"), nullable=False, comment="已占位的 Team ID")
+    account_id = Column(String(100), nullable=False, comment="Account ID")
+    is_warranty_redemption = Column(Boolean, default=False, comment="是否为质保兑换")
+    status = Column(String(20), default="pending", comment="状态: pending/done/failed")
+    attempts = Column(Integer, default=0, comment="已尝试次数")
+    next_attempt_at = Column(DateTime, default=get_now, comment="下次尝试时间")
+    last_error = Column(Text, comment="最近一次错误信息")
+    created_at = Column(DateTime, default=get_now, comment="创建时间")
+    updated_at = Column(DateTime, default=get_now, onupdate=get_now, comment="更新时间")
+
+    # 索引
+    __table_args__ = (
+        Index("idx_retry_status_next", "status", "next_attempt_at"),
+        # 自动选择 Team 时排除同一邮箱仍在排队邀请的 Team (席位已占用但尚未写入兑换记录)
+        Index("idx_retry_email_team", func.lower(email), team_id, status),
+    )
+
+
+class RedemptionLease(Base):
+    """兑换租约表 (跨 worker 串行化同一邮箱的兑换)"""
+    __tablename__ = "redemption_leases"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    email = Column(String(255), unique=True, nullable=False, comment="规范化 (小写) 邮箱")
+    owner = Column(String(64), nullable=False, comment="持有者标识")
+    expires_at = Column(DateTime, nullable=False, comment="租约到期时间")
+    created_at = Column(DateTime, default=get_now, comment="创建时间")
+
+
 class Setting(Base):
     """系统设置表"""
     __tablename__ = "settings"
@@ -120,8 +170,17 @@ class Setting(Base):
     description = Column(String(255), comment="配置项描述")
     created_at = Column(DateTime, default=get_now, comment="创建时间")
     updated_at = Column(DateTime, default=get_now, onupdate=get_now, comment="更新时间")
+    generation = Column(Integer, default=0, comment="最后一次写入时的设置代数")
 
     # 索引
     __table_args__ = (
         Index("idx_key", "key"),
     )
+
+
+class SettingsGeneration(Base):
+    """系统设置代数表 (单行计数器, 每次写入设置时在同一事务中递增)"""
+    __tablename__ = "settings_generation"
+
+    id = Column(Integer, primary_key=True)
+    generation = Column(Integer, nullable=False, default=0, comment="当前设置代数")
@@ -10,10 +10,11 @@ import json
 from sqlalchemy.ext.asyncio import AsyncSession
 from pydantic import BaseModel, Field
 
-from app.database import get_db
+from app.database import get_db, get_read_db
 from app.dependencies.auth import require_admin
 from app.services.team import TeamService
 from app.services.redemption import RedemptionService
+from app.services.stats import stats_service
 from app.services.system_settings import system_settings_service
 from app.utils.time_utils import get_now
 
@@ -88,10 +89,10 @@ class BulkCodeUpdateRequest(BaseModel):
 @router.get("/", response_class=HTMLResponse)
 async def admin_dashboard(
     request: Request,
-    page: int = 1,
+    cursor: Optional[str] = None,
     per_page: int = 20,
     search: Optional[str] = None,
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: dict = Depends(require_admin)
 ):
     """
@@ -103,27 +104,23 @@ async def admin_dashboard(
         # 获取当前主题
         current_theme = await system_settings_service.get_setting("theme", "default")
 
-        logger.info(f"管理员访问控制台, search={search}, page={page}, per_page={per_page}")
+        logger.info(f"管理员访问控制台, search={search}, per_page={per_page}")
 
         # 设置每页数量
         # per_page = 20 (Removed hardcoded value)
         
         # 获取 Team 列表 (分页)
-        teams_result = await team_service.get_all_teams(db, page=page, per_page=per_page, search=search)
-        
-        # 获取统计信息 (可以使用专用统计方法优化)
-        all_teams_result = await team_service.get_all_teams(db, page=1, per_page=10000)
-        all_teams = all_teams_result.get("teams", [])
+        teams_result = await team_service.get_all_teams(db, per_page=per_page, search=search, cursor=cursor)
         
-        all_codes_result = await redemption_service.get_all_codes(db, page=1, per_page=10000)
-        all_codes = all_codes_result.get("codes", [])
+        # 获取统计信息 (分组聚合查询, 带短时缓存)
+        team_stats = await stats_service.get_team_stats(db)
+        code_stats = await stats_service.get_code_stats(db)
 
-        # 计算统计数据
         stats = {
-            "total_teams": len(all_teams),
-            "available_teams": len([t for t in all_teams if t.get("status") == "active" and t.get("current_members", 0) < t.get("max_members", 6)]),
-            "total_codes": len(all_codes),
-            "used_codes": len([c for c in all_codes if c.get("status") == "used"])
+            "total_teams": team_stats["total"],
+            "available_teams": team_stats["available"],
+            "total_codes": code_stats["total"],
+            "used_codes": code_stats["used"]
         }
 
         return templates.TemplateResponse(
@@ -136,10 +133,13 @@ async def admin_dashboard(
                 "stats": stats,
                 "search": search,
                 "pagination": {
-                    "current_page": teams_result.get("current_page", page),
+                    "current_page": teams_result.get("current_page", 1),
                     "total_pages": teams_result.get("total_pages", 1),
                     "total": teams_result.get("total", 0),
-                    "per_page": per_page
+                    "per_page": per_page,
+                    "default_per_page": 20,
+                    "next_cursor": teams_result.get("next_cursor"),
+                    "prev_cursor": teams_result.get("prev_cursor")
                 },
                 "current_theme": current_theme
             }
@@ -518,10 +518,10 @@ async def revoke_team_invite(
 @router.get("/codes", response_class=HTMLResponse)
 async def codes_list_page(
     request: Request,
-    page: int = 1,
+    cursor: Optional[str] = None,
     per_page: int = 50,
     search: Optional[str] = None,
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: dict = Depends(require_admin)
 ):
     """
@@ -529,7 +529,7 @@ async def codes_list_page(
 
     Args:
         request: FastAPI Request 对象
-        page: 页码
+        cursor: 分页游标
         per_page: 每页数量
         search: 搜索关键词
         db: 数据库会话
@@ -548,23 +548,19 @@ async def codes_list_page(
 
         # 获取兑换码 (分页)
         # per_page = 50 (Removed hardcoded value)
-        codes_result = await redemption_service.get_all_codes(db, page=page, per_page=per_page, search=search)
+        codes_result = await redemption_service.get_all_codes(db, per_page=per_page, search=search, cursor=cursor)
         codes = codes_result.get("codes", [])
         total_codes = codes_result.get("total", 0)
         total_pages = codes_result.get("total_pages", 1)
         current_page = codes_result.get("current_page", 1)
 
-        # 为了统计数据，我们需要获取所有统计（或者增加统计接口）
-        # 这里暂时获取全部用于统计
-        all_codes_result = await redemption_service.get_all_codes(db, page=1, per_page=10000)
-        all_codes = all_codes_result.get("codes", [])
-
-        # 计算统计数据
+        # 计算统计数据 (分组聚合查询, 带短时缓存)
+        code_stats = await stats_service.get_code_stats(db)
         stats = {
             "total": total_codes,
-            "unused": len([c for c in all_codes if c["status"] == "unused"]),
-            "used": len([c for c in all_codes if c["status"] == "used"]),
-            "expired": len([c for c in all_codes if c["status"] == "expired"])
+            "unused": code_stats["unused"],
+            "used": code_stats["used"],
+            "expired": code_stats["expired"]
         }
 
         # 格式化日期时间
@@ -593,7 +589,10 @@ async def codes_list_page(
                     "current_page": current_page,
                     "total_pages": total_pages,
                     "total": total_codes,
-                    "per_page": per_page
+                    "per_page": per_page,
+                    "default_per_page": 50,
+                    "next_cursor": codes_result.get("next_cursor"),
+                    "prev_cursor": codes_result.get("prev_cursor")
                 },
                 "current_theme": current_theme
             }
@@ -659,7 +658,6 @@ async def generate_codes(
                 )
 
             result = await redemption_service.generate_code_batch(
-                db_session=db,
                 count=generate_data.count,
                 expires_days=generate_data.expires_days,
                 has_warranty=generate_data.has_warranty,
@@ -735,105 +733,171 @@ async def delete_code(
         )
 
 
+EXPORT_CODE_HEADERS = ['兑换码', '状态', '创建时间', '过期时间', '使用者邮箱', '使用时间', '质保时长(天)']
+EXPORT_CODE_STATUS_TEXT = {
+    'unused': '未使用',
+    'used': '已使用',
+    'expired': '已过期'
+}
+
+
+def _export_code_row(code) -> list:
+    """将兑换码行转换为导出列"""
+    return [
+        code.code,
+        EXPORT_CODE_STATUS_TEXT.get(code.status, code.status),
+        code.created_at.isoformat() if code.created_at else '-',
+        code.expires_at.isoformat() if code.expires_at else '永久有效',
+        code.used_by_email or '-',
+        code.used_at.isoformat() if code.used_at else '-',
+        code.warranty_days if code.has_warranty else '-'
+    ]
+
+
 @router.get("/codes/export")
 async def export_codes(
     search: Optional[str] = None,
-    db: AsyncSession = Depends(get_db),
+    format: str = "xlsx",
+    batch: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_db),
     current_user: dict = Depends(require_admin)
 ):
     """
-    导出兑换码为Excel文件
+    导出兑换码为 Excel 或 CSV 文件
+
+    数据按块从数据库游标读取, CSV 边读边输出; Excel 以 constant_memory 模式
+    写入临时文件后再发送, 内存占用与兑换码总数无关
 
     Args:
         search: 搜索关键词
+        format: 导出格式 xlsx 或 csv
+        batch: 批次创建时间 (批量生成结果中的 batch_created_at), 只导出该批次的兑换码
         db: 数据库会话
         current_user: 当前用户（需要登录）
 
     Returns:
-        兑换码Excel文件
+        兑换码导出文件
     """
-    try:
-        from fastapi.responses import Response
+    if format not in ("xlsx", "csv"):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="导出格式必须为 xlsx 或 csv"
+        )
+
+    batch_created_at = None
+    if batch:
         from datetime import datetime
+
+        try:
+            batch_created_at = datetime.fromisoformat(batch)
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="批次参数格式错误"
+            )
+
+    filename = f"redemption_codes_{get_now().strftime('%Y%m%d_%H%M%S')}.{format}"
+    headers = {"Content-Disposition": f"attachment; filename={filename}"}
+
+    if format == "csv":
+        import csv
+        from io import StringIO
+
+        logger.info("管理员导出兑换码为CSV")
+
+        async def csv_generator():
+            buffer = StringIO()
+            writer = csv.writer(buffer)
+            # 带 BOM, 便于 Excel 直接识别 UTF-8
+            buffer.write('\ufeff')
+            writer.writerow(EXPORT_CODE_HEADERS)
+            async for rows in redemption_service.iter_codes_for_export(
+                db, search=search, created_at=batch_created_at
+            ):
+                writer.writerows(_export_code_row(code) for code in rows)
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+            if buffer.tell():
+                yield buffer.getvalue()
+
+        return StreamingResponse(
+            csv_generator(),
+            media_type="text/csv; charset=utf-8",
+            headers=headers
+        )
+
+    try:
+        import asyncio
+        import os
+        import tempfile
         import xlsxwriter
-        from io import BytesIO
+        from fastapi.responses import FileResponse
+        from starlette.background import BackgroundTask
 
         logger.info("管理员导出兑换码为Excel")
 
-        # 获取所有兑换码 (导出不分页，传入大数量)
-        codes_result = await redemption_service.get_all_codes(db, page=1, per_page=100000, search=search)
-        all_codes = codes_result.get("codes", [])
-        
-        # 结果可能带统计信息，我们只取 codes
-
-        # 创建Excel文件到内存
-        output = BytesIO()
-        workbook = xlsxwriter.Workbook(output, {'in_memory': True})
-        worksheet = workbook.add_worksheet('兑换码列表')
-
-        # 定义格式
-        header_format = workbook.add_format({
-            'bold': True,
-            'fg_color': '#4F46E5',
-            'font_color': 'white',
-            'align': 'center',
-            'valign': 'vcenter',
-            'border': 1
-        })
-
-        cell_format = workbook.add_format({
-            'align': 'left',
-            'valign': 'vcenter',
-            'border': 1
-        })
-
-        # 设置列宽
-        worksheet.set_column('A:A', 25)  # 兑换码
-        worksheet.set_column('B:B', 12)  # 状态
-        worksheet.set_column('C:C', 18)  # 创建时间
-        worksheet.set_column('D:D', 18)  # 过期时间
-        worksheet.set_column('E:E', 30)  # 使用者邮箱
-        worksheet.set_column('F:F', 18)  # 使用时间
-        worksheet.set_column('G:G', 12)  # 质保时长
-
-        # 写入表头
-        headers = ['兑换码', '状态', '创建时间', '过期时间', '使用者邮箱', '使用时间', '质保时长(天)']
-        for col, header in enumerate(headers):
-            worksheet.write(0, col, header, header_format)
-
-        # 写入数据
-        for row, code in enumerate(all_codes, start=1):
-            status_text = {
-                'unused': '未使用',
-                'used': '已使用',
-                'expired': '已过期'
-            }.get(code['status'], code['status'])
-
-            worksheet.write(row, 0, code['code'], cell_format)
-            worksheet.write(row, 1, status_text, cell_format)
-            worksheet.write(row, 2, code.get('created_at', '-'), cell_format)
-            worksheet.write(row, 3, code.get('expires_at', '永久有效'), cell_format)
-            worksheet.write(row, 4, code.get('used_by_email', '-'), cell_format)
-            worksheet.write(row, 5, code.get('used_at', '-'), cell_format)
-            worksheet.write(row, 6, code.get('warranty_days', '-') if code.get('has_warranty') else '-', cell_format)
-
-        # 关闭workbook
-        workbook.close()
-
-        # 获取Excel数据
-        excel_data = output.getvalue()
-        output.close()
-
-        # 生成文件名
-        filename = f"redemption_codes_{get_now().strftime('%Y%m%d_%H%M%S')}.xlsx"
-
-        # 返回Excel文件
-        return Response(
-            content=excel_data,
+        fd, path = tempfile.mkstemp(prefix="redemption_codes_", suffix=".xlsx")
+        os.close(fd)
+
+        try:
+            # constant_memory 模式下每写完一行即刷到临时文件
+            workbook = xlsxwriter.Workbook(path, {'constant_memory': True})
+            worksheet = workbook.add_worksheet('兑换码列表')
+
+            # 定义格式
+            header_format = workbook.add_format({
+                'bold': True,
+                'fg_color': '#4F46E5',
+                'font_color': 'white',
+                'align': 'center',
+                'valign': 'vcenter',
+                'border': 1
+            })
+
+            cell_format = workbook.add_format({
+                'align': 'left',
+                'valign': 'vcenter',
+                'border': 1
+            })
+
+            # 设置列宽
+            worksheet.set_column('A:A', 25)  # 兑换码
+            worksheet.set_column('B:B', 12)  # 状态
+            worksheet.set_column('C:C', 18)  # 创建时间
+            worksheet.set_column('D:D', 18)  # 过期时间
+            worksheet.set_column('E:E', 30)  # 使用者邮箱
+            worksheet.set_column('F:F', 18)  # 使用时间
+            worksheet.set_column('G:G', 12)  # 质保时长
+
+            # 写入表头
+            worksheet.write_row(0, 0, EXPORT_CODE_HEADERS, header_format)
+
+            def write_rows(rows, start_row: int):
+                for offset, code in enumerate(rows):
+                    worksheet.write_row(start_row + offset, 0, _export_code_row(code), cell_format)
+
+            # 写入数据 (写文件和压缩放到线程中, 不阻塞事件循环)
+            next_row = 1
+            async for rows in redemption_service.iter_codes_for_export(
+                db, search=search, created_at=batch_created_at
+            ):
+                await asyncio.to_thread(write_rows, rows, next_row)
+                next_row += len(rows)
+
+            await asyncio.to_thread(workbook.close)
+        except Exception:
+            os.unlink(path)
+            raise
+
+        logger.info(f"导出兑换码完成: {next_row - 1} 个")
+
+        # 发送完成后删除临时文件
+        return FileResponse(
+            path,
             media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-            headers={
-                "Content-Disposition": f"attachment; filename={filename}"
-            }
+            headers=headers,
+            background=BackgroundTask(os.unlink, path)
         )
 
     except Exception as e:
@@ -908,7 +972,7 @@ async def records_page(
     end_date: Optional[str] = None,
     page: Optional[str] = "1",
     per_page: int = 20,
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: dict = Depends(require_admin)
 ):
     """
@@ -931,9 +995,8 @@ async def records_page(
     """
     try:
         from app.main import templates
-        from datetime import datetime, timedelta
-        import math
-        
+        from datetime import datetime
+
         # 获取当前主题
         current_theme = await system_settings_service.get_setting("theme", "default")
 
@@ -950,94 +1013,37 @@ async def records_page(
             
         logger.info(f"管理员访问使用记录页面 (page={page_int}, per_page={per_page})")
 
-        # 获取记录 (支持邮箱、兑换码、Team ID 筛选)
-        records_result = await redemption_service.get_all_records(
-            db, 
-            email=email, 
-            code=code, 
-            team_id=actual_team_id
-        )
-        all_records = records_result.get("records", [])
-
-        # 仅由于日期范围筛选目前还在内存中处理，如果未来记录数极大可以移至数据库
-        filtered_records = []
-        for record in all_records:
-            # 日期范围筛选
-            if start_date or end_date:
-                try:
-                    record_date = datetime.fromisoformat(record["redeemed_at"]).date()
-
-                    if start_date:
-                        start = datetime.strptime(start_date, "%Y-%m-%d").date()
-                        if record_date < start:
-                            continue
-
-                    if end_date:
-                        end = datetime.strptime(end_date, "%Y-%m-%d").date()
-                        if record_date > end:
-                            continue
-                except:
-                    pass
-
-            filtered_records.append(record)
-
-        # 获取Team信息并关联到记录
-        teams_result = await team_service.get_all_teams(db)
-        teams = teams_result.get("teams", [])
-        team_map = {team["id"]: team for team in teams}
-
-        # 为记录添加Team名称
-        for record in filtered_records:
-            team = team_map.get(record["team_id"])
-            record["team_name"] = team["team_name"] if team else None
-
-        # 计算统计数据
-        now = get_now()
-        today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
-        week_start = today_start - timedelta(days=today_start.weekday())
-        month_start = today_start.replace(day=1)
-
-        stats = {
-            "total": len(filtered_records),
-            "today": 0,
-            "this_week": 0,
-            "this_month": 0
-        }
-
-        for record in filtered_records:
+        # 解析日期范围, 格式无效时忽略该条件
+        def parse_date(value: Optional[str]):
             try:
-                record_time = datetime.fromisoformat(record["redeemed_at"])
-                if record_time >= today_start:
-                    stats["today"] += 1
-                if record_time >= week_start:
-                    stats["this_week"] += 1
-                if record_time >= month_start:
-                    stats["this_month"] += 1
-            except:
-                pass
-
-        # 分页
-        # per_page = 20 (Removed hardcoded value)
-        total_records = len(filtered_records)
-        total_pages = math.ceil(total_records / per_page) if total_records > 0 else 1
+                return datetime.strptime(value, "%Y-%m-%d").date() if value else None
+            except ValueError:
+                return None
 
-        # 确保页码有效
-        if page_int < 1:
-            page_int = 1
-        if page_int > total_pages:
-            page_int = total_pages
+        # 筛选、统计和分页都在数据库中完成, 只加载当前页的记录
+        records_result = await redemption_service.get_records_page(
+            db,
+            email=email,
+            code=code,
+            team_id=actual_team_id,
+            start_date=parse_date(start_date),
+            end_date=parse_date(end_date),
+            page=page_int,
+            per_page=per_page
+        )
+        if not records_result["success"]:
+            raise Exception(records_result["error"])
 
-        start_idx = (page_int - 1) * per_page
-        end_idx = start_idx + per_page
-        paginated_records = filtered_records[start_idx:end_idx]
+        paginated_records = records_result["records"]
+        stats = records_result["stats"]
+        page_int = records_result["current_page"]
+        total_pages = records_result["total_pages"]
+        total_records = records_result["total"]
 
         # 格式化时间
         for record in paginated_records:
-            try:
-                dt = datetime.fromisoformat(record["redeemed_at"])
-                record["redeemed_at"] = dt.strftime("%Y-%m-%d %H:%M:%S")
-            except:
-                pass
+            if record["redeemed_at"]:
+                record["redeemed_at"] = datetime.fromisoformat(record["redeemed_at"]).strftime("%Y-%m-%d %H:%M:%S")
 
         return templates.TemplateResponse(
             "admin/records/index.html",
@@ -1132,6 +1138,7 @@ async def settings_page(
     try:
         from app.main import templates
         from app.services.settings import settings_service
+        from app.services.team_placement import PLACEMENT_STRATEGIES
 
         logger.info("管理员访问系统设置页面")
 
@@ -1141,6 +1148,7 @@ async def settings_page(
         # 获取当前配置
         proxy_config = await settings_service.get_proxy_config(db)
         log_level = await settings_service.get_log_level(db)
+        placement_strategy = await settings_service.get_team_placement_strategy(db)
 
         return templates.TemplateResponse(
             "admin/settings/index.html",
@@ -1151,6 +1159,11 @@ async def settings_page(
                 "proxy_enabled": proxy_config["enabled"],
                 "proxy": proxy_config["proxy"],
                 "log_level": log_level,
+                "placement_strategy": placement_strategy,
+                "placement_strategies": [
+                    {"name": strategy.name, "label": strategy.label}
+                    for strategy in PLACEMENT_STRATEGIES.values()
+                ],
                 "current_theme": current_theme
             }
         )
@@ -1227,6 +1240,11 @@ class LogLevelRequest(BaseModel):
     level: str = Field(..., description="日志级别")
 
 
+class PlacementStrategyRequest(BaseModel):
+    """Team 分配策略请求"""
+    strategy: str = Field(..., description="分配策略名称")
+
+
 @router.post("/settings/proxy")
 async def update_proxy_config(
     proxy_data: ProxyConfigRequest,
@@ -1329,6 +1347,46 @@ async def update_log_level(
         )
 
 
+@router.post("/settings/placement-strategy")
+async def update_placement_strategy(
+    strategy_data: PlacementStrategyRequest,
+    db: AsyncSession = Depends(get_db),
+    current_user: dict = Depends(require_admin)
+):
+    """
+    更新自动分配 Team 的策略
+
+    Args:
+        strategy_data: 分配策略数据
+        db: 数据库会话
+        current_user: 当前用户（需要登录）
+
+    Returns:
+        更新结果
+    """
+    try:
+        from app.services.settings import settings_service
+
+        logger.info(f"管理员更新 Team 分配策略: {strategy_data.strategy}")
+
+        success = await settings_service.update_team_placement_strategy(db, strategy_data.strategy)
+
+        if success:
+            return JSONResponse(content={"success": True, "message": "分配策略已保存"})
+        else:
+            return JSONResponse(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                content={"success": False, "error": "无效的分配策略"}
+            )
+
+    except Exception as e:
+        logger.error(f"更新 Team 分配策略失败: {e}")
+        return JSONResponse(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            content={"success": False, "error": f"更新失败: {str(e)}"}
+        )
+
+
 @router.post("/settings/theme")
 async def update_theme(
     request: Request,
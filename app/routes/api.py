@@ -327,3 +327,51 @@ async def solve_cf_clearance(
                 "manual_guide_message": f"请按 {manual_guide} 手动处理",
             }
         )
+
+
+@router.get("/upstream/stats")
+async def get_upstream_stats(
+    current_user: dict = Depends(require_admin)
+):
+    """
+    获取上游请求统计 (各优先级进行中、等待中的请求数, 对冲次数与对冲胜出次数)
+    """
+    from app.services.chatgpt import chatgpt_service
+    from app.services.upstream_scheduler import upstream_scheduler
+
+    return JSONResponse(
+        content={
+            "success": True,
+            "max_concurrency": upstream_scheduler.max_concurrency,
+            "scheduler": upstream_scheduler.get_stats(),
+            "hedging": chatgpt_service.hedger.get_stats(),
+        }
+    )
+
+
+@router.get("/database/stats")
+async def get_database_stats(
+    current_user: dict = Depends(require_admin)
+):
+    """
+    获取数据库类型、连接池、连接配置 (SQLite PRAGMA)、写入队列和 WAL 检查点统计
+    """
+    from app.database import DATABASE_BACKEND, IS_SQLITE, engine, read_engine, write_engine
+    from app.db_profile import sqlite_profile
+    from app.db_writer import db_writer
+    from app.services.wal_checkpoint import wal_checkpoint_service
+
+    return JSONResponse(
+        content={
+            "success": True,
+            "backend": DATABASE_BACKEND,
+            "pools": {
+                "default": engine.pool.status(),
+                "read": read_engine.pool.status(),
+                "write": write_engine.pool.status(),
+            },
+            "pragmas": sqlite_profile.as_dict() if IS_SQLITE else None,
+            "writer": db_writer.get_stats(),
+            "wal_checkpoint": wal_checkpoint_service.get_stats() if IS_SQLITE else None,
+        }
+    )
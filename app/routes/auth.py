@@ -12,6 +12,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from app.database import get_db
 from app.services.auth import auth_service
 from app.dependencies.auth import get_current_user
+from app.dependencies.rate_limit import login_limiter, rate_limit_by_ip
 
 logger = logging.getLogger(__name__)
 
@@ -55,7 +56,11 @@ class ChangePasswordResponse(BaseModel):
     error: Optional[str] = None
 
 
-@router.post("/login", response_model=LoginResponse)
+@router.post(
+    "/login",
+    response_model=LoginResponse,
+    dependencies=[Depends(rate_limit_by_ip(login_limiter, "管理员登录"))]
+)
 async def login(
     request: Request,
     login_data: LoginRequest,
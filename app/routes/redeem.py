@@ -3,13 +3,23 @@
 处理用户兑换码验证和加入 Team 的请求
 """
 import logging
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from pydantic import BaseModel, EmailStr, Field
 from typing import Optional, List, Dict, Any
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.database import get_db
+from app.database import get_db, get_read_db
 from app.services.redeem_flow import redeem_flow_service
+from app.services.invite_retry import invite_retry_service
+from app.services.code_filter import invalid_code_tracker
+from app.dependencies.rate_limit import (
+    get_client_ip,
+    raise_rate_limited,
+    rate_limit_by_ip,
+    redeem_confirm_limiter,
+    redeem_email_limiter,
+    redeem_verify_limiter,
+)
 
 logger = logging.getLogger(__name__)
 
@@ -33,6 +43,12 @@ class RedeemRequest(BaseModel):
     team_id: Optional[int] = Field(None, description="Team ID (可选，不提供则自动选择)")
 
 
+class InviteStatusRequest(BaseModel):
+    """排队邀请状态查询请求"""
+    email: EmailStr = Field(..., description="用户邮箱")
+    code: str = Field(..., description="兑换码", min_length=1)
+
+
 # 响应模型
 class TeamInfo(BaseModel):
     """Team 信息"""
@@ -56,14 +72,47 @@ class VerifyCodeResponse(BaseModel):
 class RedeemResponse(BaseModel):
     """兑换响应"""
     success: bool
+    pending: bool = False
     message: Optional[str] = None
     team_info: Optional[Dict[str, Any]] = None
     error: Optional[str] = None
 
 
-@router.post("/verify", response_model=VerifyCodeResponse)
+class InviteStatusResponse(BaseModel):
+    """排队邀请状态响应"""
+    success: bool
+    found: bool = False
+    status: Optional[str] = None
+    attempts: int = 0
+    message: Optional[str] = None
+    error: Optional[str] = None
+
+
+def _check_invalid_code_shedding(http_request: Request) -> str:
+    """
+    检查客户端是否因频繁尝试无效兑换码而被拒绝
+
+    Returns:
+        客户端 IP
+    """
+    client_ip = get_client_ip(http_request)
+    if invalid_code_tracker.is_blocked(client_ip):
+        logger.warning(f"IP {client_ip} 无效兑换码尝试过多，拒绝请求")
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="无效兑换码尝试次数过多，请稍后再试"
+        )
+    return client_ip
+
+
+@router.post(
+    "/verify",
+    response_model=VerifyCodeResponse,
+    dependencies=[Depends(rate_limit_by_ip(redeem_verify_limiter, "验证兑换码"))]
+)
 async def verify_code(
     request: VerifyCodeRequest,
+    http_request: Request,
     db: AsyncSession = Depends(get_db)
 ):
     """
@@ -71,12 +120,14 @@ async def verify_code(
 
     Args:
         request: 验证请求
+        http_request: FastAPI Request 对象
         db: 数据库会话
 
     Returns:
         验证结果和可用 Team 列表
     """
     try:
+        client_ip = _check_invalid_code_shedding(http_request)
         logger.info(f"验证兑换码请求: {request.code}")
 
         result = await redeem_flow_service.verify_code_and_get_teams(
@@ -90,6 +141,9 @@ async def verify_code(
                 detail=result["error"]
             )
 
+        if not result.get("valid") and result.get("reason") == "兑换码不存在":
+            invalid_code_tracker.record_miss(client_ip)
+
         return VerifyCodeResponse(
             success=result.get("success", False),
             valid=result.get("valid", False),
@@ -108,9 +162,14 @@ async def verify_code(
         )
 
 
-@router.post("/confirm", response_model=RedeemResponse)
+@router.post(
+    "/confirm",
+    response_model=RedeemResponse,
+    dependencies=[Depends(rate_limit_by_ip(redeem_confirm_limiter, "兑换"))]
+)
 async def confirm_redeem(
     request: RedeemRequest,
+    http_request: Request,
     db: AsyncSession = Depends(get_db)
 ):
     """
@@ -118,12 +177,19 @@ async def confirm_redeem(
 
     Args:
         request: 兑换请求
+        http_request: FastAPI Request 对象
         db: 数据库会话
 
     Returns:
         兑换结果
     """
     try:
+        client_ip = _check_invalid_code_shedding(http_request)
+
+        allowed, retry_after = redeem_email_limiter.hit(request.email.lower())
+        if not allowed:
+            raise_rate_limited(retry_after, "该邮箱兑换请求过于频繁，请稍后再试")
+
         logger.info(f"兑换请求: {request.email} -> Team {request.team_id} (兑换码: {request.code})")
 
         result = await redeem_flow_service.redeem_and_join_team(
@@ -136,6 +202,8 @@ async def confirm_redeem(
         if not result["success"]:
             # 根据错误类型返回不同的状态码
             error_msg = result["error"]
+            if error_msg == "兑换码不存在":
+                invalid_code_tracker.record_miss(client_ip)
             if any(kw in error_msg for kw in ["不存在", "已使用", "已过期", "截止时间", "已满", "席位", "质保", "无效", "失效", "maximum number of seats"]):
                 status_code = status.HTTP_400_BAD_REQUEST
                 if any(kw in error_msg for kw in ["已满", "席位", "maximum number of seats"]):
@@ -153,6 +221,7 @@ async def confirm_redeem(
 
         return RedeemResponse(
             success=result.get("success", False),
+            pending=result.get("pending", False),
             message=result.get("message"),
             team_info=result.get("team_info"),
             error=result.get("error")
@@ -166,3 +235,33 @@ async def confirm_redeem(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"兑换失败: {str(e)}"
         )
+
+
+@router.post(
+    "/status",
+    response_model=InviteStatusResponse,
+    dependencies=[Depends(rate_limit_by_ip(redeem_verify_limiter, "查询邀请状态"))]
+)
+async def invite_status(
+    request: InviteStatusRequest,
+    db: AsyncSession = Depends(get_read_db)
+):
+    """
+    查询排队重试的邀请状态 (pending/done/failed)
+
+    Args:
+        request: 查询请求
+        db: 数据库会话
+
+    Returns:
+        邀请状态
+    """
+    result = await invite_retry_service.get_job_status(db, request.email, request.code)
+
+    if not result["success"]:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=result["error"]
+        )
+
+    return InviteStatusResponse(**result)
@@ -7,6 +7,9 @@ import logging
 from typing import Optional, Dict, Any, List
 from curl_cffi.requests import AsyncSession
 from app.services.settings import settings_service
+from app.config import settings
+from app.services.upstream_scheduler import upstream_scheduler
+from app.utils.hedging import RequestHedger
 from sqlalchemy.ext.asyncio import AsyncSession as DBAsyncSession
 
 logger = logging.getLogger(__name__)
@@ -34,6 +37,11 @@ class ChatGPTService:
         """初始化 ChatGPT API 服务"""
         self.session: Optional[AsyncSession] = None
         self.proxy: Optional[str] = None
+        # 幂等 GET 请求的对冲执行器 (慢于 p95 时发送副本)
+        self.hedger = RequestHedger(
+            enabled=settings.upstream_hedging_enabled,
+            budget_ratio=settings.upstream_hedge_budget
+        )
 
     @staticmethod
     def _is_cloudflare_challenge(response_text: str) -> bool:
@@ -104,13 +112,34 @@ class ChatGPTService:
         logger.info(f"创建 HTTP 会话,代理: {proxy if proxy else '未使用'}")
         return session
 
+    async def _send(self, method: str, url: str, **kwargs):
+        """按当前优先级占用上游并发名额后发送一次请求"""
+        async with upstream_scheduler.slot():
+            if method == "GET":
+                return await self.session.get(url, **kwargs)
+            elif method == "POST":
+                return await self.session.post(url, **kwargs)
+            elif method == "DELETE":
+                return await self.session.delete(url, **kwargs)
+            raise ValueError(f"不支持的 HTTP 方法: {method}")
+
+    async def _send_hedged(self, hedge_key: str, url: str, **kwargs):
+        """发送可对冲的 GET 请求, 5xx 响应不直接采用"""
+        return await self.hedger.run(
+            hedge_key,
+            lambda: self._send("GET", url, **kwargs),
+            is_final=lambda response: response.status_code < 500
+        )
+
     async def _make_request(
         self,
         method: str,
         url: str,
         headers: Dict[str, str],
         json_data: Optional[Dict[str, Any]] = None,
-        db_session: Optional[DBAsyncSession] = None
+        db_session: Optional[DBAsyncSession] = None,
+        max_retries: Optional[int] = None,
+        hedge_key: Optional[str] = None
     ) -> Dict[str, Any]:
         """
         发送 HTTP 请求 (带重试机制)
@@ -121,6 +150,8 @@ class ChatGPTService:
             headers: 请求头
             json_data: JSON 请求体
             db_session: 数据库会话
+            max_retries: 最大尝试次数, 默认使用 MAX_RETRIES
+            hedge_key: 对冲统计名称, 仅对 GET 生效, 为空则不对冲
 
         Returns:
             响应数据字典,包含 success, status_code, data, error
@@ -129,20 +160,20 @@ class ChatGPTService:
         if not self.session:
             self.session = await self._create_session(db_session)
 
+        max_retries = max(1, max_retries or self.MAX_RETRIES)
+
         # 重试循环
-        for attempt in range(self.MAX_RETRIES):
+        for attempt in range(max_retries):
             try:
-                logger.info(f"发送请求: {method} {url} (尝试 {attempt + 1}/{self.MAX_RETRIES})")
-
-                # 发送请求
-                if method == "GET":
-                    response = await self.session.get(url, headers=headers)
-                elif method == "POST":
-                    response = await self.session.post(url, headers=headers, json=json_data)
-                elif method == "DELETE":
-                    response = await self.session.delete(url, headers=headers, json=json_data)
+                logger.info(f"发送请求: {method} {url} (尝试 {attempt + 1}/{max_retries})")
+
+                # 发送请求 (按当前优先级占用上游并发名额, 重试等待期间不占用)
+                if method == "GET" and hedge_key:
+                    response = await self._send_hedged(hedge_key, url, headers=headers)
+                elif method == "GET":
+                    response = await self._send("GET", url, headers=headers)
                 else:
-                    raise ValueError(f"不支持的 HTTP 方法: {method}")
+                    response = await self._send(method, url, headers=headers, json=json_data)
 
                 status_code = response.status_code
                 logger.info(f"响应状态码: {status_code}")
@@ -204,7 +235,7 @@ class ChatGPTService:
                     logger.warning(f"服务器错误 {status_code},准备重试")
 
                     # 如果不是最后一次尝试,等待后重试
-                    if attempt < self.MAX_RETRIES - 1:
+                    if attempt < max_retries - 1:
                         delay = self.RETRY_DELAYS[attempt]
                         logger.info(f"等待 {delay}s 后重试")
                         await asyncio.sleep(delay)
@@ -215,14 +246,14 @@ class ChatGPTService:
                         "success": False,
                         "status_code": status_code,
                         "data": None,
-                        "error": f"服务器错误 {status_code},已重试 {self.MAX_RETRIES} 次"
+                        "error": f"服务器错误 {status_code},已重试 {max_retries} 次"
                     }
 
             except asyncio.TimeoutError:
-                logger.warning(f"请求超时 (尝试 {attempt + 1}/{self.MAX_RETRIES})")
+                logger.warning(f"请求超时 (尝试 {attempt + 1}/{max_retries})")
 
                 # 如果不是最后一次尝试,等待后重试
-                if attempt < self.MAX_RETRIES - 1:
+                if attempt < max_retries - 1:
                     delay = self.RETRY_DELAYS[attempt]
                     logger.info(f"等待 {delay}s 后重试")
                     await asyncio.sleep(delay)
@@ -233,14 +264,14 @@ class ChatGPTService:
                     "success": False,
                     "status_code": 0,
                     "data": None,
-                    "error": f"请求超时,已重试 {self.MAX_RETRIES} 次"
+                    "error": f"请求超时,已重试 {max_retries} 次"
                 }
 
             except Exception as e:
                 logger.error(f"请求异常: {e}")
 
                 # 如果不是最后一次尝试,等待后重试
-                if attempt < self.MAX_RETRIES - 1:
+                if attempt < max_retries - 1:
                     delay = self.RETRY_DELAYS[attempt]
                     logger.info(f"等待 {delay}s 后重试")
                     await asyncio.sleep(delay)
@@ -267,7 +298,8 @@ class ChatGPTService:
         access_token: str,
         account_id: str,
         email: str,
-        db_session: DBAsyncSession
+        db_session: DBAsyncSession,
+        max_retries: Optional[int] = None
     ) -> Dict[str, Any]:
         """
         发送 Team 邀请
@@ -277,6 +309,7 @@ class ChatGPTService:
             account_id: Account ID
             email: 邀请的邮箱地址
             db_session: 数据库会话
+            max_retries: 最大尝试次数, 默认使用 MAX_RETRIES
 
         Returns:
             结果字典,包含 success, status_code, error
@@ -297,7 +330,7 @@ class ChatGPTService:
 
         logger.info(f"发送邀请: {email} -> Team {account_id}")
 
-        result = await self._make_request("POST", url, headers, json_data, db_session)
+        result = await self._make_request("POST", url, headers, json_data, db_session, max_retries=max_retries)
 
         # 特殊处理 409 (用户已是成员)
         if result["status_code"] == 409:
@@ -520,7 +553,7 @@ class ChatGPTService:
 
         logger.info("获取 account-id 和订阅信息")
 
-        result = await self._make_request("GET", url, headers, db_session=db_session)
+        result = await self._make_request("GET", url, headers, db_session=db_session, hedge_key="account_info")
 
         if not result["success"]:
             return {
@@ -592,7 +625,7 @@ class ChatGPTService:
             self.session = await self._create_session(db_session)
             
         try:
-            response = await self.session.get(url, headers=headers, cookies=cookies)
+            response = await self._send_hedged("auth_session", url, headers=headers, cookies=cookies)
             status_code = response.status_code
 
             if status_code == 403 and self._is_cloudflare_challenge(response.text):
@@ -676,7 +709,7 @@ class ChatGPTService:
             self.session = await self._create_session(db_session)
             
         try:
-            response = await self.session.post(url, headers=headers, json=json_data)
+            response = await self._send("POST", url, headers=headers, json=json_data)
             status_code = response.status_code
             if status_code == 200:
                 data = response.json()
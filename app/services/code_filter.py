@@ -0,0 +1,226 @@
+"""
+兑换码存在性过滤服务
+使用布隆过滤器在访问数据库前拒绝一定不存在的兑换码, 并按 IP 统计无效兑换码尝试
+"""
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Iterable, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import RedemptionCode
+from app.utils.bloom import BloomFilter
+from app.utils.rate_limiter import RateLimiter
+
+logger = logging.getLogger(__name__)
+
+
+class CodeLookupFilter:
+    """
+    兑换码负向查找过滤器
+
+    启动时根据数据库中的全部兑换码构建布隆过滤器, 生成兑换码时增量添加,
+    删除兑换码时累计失效数量, 超过阈值后整体重建。
+    其他 worker 新生成的兑换码通过按 id 增量同步获取 (节流执行);
+    过滤器未命中时在拒绝前按兑换码精确查询一次, 不会把其他 worker 刚生成的兑换码判为不存在。
+    """
+
+    MIN_CAPACITY = 10000
+    ERROR_RATE = 0.001
+    # 布隆过滤器未命中时, 距离上次增量同步超过该时间才会按 id 增量同步
+    SYNC_INTERVAL_SECONDS = 2.0
+    # SQLite 删除最大 id 后可能复用该 id, 增量同步时向前多取一段
+    SYNC_ID_OVERLAP = 100
+    # 已删除兑换码占比超过该值时重建过滤器
+    REBUILD_STALE_RATIO = 0.2
+
+    def __init__(self):
+        self._bloom: Optional[BloomFilter] = None
+        self._max_id = 0
+        self._stale_count = 0
+        self._last_sync = 0.0
+        self._lock = asyncio.Lock()
+        self.rejected_count = 0
+
+    @property
+    def ready(self) -> bool:
+        """过滤器是否已构建"""
+        return self._bloom is not None
+
+    async def rebuild(self, db_session: AsyncSession):
+        """
+        从数据库重建过滤器
+
+        Args:
+            db_session: 数据库会话
+        """
+        async with self._lock:
+            started = time.monotonic()
+            codes = []
+            max_id = 0
+            stmt = select(RedemptionCode.id, RedemptionCode.code).execution_options(yield_per=5000)
+            result = await db_session.stream(stmt)
+            async for code_id, code in result:
+                codes.append(code)
+                if code_id > max_id:
+                    max_id = code_id
+
+            bloom = BloomFilter(
+                capacity=max(self.MIN_CAPACITY, len(codes) * 2),
+                error_rate=self.ERROR_RATE
+            )
+            for code in codes:
+                bloom.add(code)
+
+            self._bloom = bloom
+            self._max_id = max_id
+            self._stale_count = 0
+            self._last_sync = time.monotonic()
+
+            logger.info(
+                f"兑换码过滤器已重建: {len(codes)} 个兑换码, "
+                f"占用 {bloom.size_bytes / 1024:.1f} KB, 耗时 {(time.monotonic() - started) * 1000:.0f} ms"
+            )
+
+    def add(self, codes: Iterable[str]):
+        """
+        添加新生成的兑换码
+
+        Args:
+            codes: 兑换码列表
+        """
+        if self._bloom is None:
+            return
+        for code in codes:
+            self._bloom.add(code)
+
+    async def mark_deleted(self, db_session: AsyncSession, count: int = 1):
+        """
+        记录已删除的兑换码, 失效比例过高时重建过滤器
+
+        Args:
+            db_session: 数据库会话
+            count: 删除数量
+        """
+        if self._bloom is None:
+            return
+        self._stale_count += count
+        if self._stale_count > max(1, self._bloom.count) * self.REBUILD_STALE_RATIO:
+            await self.rebuild(db_session)
+
+    async def _sync_new_codes(self, db_session: AsyncSession):
+        """增量加载其他进程新生成的兑换码"""
+        self._last_sync = time.monotonic()
+        stmt = select(RedemptionCode.id, RedemptionCode.code).where(
+            RedemptionCode.id > self._max_id - self.SYNC_ID_OVERLAP
+        )
+        result = await db_session.execute(stmt)
+        for code_id, code in result.all():
+            self._bloom.add(code)
+            if code_id > self._max_id:
+                self._max_id = code_id
+
+        # 新增数量超过容量时重建, 保证误判率
+        if self._bloom.count > self._bloom.capacity:
+            await self.rebuild(db_session)
+
+    async def _code_exists(self, code: str, db_session: AsyncSession) -> bool:
+        """按兑换码精确查询是否存在 (只走 code 唯一索引)"""
+        stmt = select(RedemptionCode.id).where(RedemptionCode.code == code).limit(1)
+        result = await db_session.execute(stmt)
+        return result.scalar_one_or_none() is not None
+
+    async def might_exist(self, code: str, db_session: AsyncSession) -> bool:
+        """
+        判断兑换码是否可能存在
+
+        Args:
+            code: 兑换码
+            db_session: 数据库会话
+
+        Returns:
+            False 表示数据库中不存在, True 表示需要查询数据库确认
+        """
+        if self._bloom is None or not code:
+            return True
+
+        if code in self._bloom:
+            return True
+
+        if time.monotonic() - self._last_sync >= self.SYNC_INTERVAL_SECONDS:
+            await self._sync_new_codes(db_session)
+            if code in self._bloom:
+                return True
+
+        # 增量同步有节流间隔, 且 PostgreSQL 的 id 不保证按提交顺序递增, 拒绝前再精确确认一次
+        if await self._code_exists(code, db_session):
+            self._bloom.add(code)
+            return True
+
+        self.rejected_count += 1
+        return False
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取过滤器统计信息"""
+        return {
+            "ready": self.ready,
+            "codes": self._bloom.count if self._bloom else 0,
+            "size_bytes": self._bloom.size_bytes if self._bloom else 0,
+            "stale": self._stale_count,
+            "rejected": self.rejected_count,
+        }
+
+
+class InvalidCodeTracker:
+    """
+    按 IP 统计无效兑换码尝试次数
+
+    同一 IP 在窗口内尝试不存在的兑换码次数过多时, 直接拒绝其后续请求
+    """
+
+    WINDOW_SECONDS = 600
+    MAX_MISSES = 20
+    MAX_TRACKED_IPS = 10000
+
+    def __init__(self):
+        self._limiter = RateLimiter(
+            capacity=self.MAX_MISSES,
+            period=self.WINDOW_SECONDS,
+            max_keys=self.MAX_TRACKED_IPS
+        )
+        self.shed_count = 0
+
+    def is_blocked(self, ip: Optional[str]) -> bool:
+        """
+        判断 IP 是否因无效尝试过多而被拒绝
+
+        Args:
+            ip: 客户端 IP
+
+        Returns:
+            是否拒绝该请求
+        """
+        if not ip:
+            return False
+        allowed, _ = self._limiter.peek(ip)
+        if not allowed:
+            self.shed_count += 1
+            return True
+        return False
+
+    def record_miss(self, ip: Optional[str]):
+        """
+        记录一次无效兑换码尝试
+
+        Args:
+            ip: 客户端 IP
+        """
+        if ip:
+            self._limiter.hit(ip)
+
+
+# 创建全局实例
+code_lookup_filter = CodeLookupFilter()
+invalid_code_tracker = InvalidCodeTracker()
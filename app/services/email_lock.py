@@ -0,0 +1,195 @@
+"""
+邮箱兑换串行化服务
+同一邮箱同时只允许一个兑换流程执行, 后到的流程能看到前一个流程写入的兑换记录
+"""
+import asyncio
+import logging
+import os
+import time
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+from functools import partial
+from typing import AsyncIterator, Dict
+
+from sqlalchemy import delete, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.database import dialect_insert
+from app.db_writer import db_writer
+from app.models import RedemptionLease
+from app.utils.time_utils import get_now
+
+logger = logging.getLogger(__name__)
+
+
+class EmailLockTimeout(Exception):
+    """等待同一邮箱的兑换流程超时"""
+
+
+class _LocalLock:
+    """带引用计数的进程内锁, 无人使用时释放"""
+
+    __slots__ = ("lock", "refs")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.refs = 0
+
+
+class EmailRedemptionLock:
+    """
+    按规范化邮箱串行化兑换流程
+
+    - 进程内: 每个邮箱一个 asyncio.Lock, 无等待者时删除, 内存不随历史邮箱增长
+    - database 后端: 在进程内锁之外再获取数据库租约, 多 worker 部署时同样生效;
+      租约有过期时间, 持有者异常退出后不会永久阻塞; 持有期间由心跳任务定期续期,
+      兑换耗时超过 LEASE_SECONDS (上游重试、刷新 Token 等) 也不会被其他流程抢走
+    """
+
+    LEASE_SECONDS = 120
+    RENEW_INTERVAL_SECONDS = 30
+    POLL_INTERVAL_SECONDS = 0.1
+
+    def __init__(self, backend: str = "local", timeout: float = 30.0):
+        self.backend = backend
+        self.timeout = timeout
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:16]}"
+        self._locks: Dict[str, _LocalLock] = {}
+
+    @staticmethod
+    def normalize(email: str) -> str:
+        """规范化邮箱"""
+        return (email or "").strip().lower()
+
+    async def _acquire_lease(self, key: str, deadline: float):
+        """获取数据库租约, 超时抛出 EmailLockTimeout"""
+        while True:
+            acquired = await db_writer.run(
+                partial(self._try_lease, key=key, now=get_now()),
+                label="email_lease"
+            )
+            if acquired:
+                return
+
+            if time.monotonic() >= deadline:
+                raise EmailLockTimeout(key)
+            await asyncio.sleep(self.POLL_INTERVAL_SECONDS)
+
+    async def _try_lease(self, db_session: AsyncSession, key: str, now: datetime) -> bool:
+        """尝试写入租约, 返回是否获取成功 (写入单元)"""
+        # 清理已过期的租约 (持有者可能已异常退出)
+        await db_session.execute(
+            delete(RedemptionLease).where(
+                RedemptionLease.email == key,
+                RedemptionLease.expires_at < now
+            )
+        )
+        # 租约被占用时不抛出 IntegrityError, 避免写入队列把正常的等待记为失败
+        result = await db_session.execute(
+            dialect_insert(RedemptionLease)
+            .values(email=key, owner=self.owner, expires_at=now + timedelta(seconds=self.LEASE_SECONDS))
+            .on_conflict_do_nothing(index_elements=["email"])
+            .returning(RedemptionLease.id)
+        )
+        return result.scalar_one_or_none() is not None
+
+    async def _renew_loop(self, key: str):
+        """持有租约期间定期续期 (心跳任务)"""
+        while True:
+            await asyncio.sleep(self.RENEW_INTERVAL_SECONDS)
+            try:
+                renewed = await db_writer.run(
+                    partial(self._renew_lease, key=key, now=get_now()),
+                    label="email_lease_renew"
+                )
+            except Exception as e:
+                # 续期失败时租约仍有剩余时间, 下次心跳重试
+                logger.warning(f"续期兑换租约失败 ({key}): {e}")
+                continue
+            if not renewed:
+                logger.error(f"兑换租约已丢失 ({key}), 同一邮箱的其他兑换可能已开始")
+                return
+
+    async def _renew_lease(self, db_session: AsyncSession, key: str, now: datetime) -> bool:
+        """延长本进程持有的租约, 返回租约是否仍由本进程持有 (写入单元)"""
+        result = await db_session.execute(
+            update(RedemptionLease)
+            .where(
+                RedemptionLease.email == key,
+                RedemptionLease.owner == self.owner
+            )
+            .values(expires_at=now + timedelta(seconds=self.LEASE_SECONDS))
+        )
+        return result.rowcount == 1
+
+    async def _release_lease(self, key: str):
+        """释放数据库租约"""
+        try:
+            await db_writer.run(partial(self._delete_lease, key=key), label="email_lease_release")
+        except Exception as e:
+            logger.error(f"释放兑换租约失败 ({key}): {e}")
+
+    async def _delete_lease(self, db_session: AsyncSession, key: str):
+        """删除本进程持有的租约 (写入单元)"""
+        await db_session.execute(
+            delete(RedemptionLease).where(
+                RedemptionLease.email == key,
+                RedemptionLease.owner == self.owner
+            )
+        )
+
+    @asynccontextmanager
+    async def hold(self, email: str) -> AsyncIterator[None]:
+        """
+        在上下文内独占该邮箱的兑换
+
+        Args:
+            email: 用户邮箱
+
+        Raises:
+            EmailLockTimeout: 等待超时
+        """
+        key = self.normalize(email)
+        deadline = time.monotonic() + self.timeout
+
+        entry = self._locks.get(key)
+        if entry is None:
+            entry = self._locks[key] = _LocalLock()
+        entry.refs += 1
+
+        try:
+            try:
+                await asyncio.wait_for(entry.lock.acquire(), timeout=self.timeout)
+            except asyncio.TimeoutError:
+                raise EmailLockTimeout(key)
+
+            try:
+                if self.backend == "database":
+                    await self._acquire_lease(key, deadline)
+                    heartbeat = asyncio.create_task(self._renew_loop(key))
+                    try:
+                        yield
+                    finally:
+                        heartbeat.cancel()
+                        try:
+                            await heartbeat
+                        except asyncio.CancelledError:
+                            pass
+                        await self._release_lease(key)
+                else:
+                    yield
+            finally:
+                entry.lock.release()
+        finally:
+            entry.refs -= 1
+            if entry.refs == 0:
+                self._locks.pop(key, None)
+
+
+# 创建全局实例
+email_redemption_lock = EmailRedemptionLock(
+    backend=settings.redemption_lock_backend,
+    timeout=settings.redemption_lock_timeout
+)
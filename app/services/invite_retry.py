@@ -0,0 +1,409 @@
+"""
+邀请重试队列服务
+上游临时错误 (超时/5xx) 时保留席位占位, 将邀请写入持久化队列, 由后台任务按退避策略重试;
+队列的写入都交给 db_writer 执行。任务最终失败时回退占位并保留 failed 状态, 用户可按邮箱和兑换码查询
+"""
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from functools import partial
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.database import AsyncSessionLocal
+from app.db_writer import db_writer
+from app.models import InviteRetryJob, RedemptionRecord, Team
+from app.services.stats import stats_service
+from app.services.upstream_scheduler import PRIORITY_BACKGROUND, upstream_priority
+from app.utils.time_utils import get_now
+
+logger = logging.getLogger(__name__)
+
+
+class InviteRetryService:
+    """邀请重试队列服务类"""
+
+    # 第 n 次尝试失败后的等待时间 (秒), 用完后判定为最终失败并回退占位
+    BACKOFF_SECONDS = [10, 30, 60, 180, 600]
+    MAX_ATTEMPTS = len(BACKOFF_SECONDS) + 1
+    POLL_INTERVAL_SECONDS = 5
+    BATCH_SIZE = 20
+    # 领取任务后的租约时间, 防止多个 worker 同时处理同一任务
+    CLAIM_LEASE_SECONDS = 120
+
+    def __init__(self):
+        self._loop_task: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def is_retryable(result: Dict[str, Any]) -> bool:
+        """
+        判断邀请失败是否为可重试的临时错误
+
+        Args:
+            result: send_invite 返回结果
+
+        Returns:
+            是否可重试
+        """
+        if result.get("success"):
+            return False
+        if result.get("error_code") == "cloudflare_challenge":
+            return False
+        status_code = result.get("status_code") or 0
+        return status_code == 0 or status_code == 429 or status_code >= 500
+
+    async def enqueue(
+        self,
+        db_session: AsyncSession,
+        email: str,
+        code: str,
+        team_id: int,
+        account_id: str,
+        is_warranty_redemption: bool,
+        error: Optional[str] = None
+    ) -> int:
+        """
+        将失败的邀请加入重试队列 (调用方已完成席位占位)
+
+        Args:
+            db_session: 数据库会话
+            email: 用户邮箱
+            code: 兑换码
+            team_id: 已占位的 Team ID
+            account_id: Account ID
+            is_warranty_redemption: 是否为质保兑换
+            error: 首次失败的错误信息
+
+        Returns:
+            队列任务 ID
+        """
+        job_id = await db_writer.run(
+            partial(
+                self._add_job,
+                email=email,
+                code=code,
+                team_id=team_id,
+                account_id=account_id,
+                is_warranty_redemption=is_warranty_redemption,
+                status="pending",
+                attempts=1,
+                next_attempt_at=get_now() + timedelta(seconds=self.BACKOFF_SECONDS[0]),
+                last_error=error
+            ),
+            label="invite_retry_enqueue"
+        )
+
+        logger.info(f"邀请已加入重试队列: job={job_id}, {email} -> Team {team_id} (错误: {error})")
+        return job_id
+
+    @staticmethod
+    async def _add_job(db_session: AsyncSession, **values) -> int:
+        """写入队列任务, 返回任务 ID (写入单元)"""
+        job = InviteRetryJob(**values)
+        db_session.add(job)
+        await db_session.flush()
+        return job.id
+
+    async def _claim(self, job_id: int, now: datetime) -> bool:
+        """领取任务, 返回是否领取成功"""
+        return await db_writer.run(
+            partial(self._claim_job, job_id=job_id, now=now),
+            label="invite_retry_claim"
+        )
+
+    async def _claim_job(self, db_session: AsyncSession, job_id: int, now: datetime) -> bool:
+        """延后到期时间作为领取租约 (写入单元)"""
+        result = await db_session.execute(
+            update(InviteRetryJob)
+            .where(
+                InviteRetryJob.id == job_id,
+                InviteRetryJob.status == "pending",
+                InviteRetryJob.next_attempt_at <= now
+            )
+            .values(next_attempt_at=get_now() + timedelta(seconds=self.CLAIM_LEASE_SECONDS))
+        )
+        return result.rowcount == 1
+
+    async def _update_job(self, db_session: AsyncSession, job_id: int, **values):
+        """更新任务状态"""
+        if db_session.in_transaction():
+            await db_session.rollback()
+        await db_writer.run(
+            partial(self._write_job, job_id=job_id, values=values),
+            label="invite_retry_update"
+        )
+
+    @staticmethod
+    async def _write_job(db_session: AsyncSession, job_id: int, values: Dict[str, Any]):
+        """更新任务字段 (写入单元)"""
+        await db_session.execute(
+            update(InviteRetryJob).where(InviteRetryJob.id == job_id).values(**values)
+        )
+
+    @staticmethod
+    async def _complete_job(db_session: AsyncSession, job_id: int, attempts: int, record: Dict[str, Any]):
+        """写入兑换记录并标记任务完成 (写入单元)"""
+        db_session.add(RedemptionRecord(**record))
+        await db_session.execute(
+            update(InviteRetryJob)
+            .where(InviteRetryJob.id == job_id)
+            .values(status="done", attempts=attempts, last_error=None)
+        )
+
+    @staticmethod
+    async def _fail_job(
+        db_session: AsyncSession,
+        job_id: int,
+        code: str,
+        team_id: int,
+        attempts: int,
+        error: str
+    ) -> Optional[Tuple[str, str]]:
+        """回退兑换码和席位占位并标记任务最终失败, 两者在同一事务中提交 (写入单元)"""
+        from app.services.redeem_flow import redeem_flow_service
+
+        transition = await redeem_flow_service._release_seat(db_session, code=code, team_id=team_id)
+        await db_session.execute(
+            update(InviteRetryJob)
+            .where(InviteRetryJob.id == job_id)
+            .values(status="failed", attempts=attempts, last_error=error)
+        )
+        return transition
+
+    async def get_job_status(self, db_session: AsyncSession, email: str, code: str) -> Dict[str, Any]:
+        """
+        查询邮箱和兑换码对应的最近一次排队邀请的状态
+
+        Args:
+            db_session: 数据库会话
+            email: 用户邮箱
+            code: 兑换码
+
+        Returns:
+            结果字典,包含 success, found, status, attempts, message, error
+        """
+        try:
+            stmt = select(InviteRetryJob).where(
+                func.lower(InviteRetryJob.email) == email.strip().lower(),
+                InviteRetryJob.code == code
+            ).order_by(InviteRetryJob.id.desc()).limit(1)
+            result = await db_session.execute(stmt)
+            job = result.scalar_one_or_none()
+
+            if not job:
+                return {
+                    "success": True,
+                    "found": False,
+                    "status": None,
+                    "attempts": 0,
+                    "message": "没有排队中的邀请",
+                    "error": None
+                }
+
+            messages = {
+                "pending": "邀请正在排队发送，请稍后查收邮件",
+                "done": "邀请已发送，请查收邮件并接受邀请",
+                "failed": "邀请多次发送失败，已取消本次兑换，兑换码已恢复，可重新兑换",
+            }
+            return {
+                "success": True,
+                "found": True,
+                "status": job.status,
+                "attempts": job.attempts or 0,
+                "message": messages.get(job.status, job.status),
+                "error": None
+            }
+
+        except Exception as e:
+            logger.error(f"查询邀请状态失败: {e}")
+            return {
+                "success": False,
+                "found": False,
+                "status": None,
+                "attempts": 0,
+                "message": None,
+                "error": f"查询邀请状态失败: {str(e)}"
+            }
+
+    async def _process_job(self, db_session: AsyncSession, job_id: int):
+        """
+        处理单个重试任务
+
+        Args:
+            db_session: 数据库会话
+            job_id: 任务 ID
+        """
+        from app.services.chatgpt import chatgpt_service
+        from app.services.redeem_flow import redeem_flow_service
+
+        job = await db_session.get(InviteRetryJob, job_id)
+        if not job:
+            return
+
+        email = job.email
+        code = job.code
+        team_id = job.team_id
+        account_id = job.account_id
+        is_warranty_redemption = job.is_warranty_redemption
+        attempts = (job.attempts or 0) + 1
+
+        team = await db_session.get(Team, team_id)
+        if not team:
+            invite_result = {"success": False, "status_code": 404, "error": f"Team {team_id} 不存在"}
+        else:
+            access_token = await redeem_flow_service.team_service.ensure_access_token(team, db_session)
+            if access_token:
+                invite_result = await chatgpt_service.send_invite(
+                    access_token, account_id, email, db_session, max_retries=1
+                )
+            else:
+                invite_result = {"success": False, "status_code": 0, "error": "Team 账号 Token 已失效且无法刷新"}
+
+        if db_session.in_transaction():
+            await db_session.rollback()
+
+        # 409 表示用户已是成员, 说明之前某次超时的请求实际已成功
+        if invite_result["success"] or invite_result.get("status_code") == 409:
+            await db_writer.run(
+                partial(
+                    self._complete_job,
+                    job_id=job_id,
+                    attempts=attempts,
+                    record={
+                        "email": email,
+                        "code": code,
+                        "team_id": team_id,
+                        "account_id": account_id,
+                        "is_warranty_redemption": is_warranty_redemption,
+                    }
+                ),
+                label="invite_retry_done"
+            )
+            logger.info(f"重试邀请成功: job={job_id}, {email} 加入 Team {team_id} (第 {attempts} 次尝试)")
+            return
+
+        error = invite_result.get("error") or "未知错误"
+        retryable = self.is_retryable(invite_result)
+
+        if retryable and attempts < self.MAX_ATTEMPTS:
+            delay = self.BACKOFF_SECONDS[attempts - 1]
+            await self._update_job(
+                db_session,
+                job_id,
+                attempts=attempts,
+                next_attempt_at=get_now() + timedelta(seconds=delay),
+                last_error=error
+            )
+            logger.warning(f"重试邀请失败: job={job_id}, 第 {attempts} 次尝试, {delay}s 后重试 (错误: {error})")
+            return
+
+        # 最终失败: 回退兑换码和席位占位, 任务保留 failed 状态供用户查询
+        logger.error(f"重试邀请最终失败: job={job_id}, {email} -> Team {team_id} (错误: {error})")
+        transition = await db_writer.run(
+            partial(
+                self._fail_job,
+                job_id=job_id,
+                code=code,
+                team_id=team_id,
+                attempts=attempts,
+                error=error
+            ),
+            label="invite_retry_failed"
+        )
+        if transition:
+            stats_service.code_transition(*transition)
+
+        if not retryable:
+            team = await db_session.get(Team, team_id)
+            if team:
+                await redeem_flow_service.team_service._handle_api_error(invite_result, team, db_session)
+
+    async def process_due(self, limit: Optional[int] = None, now: Optional[datetime] = None) -> int:
+        """
+        处理已到期的重试任务
+
+        Args:
+            limit: 本次最多处理的任务数
+            now: 判断到期的时间点, 默认当前时间
+
+        Returns:
+            实际处理的任务数
+        """
+        now = now or get_now()
+        async with AsyncSessionLocal() as db_session:
+            stmt = select(InviteRetryJob.id).where(
+                InviteRetryJob.status == "pending",
+                InviteRetryJob.next_attempt_at <= now
+            ).order_by(InviteRetryJob.next_attempt_at).limit(limit or self.BATCH_SIZE)
+            result = await db_session.execute(stmt)
+            job_ids: List[int] = list(result.scalars().all())
+
+        processed = 0
+        # 后台重试不与用户兑换争抢上游并发
+        with upstream_priority(PRIORITY_BACKGROUND):
+            for job_id in job_ids:
+                async with AsyncSessionLocal() as db_session:
+                    try:
+                        if not await self._claim(job_id, now):
+                            continue
+                        await self._process_job(db_session, job_id)
+                        processed += 1
+                    except Exception as e:
+                        logger.error(f"处理重试任务 {job_id} 异常: {e}")
+
+        return processed
+
+    async def _worker_loop(self):
+        logger.info("邀请重试任务已启动")
+        try:
+            while True:
+                try:
+                    processed = await self.process_due()
+                    if processed >= self.BATCH_SIZE:
+                        continue
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"邀请重试循环异常: {e}")
+                await asyncio.sleep(self.POLL_INTERVAL_SECONDS)
+        except asyncio.CancelledError:
+            logger.info("邀请重试任务收到取消信号")
+            raise
+        finally:
+            logger.info("邀请重试任务已停止")
+
+    async def start_worker(self) -> bool:
+        """
+        启动后台重试循环
+
+        Returns:
+            是否新启动了任务 (False 表示已在运行)
+        """
+        if self._loop_task and not self._loop_task.done():
+            return False
+
+        self._loop_task = asyncio.create_task(self._worker_loop())
+        return True
+
+    async def stop_worker(self):
+        """停止后台重试循环"""
+        task = self._loop_task
+        if not task:
+            return
+
+        if not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+            except Exception as e:
+                logger.warning(f"停止邀请重试任务时出现异常: {e}")
+
+        self._loop_task = None
+
+
+# 创建全局实例
+invite_retry_service = InviteRetryService()
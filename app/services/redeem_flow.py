@@ -3,17 +3,26 @@
 协调用户兑换流程，包括验证、Team选择、邀请发送、事务处理和并发控制
 """
 import logging
-from typing import Optional, Dict, Any
+from functools import partial
+from typing import Optional, Dict, Any, Tuple
 from datetime import datetime, timedelta
-from sqlalchemy import select, and_
+from sqlalchemy import select, and_, func
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.models import Team, RedemptionCode, RedemptionRecord
+from app.database import IS_SQLITE
+from app.db_writer import db_writer
+from app.models import InviteRetryJob, Team, RedemptionCode, RedemptionRecord
 from app.services.redemption import RedemptionService
 from app.services.warranty import WarrantyService
 from app.services.team import TeamService
 from app.services.chatgpt import ChatGPTService
+from app.services.email_lock import EmailLockTimeout, email_redemption_lock
 from app.services.encryption import encryption_service
+from app.services.invite_retry import invite_retry_service
+from app.services.settings import settings_service
+from app.services.stats import stats_service
+from app.services.team_placement import get_placement_strategy
+from app.services.upstream_scheduler import PRIORITY_REDEEM, upstream_priority
 from app.utils.time_utils import get_now
 
 logger = logging.getLogger(__name__)
@@ -104,55 +113,76 @@ class RedeemFlowService:
     async def select_team_auto(
         self,
         db_session: AsyncSession,
-        email: Optional[str] = None
+        email: Optional[str] = None,
+        skip_locked: bool = False
     ) -> Dict[str, Any]:
         """
-        自动选择 Team (选择过期时间最早的)
+        自动选择 Team (按系统设置中的分配策略, 默认选择过期时间最早的)
         如果提供了 email，则自动排除该用户已经加入过的 Team
 
         Args:
             db_session: 数据库会话
             email: 用户邮箱 (用于排除已加入的 Team)
+            skip_locked: 以 FOR UPDATE SKIP LOCKED 锁定候选 Team, 跳过其他事务正在占位的 Team
+                (PostgreSQL 并发占位时各事务分散到不同 Team, 而不是排队等同一行锁)
 
         Returns:
             结果字典,包含 success, team_id, error
         """
         try:
-            # 1. 查找用户已经加入过的 Team ID
-            exclude_team_ids = []
-            if email:
-                stmt = select(RedemptionRecord.team_id).where(RedemptionRecord.email == email)
-                result = await db_session.execute(stmt)
-                exclude_team_ids = result.scalars().all()
-                if exclude_team_ids:
-                    logger.info(f"自动选择 Team: 排除用户 {email} 已加入的 Team IDs: {exclude_team_ids}")
+            # 1. 查询可用 Team，按分配策略排序
+            strategy_name = await settings_service.get_team_placement_strategy(db_session)
+            strategy = get_placement_strategy(strategy_name)
 
-            # 2. 查询可用 Team，按过期时间升序排序
             stmt = select(Team).where(
                 Team.status == "active",
                 Team.current_members < Team.max_members
             )
-            
-            # 排除已加入的 Team
-            if exclude_team_ids:
-                stmt = stmt.where(Team.id.not_in(exclude_team_ids))
-            
-            stmt = stmt.order_by(Team.expires_at.asc()).limit(1)
 
-            result = await db_session.execute(stmt)
-            team = result.scalar_one_or_none()
+            # 2. 排除用户已加入过的 Team (相关子查询反连接, 走 lower(email) + team_id 组合索引);
+            # 邀请仍在重试队列中的 Team 已为该邮箱占位但还没有兑换记录, 同样排除
+            normalized_email = email.strip().lower() if email else None
+            if normalized_email:
+                joined_before = select(RedemptionRecord.id).where(
+                    func.lower(RedemptionRecord.email) == normalized_email,
+                    RedemptionRecord.team_id == Team.id
+                )
+                pending_invite = select(InviteRetryJob.id).where(
+                    func.lower(InviteRetryJob.email) == normalized_email,
+                    InviteRetryJob.team_id == Team.id,
+                    InviteRetryJob.status == "pending"
+                )
+                stmt = stmt.where(~joined_before.exists(), ~pending_invite.exists())
+
+            stmt = stmt.order_by(*strategy.order_by()).limit(strategy.candidate_limit)
+
+            candidates = []
+            if skip_locked:
+                result = await db_session.execute(stmt.with_for_update(skip_locked=True, of=Team))
+                candidates = list(result.scalars().all())
+            if not candidates:
+                # 可用 Team 都被其他事务锁定时不加锁重新查询, 由调用方加锁后检查席位
+                result = await db_session.execute(stmt)
+                candidates = list(result.scalars().all())
+            team = strategy.choose(candidates)
 
             if not team:
                 reason = "没有可用的 Team"
-                if exclude_team_ids:
-                    reason = "您已加入所有可用 Team"
+                if normalized_email:
+                    # 仅在选不到 Team 时才确认用户是否有历史记录, 用于给出更准确的提示
+                    stmt = select(RedemptionRecord.id).where(
+                        func.lower(RedemptionRecord.email) == normalized_email
+                    ).limit(1)
+                    result = await db_session.execute(stmt)
+                    if result.scalar_one_or_none() is not None:
+                        reason = "您已加入所有可用 Team"
                 return {
                     "success": False,
                     "team_id": None,
                     "error": reason
                 }
 
-            logger.info(f"自动选择 Team: {team.id} (过期时间: {team.expires_at})")
+            logger.info(f"自动选择 Team: {team.id} (策略: {strategy.name}, 过期时间: {team.expires_at})")
 
             return {
                 "success": True,
@@ -177,6 +207,34 @@ class RedeemFlowService:
     ) -> Dict[str, Any]:
         """
         完整的兑换流程 (带事务和并发控制)
+        同一邮箱的兑换串行执行, 后到的流程能看到前一个流程的兑换记录, 从而排除已加入的 Team
+
+        Args:
+            email: 用户邮箱
+            code: 兑换码
+            team_id: 指定的 Team ID (为空则自动选择)
+            db_session: 数据库会话
+
+        Returns:
+            结果字典,包含 success, message, team_info, error
+        """
+        try:
+            with upstream_priority(PRIORITY_REDEEM):
+                async with email_redemption_lock.hold(email):
+                    return await self._redeem_and_join_team(email, code, team_id, db_session)
+        except EmailLockTimeout:
+            logger.warning(f"邮箱 {email} 已有兑换正在处理，等待超时")
+            return {"success": False, "error": "该邮箱已有兑换正在处理中，请稍后再试"}
+
+    async def _redeem_and_join_team(
+        self,
+        email: str,
+        code: str,
+        team_id: Optional[int],
+        db_session: AsyncSession
+    ) -> Dict[str, Any]:
+        """
+        兑换流程主体
         优化版本: 将网络请求移出写事务,避免 SQLite 锁定
         """
         max_retries = 3
@@ -195,105 +253,29 @@ class RedeemFlowService:
             logger.info(f"正在尝试兑换 (第 {attempt + 1}/{max_retries} 次尝试): email={email}, code={code}")
             team_id_final = None
             try:
-                # --- 阶段 1: 验证并占位 (短事务) ---
-                async with db_session.begin():
-                    # 1. 验证兑换码 (在事务内验证确保原子性)
-                    validate_result = await self.redemption_service.validate_code(code, db_session)
-                    if not validate_result["success"]:
-                        return {"success": False, "error": validate_result["error"]}
-                    if not validate_result["valid"]:
-                        return {"success": False, "error": validate_result["reason"]}
-
-                    # 再次验证并锁定 (带锁锁定，防止并发)
-                    stmt = select(RedemptionCode).where(RedemptionCode.code == code).with_for_update()
-                    result = await db_session.execute(stmt)
-                    redemption_code = result.scalar_one_or_none()
-                    
-                    if not redemption_code:
-                        return {"success": False, "error": "兑换码记录丢失"}
-
-                    # 检查状态是否依然有效 (可能在循环间隙被别人捷足先登)
-                    allowed_statuses = ["unused", "warranty_active"]
-                    if redemption_code.has_warranty:
-                        allowed_statuses.append("used")
-
-                    if redemption_code.status not in allowed_statuses:
-                        return {"success": False, "error": "兑换码已被使用"}
-
-                    # 2. 选择 Team
-                    if current_target_team_id is None:
-                        select_result = await self.select_team_auto(db_session, email=email)
-                        if not select_result["success"]:
-                            return {"success": False, "error": select_result["error"]}
-                        team_id_final = select_result["team_id"]
-                    else:
-                        team_id_final = current_target_team_id
+                # --- 阶段 1: 验证并占位 (在写入队列中执行, 全程持有写锁) ---
+                claim = await db_writer.run(
+                    partial(
+                        self._claim_seat,
+                        email=email,
+                        code=code,
+                        target_team_id=current_target_team_id,
+                        can_retry=current_target_team_id is None and attempt < max_retries - 1
+                    ),
+                    label="redeem_claim"
+                )
+                if claim.get("retry"):
+                    continue
+                if not claim["success"]:
+                    return {"success": False, "error": claim["error"]}
 
-                    # 3. 锁定并检查 Team
-                    stmt = select(Team).where(Team.id == team_id_final).with_for_update()
-                    result = await db_session.execute(stmt)
-                    team = result.scalar_one_or_none()
+                team_id_final = claim["team_id"]
+                final_team_account_id = claim["account_id"]
+                final_team_name = claim["team_name"]
+                final_is_warranty = claim["is_warranty"]
+                final_team_info = claim["team_info"]
+                stats_service.code_transition(claim["previous_code_status"], claim["code_status"])
 
-                    if not team:
-                        if current_target_team_id is None and attempt < max_retries - 1:
-                            logger.warning(f"选择的 Team {team_id_final} 消失了, 尝试下一次循环")
-                            continue
-                        return {"success": False, "error": f"Team {team_id_final} 不存在"}
-                    
-                    if team.current_members >= team.max_members:
-                        if current_target_team_id is None and attempt < max_retries - 1:
-                            logger.warning(f"选择的 Team {team_id_final} 已满, 尝试下一次循环")
-                            continue 
-                        return {"success": False, "error": "Team 已满，请选择其他 Team"}
-                    
-                    if team.status != "active":
-                        if current_target_team_id is None and attempt < max_retries - 1:
-                            logger.warning(f"选择的 Team {team_id_final} 状态异常 ({team.status}), 尝试下一次循环")
-                            continue
-                        return {"success": False, "error": f"Team 状态异常: {team.status}"}
-
-                    # 特殊处理质保码逻辑
-                    is_warranty_code = redemption_code.has_warranty
-                    is_first_use = redemption_code.status == "unused"
-                    
-                    if not is_first_use:
-                        # 如果不是首次使用，检查是否为质保码且可重复使用
-                        if is_warranty_code:
-                            warranty_check = await self.warranty_service.validate_warranty_reuse(
-                                db_session, code, email
-                            )
-                            if not warranty_check["success"] or not warranty_check["can_reuse"]:
-                                return {"success": False, "error": warranty_check.get("reason", "兑换码质保验证未通过")}
-                        else:
-                            return {"success": False, "error": "兑换码已被占用"}
-
-                    # 4. 更新状态执行占位
-                    if is_warranty_code:
-                        redemption_code.status = "warranty_active"
-                        if is_first_use:
-                            warranty_days = redemption_code.warranty_days or 30
-                            redemption_code.warranty_expires_at = get_now() + timedelta(days=warranty_days)
-                    else:
-                        redemption_code.status = "used"
-                    
-                    redemption_code.used_by_email = email
-                    redemption_code.used_team_id = team_id_final
-                    redemption_code.used_at = get_now()
-
-                    # 增加 Team 成员数占位
-                    team.current_members += 1
-                    if team.current_members >= team.max_members:
-                        team.status = "full"
-                    
-                    # 记录信息供 Phase 2 使用
-                    final_team_account_id = team.account_id
-                    final_team_name = team.team_name
-                    final_team_expires_at = team.expires_at
-                    final_access_token_encrypted = team.access_token_encrypted
-                    final_is_warranty = is_warranty_code
-                    
-                    # 事务 commit
-                
                 # --- 阶段 2: 网络请求 ---
                 # 获取该 Team 的最新数据以确保 Token 也是最新的 (可能被其他进程同步过)
                 stmt = select(Team).where(Team.id == team_id_final)
@@ -317,36 +299,48 @@ class RedeemFlowService:
                         continue
                     return {"success": False, "error": "Team 账号 Token 已失效且无法刷新"}
 
+                # 只请求一次, 临时错误交给重试队列, 避免用户等待上游重试
                 invite_result = await self.chatgpt_service.send_invite(
-                    access_token, final_team_account_id, email, db_session
+                    access_token, final_team_account_id, email, db_session, max_retries=1
                 )
 
                 # --- 阶段 3: 最终化 ---
                 if invite_result["success"]:
-                    # 阶段 2 的网络请求中可能涉及查询设置(代理等)，会隐式开启事务
-                    if db_session.in_transaction():
-                        await db_session.rollback()
-                        
-                    async with db_session.begin():
-                        redemption_record = RedemptionRecord(
+                    await db_writer.run(
+                        partial(
+                            self._add_record,
                             email=email,
                             code=code,
                             team_id=team_id_final,
                             account_id=final_team_account_id,
                             is_warranty_redemption=final_is_warranty
-                        )
-                        db_session.add(redemption_record)
+                        ),
+                        label="redeem_record"
+                    )
                     
                     logger.info(f"兑换成功: {email} 加入 Team {team_id_final}")
                     return {
                         "success": True,
                         "message": f"成功加入 Team: {final_team_name}",
-                        "team_info": {
-                            "team_id": team_id_final,
-                            "team_name": final_team_name,
-                            "account_id": final_team_account_id,
-                            "expires_at": final_team_expires_at.isoformat() if final_team_expires_at else None
-                        },
+                        "team_info": final_team_info,
+                        "error": None
+                    }
+                elif invite_retry_service.is_retryable(invite_result):
+                    # 上游临时错误: 保留占位, 加入重试队列, 由后台任务完成邀请并写入兑换记录
+                    await invite_retry_service.enqueue(
+                        db_session,
+                        email=email,
+                        code=code,
+                        team_id=team_id_final,
+                        account_id=final_team_account_id,
+                        is_warranty_redemption=final_is_warranty,
+                        error=invite_result.get("error")
+                    )
+                    return {
+                        "success": True,
+                        "pending": True,
+                        "message": f"已为您预留 Team: {final_team_name} 的席位，邀请正在排队发送，请稍后查收邮件",
+                        "team_info": final_team_info,
                         "error": None
                     }
                 else:
@@ -393,6 +387,147 @@ class RedeemFlowService:
                     continue
                 return {"success": False, "error": f"兑换系统异常: {str(e)}"}
 
+    async def _claim_seat(
+        self,
+        db_session: AsyncSession,
+        email: str,
+        code: str,
+        target_team_id: Optional[int],
+        can_retry: bool
+    ) -> Dict[str, Any]:
+        """
+        阶段 1: 验证兑换码、选择 Team 并占位 (写入单元, 由 db_writer 在写锁内执行)
+
+        Args:
+            db_session: 写会话
+            email: 用户邮箱
+            code: 兑换码
+            target_team_id: 指定的 Team ID (为空则自动选择)
+            can_retry: Team 不可用时是否返回 retry 让调用方重新选择
+
+        Returns:
+            结果字典: 成功时包含 team_id, account_id, team_name, team_info 及兑换码状态变化;
+            retry 为 True 表示应重新选择 Team; 失败时包含 error
+        """
+        # 1. 验证兑换码 (在事务内验证确保原子性)
+        validate_result = await self.redemption_service.validate_code(code, db_session)
+        if not validate_result["success"]:
+            return {"success": False, "error": validate_result["error"]}
+        if not validate_result["valid"]:
+            return {"success": False, "error": validate_result["reason"]}
+
+        # 再次验证并锁定 (带锁锁定，防止并发; populate_existing 保证拿到锁后读到的是最新提交的值,
+        # 而不是 validate_code 未加锁时载入会话的旧值)
+        stmt = select(RedemptionCode).where(RedemptionCode.code == code).with_for_update().execution_options(
+            populate_existing=True
+        )
+        result = await db_session.execute(stmt)
+        redemption_code = result.scalar_one_or_none()
+
+        if not redemption_code:
+            return {"success": False, "error": "兑换码记录丢失"}
+
+        # 检查状态是否依然有效 (可能在循环间隙被别人捷足先登)
+        allowed_statuses = ["unused", "warranty_active"]
+        if redemption_code.has_warranty:
+            allowed_statuses.append("used")
+
+        if redemption_code.status not in allowed_statuses:
+            return {"success": False, "error": "兑换码已被使用"}
+
+        # 2. 选择 Team
+        if target_team_id is None:
+            select_result = await self.select_team_auto(
+                db_session,
+                email=email,
+                skip_locked=not IS_SQLITE
+            )
+            if not select_result["success"]:
+                return {"success": False, "error": select_result["error"]}
+            team_id_final = select_result["team_id"]
+        else:
+            team_id_final = target_team_id
+
+        # 3. 锁定并检查 Team
+        stmt = select(Team).where(Team.id == team_id_final).with_for_update().execution_options(
+            populate_existing=True
+        )
+        result = await db_session.execute(stmt)
+        team = result.scalar_one_or_none()
+
+        if not team:
+            if can_retry:
+                logger.warning(f"选择的 Team {team_id_final} 消失了, 尝试下一次循环")
+                return {"success": False, "retry": True}
+            return {"success": False, "error": f"Team {team_id_final} 不存在"}
+
+        if team.current_members >= team.max_members:
+            if can_retry:
+                logger.warning(f"选择的 Team {team_id_final} 已满, 尝试下一次循环")
+                return {"success": False, "retry": True}
+            return {"success": False, "error": "Team 已满，请选择其他 Team"}
+
+        if team.status != "active":
+            if can_retry:
+                logger.warning(f"选择的 Team {team_id_final} 状态异常 ({team.status}), 尝试下一次循环")
+                return {"success": False, "retry": True}
+            return {"success": False, "error": f"Team 状态异常: {team.status}"}
+
+        # 特殊处理质保码逻辑
+        is_warranty_code = redemption_code.has_warranty
+        is_first_use = redemption_code.status == "unused"
+
+        if not is_first_use:
+            # 如果不是首次使用，检查是否为质保码且可重复使用
+            if is_warranty_code:
+                warranty_check = await self.warranty_service.validate_warranty_reuse(
+                    db_session, code, email
+                )
+                if not warranty_check["success"] or not warranty_check["can_reuse"]:
+                    return {"success": False, "error": warranty_check.get("reason", "兑换码质保验证未通过")}
+            else:
+                return {"success": False, "error": "兑换码已被占用"}
+
+        # 4. 更新状态执行占位
+        previous_code_status = redemption_code.status
+        if is_warranty_code:
+            redemption_code.status = "warranty_active"
+            if is_first_use:
+                warranty_days = redemption_code.warranty_days or 30
+                redemption_code.warranty_expires_at = get_now() + timedelta(days=warranty_days)
+        else:
+            redemption_code.status = "used"
+
+        redemption_code.used_by_email = email
+        redemption_code.used_team_id = team_id_final
+        redemption_code.used_at = get_now()
+
+        # 增加 Team 成员数占位
+        team.current_members += 1
+        if team.current_members >= team.max_members:
+            team.status = "full"
+
+        return {
+            "success": True,
+            "team_id": team_id_final,
+            "account_id": team.account_id,
+            "team_name": team.team_name,
+            "is_warranty": is_warranty_code,
+            "previous_code_status": previous_code_status,
+            "code_status": redemption_code.status,
+            "team_info": {
+                "team_id": team_id_final,
+                "team_name": team.team_name,
+                "account_id": team.account_id,
+                "expires_at": team.expires_at.isoformat() if team.expires_at else None
+            }
+        }
+
+    @staticmethod
+    async def _add_record(db_session: AsyncSession, **values):
+        """写入兑换记录 (写入单元)"""
+        db_session.add(RedemptionRecord(**values))
+
     async def _rollback_redemption(
         self,
         db_session: AsyncSession,
@@ -401,58 +536,80 @@ class RedeemFlowService:
     ):
         """回退兑换占位"""
         try:
-            # 确保会话干净，防止在异常处理路径中再次触发事务冲突
-            if db_session.in_transaction():
-                await db_session.rollback()
-                
-            async with db_session.begin():
-                # 回退兑换码状态
-                stmt = select(RedemptionCode).where(RedemptionCode.code == code).with_for_update()
-                result = await db_session.execute(stmt)
-                redemption_code = result.scalar_one_or_none()
-                if redemption_code:
-                    # 质保码回退到 warranty_active 或 unused
-                    if redemption_code.has_warranty:
-                        # 检查是否有其他成功的兑换记录
-                        stmt = select(RedemptionRecord).where(
-                            RedemptionRecord.code == code
-                        ).order_by(RedemptionRecord.redeemed_at.desc())
-                        result = await db_session.execute(stmt)
-                        other_record = result.scalars().first()
-                        
-                        if other_record:
-                            # 有其他记录，恢复为最后一次成功的状态
-                            redemption_code.status = "warranty_active"
-                            redemption_code.used_by_email = other_record.email
-                            redemption_code.used_team_id = other_record.team_id
-                            redemption_code.used_at = other_record.redeemed_at
-                        else:
-                            # 没有其他成功记录，彻底回退到未使用
-                            redemption_code.status = "unused"
-                            redemption_code.warranty_expires_at = None
-                            redemption_code.used_by_email = None
-                            redemption_code.used_team_id = None
-                            redemption_code.used_at = None
-                    else:
-                        # 普通码彻底回退到 unused
-                        redemption_code.status = "unused"
-                        redemption_code.used_by_email = None
-                        redemption_code.used_team_id = None
-                        redemption_code.used_at = None
-
-                # 回退 Team 计数
-                stmt = select(Team).where(Team.id == team_id).with_for_update()
-                result = await db_session.execute(stmt)
-                team = result.scalar_one_or_none()
-                if team:
-                    if team.current_members > 0:
-                        team.current_members -= 1
-                    if team.status == "full" and team.current_members < team.max_members:
-                        team.status = "active"
+            transition = await db_writer.run(
+                partial(self._release_seat, code=code, team_id=team_id),
+                label="redeem_rollback"
+            )
+            if transition:
+                stats_service.code_transition(*transition)
             logger.info(f"已回退兑换占位: code={code}, team_id={team_id}")
         except Exception as e:
             logger.error(f"回退兑换占位失败: {e}")
 
+    async def _release_seat(
+        self,
+        db_session: AsyncSession,
+        code: str,
+        team_id: int
+    ) -> Optional[Tuple[str, str]]:
+        """
+        回退兑换码状态和 Team 占位 (写入单元)
+
+        Returns:
+            兑换码的 (原状态, 新状态), 兑换码不存在时返回 None
+        """
+        # 回退兑换码状态
+        stmt = select(RedemptionCode).where(RedemptionCode.code == code).with_for_update().execution_options(
+            populate_existing=True
+        )
+        result = await db_session.execute(stmt)
+        redemption_code = result.scalar_one_or_none()
+        previous_code_status = redemption_code.status if redemption_code else None
+        if redemption_code:
+            # 质保码回退到 warranty_active 或 unused
+            if redemption_code.has_warranty:
+                # 检查是否有其他成功的兑换记录
+                stmt = select(RedemptionRecord).where(
+                    RedemptionRecord.code == code
+                ).order_by(RedemptionRecord.redeemed_at.desc())
+                result = await db_session.execute(stmt)
+                other_record = result.scalars().first()
+
+                if other_record:
+                    # 有其他记录，恢复为最后一次成功的状态
+                    redemption_code.status = "warranty_active"
+                    redemption_code.used_by_email = other_record.email
+                    redemption_code.used_team_id = other_record.team_id
+                    redemption_code.used_at = other_record.redeemed_at
+                else:
+                    # 没有其他成功记录，彻底回退到未使用
+                    redemption_code.status = "unused"
+                    redemption_code.warranty_expires_at = None
+                    redemption_code.used_by_email = None
+                    redemption_code.used_team_id = None
+                    redemption_code.used_at = None
+            else:
+                # 普通码彻底回退到 unused
+                redemption_code.status = "unused"
+                redemption_code.used_by_email = None
+                redemption_code.used_team_id = None
+                redemption_code.used_at = None
+
+        # 回退 Team 计数
+        stmt = select(Team).where(Team.id == team_id).with_for_update().execution_options(
+            populate_existing=True
+        )
+        result = await db_session.execute(stmt)
+        team = result.scalar_one_or_none()
+        if team:
+            if team.current_members > 0:
+                team.current_members -= 1
+            if team.status == "full" and team.current_members < team.max_members:
+                team.status = "active"
+        if redemption_code:
+            return previous_code_status, redemption_code.status
+        return None
+
 
 # 创建全局实例
 redeem_flow_service = RedeemFlowService()
@@ -2,24 +2,52 @@
 兑换码管理服务
 用于管理兑换码的生成、验证、使用和查询
 """
+import base64
 import logging
 import secrets
 import string
-from typing import Optional, Dict, Any, List
-from datetime import datetime, timedelta
-from sqlalchemy import select, update, delete, and_, or_, func
+from functools import partial
+from typing import Optional, Dict, Any, List, AsyncIterator, Sequence
+from datetime import date, datetime, timedelta
+from sqlalchemy import select, update, delete, and_, or_, func, case, Row
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
+from app.database import dialect_insert
+from app.db_writer import db_writer
 from app.models import RedemptionCode, RedemptionRecord, Team
+from app.services.code_filter import code_lookup_filter
+from app.services.search_index import search_index_service
+from app.services.stats import stats_service
+from app.utils.cache import TTLCache
+from app.utils.pagination import keyset_paginate
 from app.utils.time_utils import get_now
 
 logger = logging.getLogger(__name__)
 
+# 使用大写字母和数字,排除容易混淆的字符 (0, O, I, 1), 恰好 32 个字符
+CODE_ALPHABET = "".join(
+    c for c in string.ascii_uppercase + string.digits if c not in "0OI1"
+)
+# base32 字母表与兑换码字母表一一对应, 随机字节经 base32 编码后直接映射, 分布保持均匀
+_BASE32_TO_CODE = str.maketrans("ABCDEFGHIJKLMNOPQRSTUVWXYZ234567", CODE_ALPHABET)
+
+# 带搜索条件的兑换码总数缓存, 翻页时不必每次重新 count
+search_count_cache = TTLCache(ttl=30.0, maxsize=256)
+
 
 class RedemptionService:
     """兑换码管理服务类"""
 
+    # 单次批量生成的数量上限
+    MAX_BATCH_SIZE = 200000
+    # 批量生成结果中直接返回的兑换码数量上限, 完整列表通过按批次导出获取
+    MAX_RETURNED_CODES = 1000
+    # 每条 INSERT 的行数 (每行 6 个参数, 需低于 SQLite 单语句 32766 个参数的限制)
+    INSERT_CHUNK_SIZE = 2000
+    # 批量生成时, 仅对冲突的兑换码重新生成的最大轮数
+    MAX_GENERATE_ROUNDS = 10
+
     def __init__(self):
         """初始化兑换码管理服务"""
         pass
@@ -34,12 +62,9 @@ class RedemptionService:
         Returns:
             随机兑换码字符串
         """
-        # 使用大写字母和数字,排除容易混淆的字符 (0, O, I, 1)
-        alphabet = string.ascii_uppercase + string.digits
-        alphabet = alphabet.replace('0', '').replace('O', '').replace('I', '').replace('1', '')
-
-        # 生成随机码
-        code = ''.join(secrets.choice(alphabet) for _ in range(length))
+        # 每 5 个随机字节编码为 8 个 base32 字符
+        raw = secrets.token_bytes(5 * ((length + 7) // 8))
+        code = base64.b32encode(raw).decode("ascii")[:length].translate(_BASE32_TO_CODE)
 
         # 格式化为 XXXX-XXXX-XXXX-XXXX
         if length == 16:
@@ -119,6 +144,8 @@ class RedemptionService:
 
             db_session.add(redemption_code)
             await db_session.commit()
+            code_lookup_filter.add([code])
+            stats_service.bump_codes(unused=1)
 
             logger.info(f"生成兑换码成功: {code}")
 
@@ -141,7 +168,6 @@ class RedemptionService:
 
     async def generate_code_batch(
         self,
-        db_session: AsyncSession,
         count: int,
         expires_days: Optional[int] = None,
         has_warranty: bool = False,
@@ -150,85 +176,157 @@ class RedemptionService:
         """
         批量生成兑换码
 
+        兑换码分块提交, 不是全有或全无: 中途失败时已提交的兑换码保留且可以使用,
+        结果中的 total 为实际生成的数量。codes 最多返回 MAX_RETURNED_CODES 个,
+        同一批次的兑换码创建时间相同, 完整列表通过 batch_created_at 按批次导出
+
         Args:
-            db_session: 数据库会话
             count: 生成数量
             expires_days: 有效期天数 (可选)
             has_warranty: 是否为质保兑换码 (默认 False)
+            warranty_days: 质保天数
 
         Returns:
-            结果字典,包含 success, codes, total, message, error
+            结果字典,包含 success, codes, total, truncated, batch_created_at, message, error
         """
+        codes: List[str] = []
+        now = get_now()
         try:
-            if count <= 0 or count > 1000:
+            if count <= 0 or count > self.MAX_BATCH_SIZE:
                 return {
                     "success": False,
                     "codes": [],
                     "total": 0,
+                    "truncated": False,
+                    "batch_created_at": None,
                     "message": None,
-                    "error": "生成数量必须在 1-1000 之间"
+                    "error": f"生成数量必须在 1-{self.MAX_BATCH_SIZE} 之间"
                 }
 
             # 计算过期时间
             expires_at = None
             if expires_days:
-                expires_at = get_now() + timedelta(days=expires_days)
-
-            # 批量生成兑换码
-            codes = []
-            for i in range(count):
-                # 生成唯一兑换码
-                max_attempts = 10
-                for _ in range(max_attempts):
+                expires_at = now + timedelta(days=expires_days)
+
+            # 在内存中生成候选码, 批量插入时由唯一索引忽略与已有兑换码冲突的行,
+            # 只对冲突的部分重新生成, 不再逐个查询数据库;
+            # 每块在独立的写入单元中提交, 中途失败时已提交的块保留并计入结果
+            inserted = set()
+            for _ in range(self.MAX_GENERATE_ROUNDS):
+                missing = count - len(codes)
+                if missing <= 0:
+                    break
+
+                candidates = set()
+                while len(candidates) < missing:
                     code = self._generate_random_code()
+                    if code not in inserted:
+                        candidates.add(code)
 
-                    # 检查是否已存在 (包括本次批量生成的)
-                    if code not in codes:
-                        stmt = select(RedemptionCode).where(RedemptionCode.code == code)
-                        result = await db_session.execute(stmt)
-                        existing = result.scalar_one_or_none()
-
-                        if not existing:
-                            codes.append(code)
-                            break
-                else:
-                    logger.warning(f"生成第 {i+1} 个兑换码失败")
-                    continue
-
-            # 批量插入数据库
-            for code in codes:
-                redemption_code = RedemptionCode(
-                    code=code,
-                    status="unused",
+                new_codes = await self._insert_codes(
+                    list(candidates),
+                    codes,
+                    created_at=now,
                     expires_at=expires_at,
                     has_warranty=has_warranty,
                     warranty_days=warranty_days
                 )
-                db_session.add(redemption_code)
-
-            await db_session.commit()
+                inserted.update(new_codes)
+            else:
+                if len(codes) < count:
+                    logger.warning(f"批量生成兑换码: 仅生成 {len(codes)}/{count} 个")
 
             logger.info(f"批量生成兑换码成功: {len(codes)} 个")
 
+            message = f"成功生成 {len(codes)} 个兑换码"
+            if len(codes) > self.MAX_RETURNED_CODES:
+                message += f", 此处仅显示前 {self.MAX_RETURNED_CODES} 个, 完整列表请按批次导出"
             return {
                 "success": True,
-                "codes": codes,
-                "total": len(codes),
-                "message": f"成功生成 {len(codes)} 个兑换码",
+                **self._batch_result(codes, now),
+                "message": message,
                 "error": None
             }
 
         except Exception as e:
-            await db_session.rollback()
-            logger.error(f"批量生成兑换码失败: {e}")
+            logger.error(f"批量生成兑换码失败 (已生成 {len(codes)}/{count} 个): {e}")
             return {
                 "success": False,
-                "codes": [],
-                "total": 0,
-                "message": None,
-                "error": f"批量生成兑换码失败: {str(e)}"
+                **self._batch_result(codes, now),
+                "message": f"已生成 {len(codes)}/{count} 个兑换码, 已生成的兑换码有效" if codes else None,
+                "error": (
+                    f"批量生成兑换码失败 (已生成 {len(codes)}/{count} 个, 已生成的兑换码有效, 可按批次导出): {str(e)}"
+                    if codes else f"批量生成兑换码失败: {str(e)}"
+                )
             }
 
+    def _batch_result(self, codes: List[str], created_at: datetime) -> Dict[str, Any]:
+        """批量生成结果中的兑换码部分, 只返回前 MAX_RETURNED_CODES 个"""
+        return {
+            "codes": codes[:self.MAX_RETURNED_CODES],
+            "total": len(codes),
+            "truncated": len(codes) > self.MAX_RETURNED_CODES,
+            "batch_created_at": created_at.isoformat() if codes else None,
+        }
+
+    async def _insert_codes(
+        self,
+        codes: List[str],
+        committed: List[str],
+        created_at: datetime,
+        expires_at: Optional[datetime],
+        has_warranty: bool,
+        warranty_days: int
+    ) -> List[str]:
+        """
+        分块多行插入兑换码, 忽略与已有兑换码冲突的行
+
+        每块是一个写入单元, 由 db_writer 单独提交, 大批量生成不会长时间持有写锁阻塞兑换;
+        每块提交后立即加入布隆过滤器和统计, 并追加到 committed
+
+        Args:
+            codes: 待插入的兑换码
+            committed: 已提交的兑换码列表 (就地追加)
+            created_at: 创建时间
+            expires_at: 过期时间
+            has_warranty: 是否为质保兑换码
+            warranty_days: 质保天数
+
+        Returns:
+            本次实际插入成功的兑换码列表
+        """
+        inserted: List[str] = []
+        for i in range(0, len(codes), self.INSERT_CHUNK_SIZE):
+            rows = [
+                {
+                    "code": code,
+                    "status": "unused",
+                    "created_at": created_at,
+                    "expires_at": expires_at,
+                    "has_warranty": has_warranty,
+                    "warranty_days": warranty_days,
+                }
+                for code in codes[i:i + self.INSERT_CHUNK_SIZE]
+            ]
+            chunk = await db_writer.run(partial(self._insert_code_rows, rows=rows), label="generate_codes")
+            code_lookup_filter.add(chunk)
+            stats_service.bump_codes(unused=len(chunk))
+            committed.extend(chunk)
+            inserted.extend(chunk)
+        return inserted
+
+    @staticmethod
+    async def _insert_code_rows(db_session: AsyncSession, rows: List[Dict[str, Any]]) -> List[str]:
+        """插入一块兑换码, 返回实际插入的兑换码 (写入单元)"""
+        # 语句只编译一次, 按参数列表执行, 由驱动层拼成多行 INSERT ... RETURNING
+        stmt = (
+            dialect_insert(RedemptionCode)
+            .on_conflict_do_nothing(index_elements=["code"])
+            .returning(RedemptionCode.code)
+        )
+        result = await db_session.execute(stmt, rows)
+        return list(result.scalars().all())
+
     async def validate_code(
         self,
         code: str,
@@ -245,6 +343,16 @@ class RedemptionService:
             结果字典,包含 success, valid, reason, redemption_code, error
         """
         try:
+            # 0. 布隆过滤器过滤不存在的兑换码, 未命中时只做一次索引查询, 不加载整行
+            if not await code_lookup_filter.might_exist(code, db_session):
+                return {
+                    "success": True,
+                    "valid": False,
+                    "reason": "兑换码不存在",
+                    "redemption_code": None,
+                    "error": None
+                }
+
             # 1. 查询兑换码
             stmt = select(RedemptionCode).where(RedemptionCode.code == code)
             result = await db_session.execute(stmt)
@@ -280,6 +388,7 @@ class RedemptionService:
                 if redemption_code.expires_at < get_now():
                     # 更新状态为 expired
                     redemption_code.status = "expired"
+                    stats_service.invalidate_codes()
                     # 不在服务层内部 commit，让调用方决定事务边界
                     # await db_session.commit() 
 
@@ -360,6 +469,7 @@ class RedemptionService:
             result = await db_session.execute(stmt)
             redemption_code = result.scalar_one_or_none()
 
+            previous_status = redemption_code.status
             redemption_code.status = "used"
             redemption_code.used_by_email = email
             redemption_code.used_team_id = team_id
@@ -375,6 +485,7 @@ class RedemptionService:
 
             db_session.add(redemption_record)
             await db_session.commit()
+            stats_service.code_transition(previous_status, "used")
 
             logger.info(f"使用兑换码成功: {code} -> {email}")
 
@@ -396,58 +507,48 @@ class RedemptionService:
     async def get_all_codes(
         self,
         db_session: AsyncSession,
-        page: int = 1,
         per_page: int = 50,
-        search: Optional[str] = None
+        search: Optional[str] = None,
+        cursor: Optional[str] = None
     ) -> Dict[str, Any]:
         """
-        获取所有兑换码
+        获取所有兑换码 (按创建时间倒序游标分页)
 
         Args:
             db_session: 数据库会话
-            page: 页码
             per_page: 每页数量
             search: 搜索关键词 (兑换码或邮箱)
+            cursor: 分页游标 (上一次结果中的 next_cursor/prev_cursor), 为空表示第一页
 
         Returns:
-            结果字典,包含 success, codes, total, total_pages, current_page, error
+            结果字典,包含 success, codes, total, total_pages, current_page, next_cursor, prev_cursor, error
         """
         try:
             # 1. 构建基础查询
-            count_stmt = select(func.count(RedemptionCode.id))
-            stmt = select(RedemptionCode).order_by(RedemptionCode.created_at.desc())
+            stmt = select(RedemptionCode)
 
             # 2. 如果提供了搜索关键词,添加过滤条件
             if search:
-                search_filter = or_(
-                    RedemptionCode.code.ilike(f"%{search}%"),
-                    RedemptionCode.used_by_email.ilike(f"%{search}%")
-                )
-                count_stmt = count_stmt.where(search_filter)
-                stmt = stmt.where(search_filter)
-
-            # 3. 获取总数
-            count_result = await db_session.execute(count_stmt)
-            total = count_result.scalar() or 0
+                stmt = stmt.where(self._code_search_filter(search))
 
-            # 4. 计算分页
-            import math
-            total_pages = math.ceil(total / per_page) if total > 0 else 1
-            if page < 1:
-                page = 1
-            if page > total_pages and total_pages > 0:
-                page = total_pages
-            
-            offset = (page - 1) * per_page
+            # 3. 获取总数 (无搜索时取统计缓存, 有搜索时短时缓存)
+            if search:
+                total = search_count_cache.get(search)
+                if total is None:
+                    count_result = await db_session.execute(
+                        select(func.count(RedemptionCode.id)).where(self._code_search_filter(search))
+                    )
+                    total = count_result.scalar() or 0
+                    search_count_cache.set(search, total)
+            else:
+                total = (await stats_service.get_code_stats(db_session))["total"]
 
-            # 5. 查询分页数据
-            stmt = stmt.limit(per_page).offset(offset)
-            result = await db_session.execute(stmt)
-            codes = result.scalars().all()
+            # 4. 游标分页查询
+            page_result = await keyset_paginate(db_session, stmt, RedemptionCode, total, per_page, cursor)
 
             # 构建返回数据
             code_list = []
-            for code in codes:
+            for code in page_result["items"]:
                 code_list.append({
                     "id": code.id,
                     "code": code.code,
@@ -462,14 +563,16 @@ class RedemptionService:
                     "warranty_expires_at": code.warranty_expires_at.isoformat() if code.warranty_expires_at else None
                 })
 
-            logger.info(f"获取所有兑换码成功: 第 {page} 页, 共 {len(code_list)} 个 / 总数 {total}")
+            logger.info(f"获取所有兑换码成功: 第 {page_result['current_page']} 页, 共 {len(code_list)} 个 / 总数 {total}")
 
             return {
                 "success": True,
                 "codes": code_list,
                 "total": total,
-                "total_pages": total_pages,
-                "current_page": page,
+                "total_pages": page_result["total_pages"],
+                "current_page": page_result["current_page"],
+                "next_cursor": page_result["next_cursor"],
+                "prev_cursor": page_result["prev_cursor"],
                 "error": None
             }
 
@@ -482,6 +585,65 @@ class RedemptionService:
                 "error": f"获取所有兑换码失败: {str(e)}"
             }
 
+    @staticmethod
+    def _record_filter(column: str, term: str):
+        """兑换记录单列的模糊搜索条件, 优先走全文索引"""
+        indexed = search_index_service.match(RedemptionRecord, term, column=column)
+        if indexed is not None:
+            return indexed
+        return getattr(RedemptionRecord, column).ilike(f"%{term}%")
+
+    @staticmethod
+    def _code_search_filter(search: str):
+        """兑换码列表的搜索条件 (兑换码或邮箱), 优先走全文索引"""
+        indexed = search_index_service.match(RedemptionCode, search)
+        if indexed is not None:
+            return indexed
+        return or_(
+            RedemptionCode.code.ilike(f"%{search}%"),
+            RedemptionCode.used_by_email.ilike(f"%{search}%")
+        )
+
+    async def iter_codes_for_export(
+        self,
+        db_session: AsyncSession,
+        search: Optional[str] = None,
+        chunk_size: int = 2000,
+        created_at: Optional[datetime] = None
+    ) -> AsyncIterator[Sequence[Row]]:
+        """
+        分块流式读取待导出的兑换码, 不一次性加载全部数据
+
+        Args:
+            db_session: 数据库会话
+            search: 搜索关键词 (兑换码或邮箱)
+            chunk_size: 每块行数
+            created_at: 只导出该创建时间的兑换码 (同一次批量生成的兑换码创建时间相同)
+
+        Yields:
+            每块的行列表 (code, status, created_at, expires_at, used_by_email,
+            used_at, has_warranty, warranty_days)
+        """
+        stmt = select(
+            RedemptionCode.code,
+            RedemptionCode.status,
+            RedemptionCode.created_at,
+            RedemptionCode.expires_at,
+            RedemptionCode.used_by_email,
+            RedemptionCode.used_at,
+            RedemptionCode.has_warranty,
+            RedemptionCode.warranty_days
+        ).order_by(RedemptionCode.created_at.desc())
+
+        if search:
+            stmt = stmt.where(self._code_search_filter(search))
+        if created_at is not None:
+            stmt = stmt.where(RedemptionCode.created_at == created_at)
+
+        result = await db_session.stream(stmt.execution_options(yield_per=chunk_size))
+        async for rows in result.partitions():
+            yield rows
+
     async def get_code_by_code(
         self,
         code: str,
@@ -607,9 +769,9 @@ class RedemptionService:
             # 添加筛选条件
             filters = []
             if email:
-                filters.append(RedemptionRecord.email.ilike(f"%{email}%"))
+                filters.append(self._record_filter("email", email))
             if code:
-                filters.append(RedemptionRecord.code.ilike(f"%{code}%"))
+                filters.append(self._record_filter("code", code))
             if team_id:
                 filters.append(RedemptionRecord.team_id == team_id)
                 
@@ -651,6 +813,124 @@ class RedemptionService:
                 "error": f"获取所有兑换记录失败: {str(e)}"
             }
 
+    async def get_records_page(
+        self,
+        db_session: AsyncSession,
+        email: Optional[str] = None,
+        code: Optional[str] = None,
+        team_id: Optional[int] = None,
+        start_date: Optional[date] = None,
+        end_date: Optional[date] = None,
+        page: int = 1,
+        per_page: int = 20
+    ) -> Dict[str, Any]:
+        """
+        分页获取兑换记录及统计 (筛选、统计、分页均在数据库中完成)
+
+        Args:
+            db_session: 数据库会话
+            email: 邮箱模糊搜索
+            code: 兑换码模糊搜索
+            team_id: Team ID 筛选
+            start_date: 开始日期 (含)
+            end_date: 结束日期 (含)
+            page: 页码
+            per_page: 每页数量
+
+        Returns:
+            结果字典,包含 success, records, stats, total, total_pages, current_page, error
+        """
+        try:
+            filters = []
+            if email:
+                filters.append(self._record_filter("email", email))
+            if code:
+                filters.append(self._record_filter("code", code))
+            if team_id:
+                filters.append(RedemptionRecord.team_id == team_id)
+            if start_date:
+                filters.append(RedemptionRecord.redeemed_at >= datetime.combine(start_date, datetime.min.time()))
+            if end_date:
+                filters.append(
+                    RedemptionRecord.redeemed_at < datetime.combine(end_date + timedelta(days=1), datetime.min.time())
+                )
+
+            # 1. 一次聚合查询得到总数和今日/本周/本月统计
+            now = get_now()
+            today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+            week_start = today_start - timedelta(days=today_start.weekday())
+            month_start = today_start.replace(day=1)
+
+            def count_since(start: datetime):
+                return func.coalesce(func.sum(case((RedemptionRecord.redeemed_at >= start, 1), else_=0)), 0)
+
+            stats_stmt = select(
+                func.count(RedemptionRecord.id),
+                count_since(today_start),
+                count_since(week_start),
+                count_since(month_start)
+            )
+            if filters:
+                stats_stmt = stats_stmt.where(and_(*filters))
+            total, today, this_week, this_month = (await db_session.execute(stats_stmt)).one()
+
+            # 2. 计算分页
+            import math
+            per_page = max(1, per_page)
+            total_pages = math.ceil(total / per_page) if total > 0 else 1
+            page = min(max(page, 1), total_pages)
+
+            # 3. 只查询当前页, 并关联 Team 名称
+            stmt = (
+                select(RedemptionRecord, Team.team_name)
+                .outerjoin(Team, Team.id == RedemptionRecord.team_id)
+                .order_by(RedemptionRecord.redeemed_at.desc(), RedemptionRecord.id.desc())
+                .limit(per_page)
+                .offset((page - 1) * per_page)
+            )
+            if filters:
+                stmt = stmt.where(and_(*filters))
+            result = await db_session.execute(stmt)
+
+            record_list = []
+            for record, team_name in result.all():
+                record_list.append({
+                    "id": record.id,
+                    "email": record.email,
+                    "code": record.code,
+                    "team_id": record.team_id,
+                    "team_name": team_name,
+                    "account_id": record.account_id,
+                    "redeemed_at": record.redeemed_at.isoformat() if record.redeemed_at else None
+                })
+
+            return {
+                "success": True,
+                "records": record_list,
+                "stats": {
+                    "total": total,
+                    "today": today,
+                    "this_week": this_week,
+                    "this_month": this_month
+                },
+                "total": total,
+                "total_pages": total_pages,
+                "current_page": page,
+                "error": None
+            }
+
+        except Exception as e:
+            logger.error(f"分页获取兑换记录失败: {e}")
+            return {
+                "success": False,
+                "records": [],
+                "stats": {"total": 0, "today": 0, "this_week": 0, "this_month": 0},
+                "total": 0,
+                "total_pages": 1,
+                "current_page": 1,
+                "error": f"分页获取兑换记录失败: {str(e)}"
+            }
+
     async def delete_code(
         self,
         code: str,
@@ -680,8 +960,11 @@ class RedemptionService:
                 }
 
             # 删除兑换码
+            previous_status = redemption_code.status
             await db_session.delete(redemption_code)
             await db_session.commit()
+            stats_service.code_transition(previous_status, None)
+            await code_lookup_filter.mark_deleted(db_session)
 
             logger.info(f"删除兑换码成功: {code}")
 
@@ -756,6 +1039,7 @@ class RedemptionService:
 
             # 3. 恢复兑换码状态
             code = record.redemption_code
+            previous_status = code.status if code else None
             if code:
                 # 如果是质保兑换，且还有其他记录，状态可能不应该直接回 unused
                 # 但根据逻辑，目前一个码一个记录（除了质保补发可能产生新记录，但那是两个不同的码吧？）
@@ -771,6 +1055,8 @@ class RedemptionService:
             # 4. 删除使用记录
             await db_session.delete(record)
             await db_session.commit()
+            if code:
+                stats_service.code_transition(previous_status, "unused")
 
             logger.info(f"撤回记录成功: {record_id}, 邮箱: {record.email}, 兑换码: {record.code}")
 
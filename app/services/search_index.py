@@ -0,0 +1,193 @@
+"""
+全文搜索索引服务
+为管理员搜索框维护 SQLite FTS5 trigram 影子表, 由触发器与业务表保持同步,
+子串搜索走索引而不是 ilike '%term%' 全表扫描;
+PostgreSQL 在搜索列上建立 pg_trgm GIN 索引, ilike 本身即可走索引
+"""
+import logging
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import bindparam, literal_column, select, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.sql.elements import ColumnElement
+
+logger = logging.getLogger(__name__)
+
+
+# 业务表 -> 需要索引的列
+SEARCH_INDEXES: Dict[str, Tuple[str, ...]] = {
+    "teams": ("email", "account_id", "team_name"),
+    "redemption_codes": ("code", "used_by_email"),
+    "redemption_records": ("email", "code"),
+}
+
+# trigram 分词器按 3 个字符切分, 更短的搜索词无法使用索引
+MIN_TERM_LENGTH = 3
+
+
+def _fts_table(table_name: str) -> str:
+    return f"{table_name}_fts"
+
+
+class SearchIndexService:
+    """全文搜索索引服务类"""
+
+    def __init__(self):
+        # 迁移确认影子表可用后才启用, 否则搜索回退到 ilike
+        self.enabled = False
+
+    def ensure_indexes(self, conn: Connection) -> list:
+        """
+        创建缺失的 FTS5 影子表和同步触发器, 并用现有数据填充 (PostgreSQL 创建 pg_trgm 索引)
+
+        Args:
+            conn: 数据库连接 (在迁移事务中调用)
+
+        Returns:
+            新创建的影子表 (或索引) 名称列表
+        """
+        if conn.dialect.name != "sqlite":
+            return self._ensure_trigram_indexes(conn)
+
+        try:
+            with conn.begin_nested():
+                conn.exec_driver_sql("CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(x, tokenize='trigram')")
+                conn.exec_driver_sql("DROP TABLE temp.fts5_probe")
+        except DBAPIError as e:
+            version = ".".join(str(part) for part in conn.dialect.server_version_info)
+            logger.warning(f"SQLite 不支持 FTS5 trigram ({version}), 搜索使用 ilike: {e}")
+            self.enabled = False
+            return []
+
+        created = []
+        for table_name, columns in SEARCH_INDEXES.items():
+            fts = _fts_table(table_name)
+            exists = conn.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+                {"name": fts}
+            ).first()
+            if exists:
+                continue
+
+            cols = ", ".join(columns)
+            new_values = ", ".join(f"new.{c}" for c in columns)
+            old_values = ", ".join(f"old.{c}" for c in columns)
+
+            logger.info(f"创建全文搜索索引 {fts} ({cols})")
+            conn.exec_driver_sql(f"""
+                CREATE VIRTUAL TABLE {fts} USING fts5(
+                    {cols}, content='{table_name}', content_rowid='id', tokenize='trigram'
+                )
+            """)
+            conn.exec_driver_sql(f"""
+                CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table_name} BEGIN
+                    INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_values});
+                END
+            """)
+            conn.exec_driver_sql(f"""
+                CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table_name} BEGIN
+                    INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_values});
+                END
+            """)
+            conn.exec_driver_sql(f"""
+                CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {cols} ON {table_name} BEGIN
+                    INSERT INTO {fts}({fts}, rowid, {cols}) VALUES ('delete', old.id, {old_values});
+                    INSERT INTO {fts}(rowid, {cols}) VALUES (new.id, {new_values});
+                END
+            """)
+            conn.exec_driver_sql(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+            created.append(fts)
+
+        self.enabled = True
+        return created
+
+    def _ensure_trigram_indexes(self, conn: Connection) -> list:
+        """
+        PostgreSQL: 启用 pg_trgm 扩展并在搜索列上创建 GIN 索引
+
+        ilike '%term%' 可以直接使用 gin_trgm_ops 索引, 不需要影子表, 因此 match() 保持禁用,
+        调用方的 ilike 回退即走索引; 扩展不可用 (如没有 CREATE 权限) 时只记录警告
+
+        Args:
+            conn: 数据库连接 (在迁移事务中调用)
+
+        Returns:
+            新创建的索引名称列表
+        """
+        from app.db_migrations import create_index, index_exists
+
+        self.enabled = False
+        try:
+            with conn.begin_nested():
+                conn.exec_driver_sql("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        except DBAPIError as e:
+            logger.warning(f"无法启用 pg_trgm 扩展, 搜索使用无索引的 ilike: {e}")
+            return []
+
+        created = []
+        for table_name, columns in SEARCH_INDEXES.items():
+            for column in columns:
+                index_name = f"idx_{table_name}_{column}_trgm"
+                if index_exists(conn, index_name):
+                    continue
+                create_index(conn, index_name, table_name, f"{column} gin_trgm_ops", using="gin")
+                created.append(index_name)
+        return created
+
+    def detect(self, conn: Connection) -> bool:
+        """
+        检查影子表是否都已存在, 据此启用或禁用全文搜索 (迁移完成后调用)
+
+        Args:
+            conn: 数据库连接
+
+        Returns:
+            全文搜索是否可用 (PostgreSQL 始终为 False, 搜索使用 ilike + pg_trgm 索引)
+        """
+        if conn.dialect.name != "sqlite":
+            self.enabled = False
+            return False
+
+        names = [_fts_table(table_name) for table_name in SEARCH_INDEXES]
+        count = conn.execute(
+            text("SELECT COUNT(*) FROM sqlite_master WHERE type = 'table' AND name IN :names")
+            .bindparams(bindparam("names", expanding=True)),
+            {"names": names}
+        ).scalar()
+        self.enabled = count == len(names)
+        if not self.enabled:
+            logger.info("全文搜索影子表不完整, 搜索使用 ilike")
+        return self.enabled
+
+    def match(self, model, term: Optional[str], column: Optional[str] = None) -> Optional[ColumnElement]:
+        """
+        构建走全文索引的子串搜索条件
+
+        Args:
+            model: 业务模型 (Team / RedemptionCode / RedemptionRecord)
+            term: 搜索词
+            column: 只在指定列中搜索, 默认搜索所有索引列
+
+        Returns:
+            model.id IN (...) 条件; 索引不可用或搜索词过短时返回 None, 调用方应回退到 ilike
+        """
+        term = (term or "").strip()
+        table_name = model.__tablename__
+        if not self.enabled or table_name not in SEARCH_INDEXES or len(term) < MIN_TERM_LENGTH:
+            return None
+
+        # 作为短语查询, 双引号转义后不会被解析为 FTS5 语法
+        query = '"' + term.replace('"', '""') + '"'
+        if column:
+            query = f"{column} : {query}"
+
+        fts = _fts_table(table_name)
+        ids = select(literal_column("rowid")).select_from(text(fts)).where(
+            literal_column(fts).op("MATCH")(query)
+        )
+        return model.id.in_(ids)
+
+
+# 创建全局实例
+search_index_service = SearchIndexService()
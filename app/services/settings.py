@@ -1,11 +1,22 @@
 """
 系统设置服务
 管理系统配置的读取、更新和缓存
+
+settings 表很小, 每个进程缓存整张表; 每次写入设置时在同一事务中递增 settings_generation
+单行计数器, 并把新代数写入被修改的行。多 worker 部署时各进程最多每
+settings_cache_sync_interval 秒读取一次计数器, 代数变化时只重新加载代数更大的行,
+get_setting 平时不查询数据库
 """
-from typing import Optional, Dict, Any
+import time
+from functools import partial
+from typing import Optional, Dict, Any, Iterable
 from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.models import Setting
+from app.config import settings as app_settings
+from app.database import dialect_insert
+from app.db_writer import db_writer
+from app.models import Setting, SettingsGeneration
+from app.utils.time_utils import get_now
 import logging
 
 logger = logging.getLogger(__name__)
@@ -14,12 +25,82 @@ DEFAULT_CF_REFRESH_INTERVAL_MINUTES = 120
 MIN_CF_REFRESH_INTERVAL_MINUTES = 30
 MAX_CF_REFRESH_INTERVAL_MINUTES = 1440
 
+# settings_generation 表中计数器所在行的主键
+GENERATION_ROW_ID = 1
+
 
 class SettingsService:
     """系统设置服务类"""
 
-    def __init__(self):
+    def __init__(self, sync_interval: float = 1.0):
+        """
+        Args:
+            sync_interval: 检查设置代数的最小间隔 (秒)
+        """
+        self.sync_interval = max(0.0, float(sync_interval))
         self._cache: Dict[str, str] = {}
+        self._loaded = False
+        # 缓存已包含的设置代数
+        self._generation = 0
+        self._checked_at = 0.0
+
+    @staticmethod
+    async def _read_generation(session: AsyncSession) -> int:
+        """读取当前设置代数 (从未写入过设置时为 0)"""
+        result = await session.execute(
+            select(SettingsGeneration.generation).where(SettingsGeneration.id == GENERATION_ROW_ID)
+        )
+        return result.scalar_one_or_none() or 0
+
+    async def _sync(self, session: AsyncSession, force: bool = False):
+        """
+        按设置代数同步缓存
+
+        首次调用加载整张表; 之后最多每 sync_interval 秒读取一次代数计数器,
+        有新写入时只加载代数大于缓存代数的行。计数器在写入事务中加行锁递增,
+        写入按代数顺序提交, 不会出现晚提交的修改代数更小而被跳过的情况
+
+        Args:
+            session: 数据库会话
+            force: 忽略检查间隔立即检查
+        """
+        now = time.monotonic()
+        if self._loaded and not force and now - self._checked_at < self.sync_interval:
+            return
+        # 先记录检查时间, 并发请求在本次检查期间直接使用现有缓存
+        self._checked_at = now
+
+        if not self._loaded:
+            await self._load_all(session)
+            return
+
+        generation = await self._read_generation(session)
+        if generation == self._generation:
+            return
+        if generation < self._generation:
+            # 计数器变小说明数据库被重建, 重新加载整张表
+            await self._load_all(session)
+            return
+
+        result = await session.execute(
+            select(Setting.key, Setting.value).where(Setting.generation > self._generation)
+        )
+        changed = {key: value for key, value in result.all()}
+        self._cache.update(changed)
+        self._generation = generation
+
+        logger.debug(f"配置缓存已同步到第 {generation} 代, 更新 {len(changed)} 个配置项")
+
+    async def _load_all(self, session: AsyncSession) -> Dict[str, str]:
+        """加载整张配置表并记录设置代数"""
+        # 先读代数再读表, 读到的行至少包含该代数之前的全部写入
+        generation = await self._read_generation(session)
+        result = await session.execute(select(Setting.key, Setting.value))
+
+        self._cache = {key: value for key, value in result.all()}
+        self._generation = generation
+        self._loaded = True
+        return dict(self._cache)
 
     async def get_setting(self, session: AsyncSession, key: str, default: Optional[str] = None) -> Optional[str]:
         """
@@ -33,21 +114,32 @@ class SettingsService:
         Returns:
             配置项值,如果不存在则返回默认值
         """
-        # 先从缓存获取
+        await self._sync(session)
+
+        # 缓存是整张表的快照, 缓存中没有即数据库中没有
         if key in self._cache:
             return self._cache[key]
+        return default
 
-        # 从数据库获取
-        result = await session.execute(
-            select(Setting).where(Setting.key == key)
-        )
-        setting = result.scalar_one_or_none()
+    async def get_settings(
+        self,
+        session: AsyncSession,
+        keys: Iterable[str],
+        default: Optional[str] = None
+    ) -> Dict[str, Optional[str]]:
+        """
+        批量获取配置项 (只做一次缓存同步检查)
 
-        if setting:
-            self._cache[key] = setting.value
-            return setting.value
+        Args:
+            session: 数据库会话
+            keys: 配置项键名
+            default: 不存在的配置项的默认值
 
-        return default
+        Returns:
+            键名 -> 配置项值 的字典
+        """
+        await self._sync(session)
+        return {key: self._cache.get(key, default) for key in keys}
 
     async def get_all_settings(self, session: AsyncSession) -> Dict[str, str]:
         """
@@ -59,13 +151,8 @@ class SettingsService:
         Returns:
             配置项字典
         """
-        result = await session.execute(select(Setting))
-        settings = result.scalars().all()
-
-        settings_dict = {s.key: s.value for s in settings}
-        self._cache.update(settings_dict)
-
-        return settings_dict
+        self._checked_at = time.monotonic()
+        return await self._load_all(session)
 
     async def update_setting(self, session: AsyncSession, key: str, value: str) -> bool:
         """
@@ -80,18 +167,7 @@ class SettingsService:
             是否更新成功
         """
         try:
-            result = await session.execute(
-                select(Setting).where(Setting.key == key)
-            )
-            setting = result.scalar_one_or_none()
-
-            if setting:
-                setting.value = value
-            else:
-                setting = Setting(key=key, value=value)
-                session.add(setting)
-
-            await session.commit()
+            await db_writer.run(partial(self._write_settings, settings={key: value}), label="settings")
 
             # 更新缓存
             self._cache[key] = value
@@ -101,7 +177,6 @@ class SettingsService:
 
         except Exception as e:
             logger.error(f"更新配置项 {key} 失败: {e}")
-            await session.rollback()
             return False
 
     async def update_settings(self, session: AsyncSession, settings: Dict[str, str]) -> bool:
@@ -116,19 +191,7 @@ class SettingsService:
             是否更新成功
         """
         try:
-            for key, value in settings.items():
-                result = await session.execute(
-                    select(Setting).where(Setting.key == key)
-                )
-                setting = result.scalar_one_or_none()
-
-                if setting:
-                    setting.value = value
-                else:
-                    setting = Setting(key=key, value=value)
-                    session.add(setting)
-
-            await session.commit()
+            await db_writer.run(partial(self._write_settings, settings=settings), label="settings")
 
             # 更新缓存
             self._cache.update(settings)
@@ -138,12 +201,47 @@ class SettingsService:
 
         except Exception as e:
             logger.error(f"批量更新配置项失败: {e}")
-            await session.rollback()
             return False
 
+    @staticmethod
+    async def _write_settings(session: AsyncSession, settings: Dict[str, str]):
+        """
+        写入配置项, 不存在时新建 (写入单元, 由 db_writer 执行)
+
+        先递增设置代数 (计数器行锁持有到提交, 并发写入按代数顺序提交), 再用一条多行
+        INSERT ... ON CONFLICT (key) DO UPDATE 写入配置项并标记新代数;
+        upsert 不会触发 onupdate, updated_at 显式写入
+        """
+        if not settings:
+            return
+
+        counter = dialect_insert(SettingsGeneration).values(id=GENERATION_ROW_ID, generation=1)
+        counter = counter.on_conflict_do_update(
+            index_elements=[SettingsGeneration.id],
+            set_={"generation": SettingsGeneration.generation + 1}
+        ).returning(SettingsGeneration.generation)
+        generation = (await session.execute(counter)).scalar_one()
+
+        now = get_now()
+        stmt = dialect_insert(Setting).values([
+            {"key": key, "value": value, "created_at": now, "updated_at": now, "generation": generation}
+            for key, value in settings.items()
+        ])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[Setting.key],
+            set_={
+                "value": stmt.excluded.value,
+                "updated_at": stmt.excluded.updated_at,
+                "generation": stmt.excluded.generation,
+            }
+        )
+        await session.execute(stmt)
+
     def clear_cache(self):
-        """清空缓存"""
+        """清空缓存, 下次读取时重新加载整张表"""
         self._cache.clear()
+        self._loaded = False
+        self._generation = 0
         logger.info("配置缓存已清空")
 
     async def get_proxy_config(self, session: AsyncSession) -> Dict[str, str]:
@@ -153,12 +251,11 @@ class SettingsService:
         Returns:
             代理配置字典
         """
-        proxy_enabled = await self.get_setting(session, "proxy_enabled", "false")
-        proxy = await self.get_setting(session, "proxy", "")
+        values = await self.get_settings(session, ("proxy_enabled", "proxy"))
 
         return {
-            "enabled": proxy_enabled.lower() == "true",
-            "proxy": proxy
+            "enabled": (values["proxy_enabled"] or "false").lower() == "true",
+            "proxy": values["proxy"] or ""
         }
 
     async def update_proxy_config(
@@ -192,13 +289,13 @@ class SettingsService:
         Returns:
             FlareSolverr 配置字典
         """
-        enabled_raw = await self.get_setting(session, "flaresolverr_enabled", "false")
-        url_raw = await self.get_setting(session, "flaresolverr_url", "")
-        interval_raw = await self.get_setting(
+        values = await self.get_settings(
             session,
-            "cf_clearance_refresh_interval",
-            str(DEFAULT_CF_REFRESH_INTERVAL_MINUTES),
+            ("flaresolverr_enabled", "flaresolverr_url", "cf_clearance_refresh_interval"),
         )
+        enabled_raw = values["flaresolverr_enabled"] or "false"
+        url_raw = values["flaresolverr_url"] or ""
+        interval_raw = values["cf_clearance_refresh_interval"] or str(DEFAULT_CF_REFRESH_INTERVAL_MINUTES)
 
         try:
             interval_minutes = int(str(interval_raw).strip() or DEFAULT_CF_REFRESH_INTERVAL_MINUTES)
@@ -254,18 +351,20 @@ class SettingsService:
         Returns:
             运行状态字典
         """
-        last_status = await self.get_setting(session, "flaresolverr_last_status", "idle")
-        last_error = await self.get_setting(session, "flaresolverr_last_error", "")
-        last_attempt_at = await self.get_setting(session, "flaresolverr_last_attempt_at", "")
-        last_success_at = await self.get_setting(session, "flaresolverr_last_success_at", "")
-        last_trigger_reason = await self.get_setting(session, "flaresolverr_last_trigger_reason", "")
+        values = await self.get_settings(session, (
+            "flaresolverr_last_status",
+            "flaresolverr_last_error",
+            "flaresolverr_last_attempt_at",
+            "flaresolverr_last_success_at",
+            "flaresolverr_last_trigger_reason",
+        ))
 
         return {
-            "last_status": (last_status or "idle").strip() or "idle",
-            "last_error": (last_error or "").strip() or None,
-            "last_attempt_at": (last_attempt_at or "").strip() or None,
-            "last_success_at": (last_success_at or "").strip() or None,
-            "last_trigger_reason": (last_trigger_reason or "").strip() or None,
+            "last_status": (values["flaresolverr_last_status"] or "idle").strip() or "idle",
+            "last_error": (values["flaresolverr_last_error"] or "").strip() or None,
+            "last_attempt_at": (values["flaresolverr_last_attempt_at"] or "").strip() or None,
+            "last_success_at": (values["flaresolverr_last_success_at"] or "").strip() or None,
+            "last_trigger_reason": (values["flaresolverr_last_trigger_reason"] or "").strip() or None,
         }
 
     async def set_flaresolverr_runtime_status(
@@ -335,9 +434,6 @@ class SettingsService:
         )
         setting = result.scalar_one_or_none()
 
-        if setting and setting.value:
-            self._cache["cf_clearance"] = setting.value
-
         configured = bool(setting and setting.value and setting.value.strip())
         updated_at = setting.updated_at.isoformat() if setting and setting.updated_at else None
 
@@ -346,6 +442,37 @@ class SettingsService:
             "updated_at": updated_at
         }
 
+    async def get_team_placement_strategy(self, session: AsyncSession) -> str:
+        """
+        获取自动分配 Team 的策略名称
+
+        Returns:
+            策略名称, 未配置或无效时返回默认策略
+        """
+        from app.services.team_placement import get_placement_strategy
+
+        value = await self.get_setting(session, "team_placement_strategy", "")
+        return get_placement_strategy(value).name
+
+    async def update_team_placement_strategy(self, session: AsyncSession, strategy: str) -> bool:
+        """
+        更新自动分配 Team 的策略
+
+        Args:
+            session: 数据库会话
+            strategy: 策略名称
+
+        Returns:
+            是否更新成功
+        """
+        from app.services.team_placement import PLACEMENT_STRATEGIES
+
+        if strategy not in PLACEMENT_STRATEGIES:
+            logger.error(f"无效的 Team 分配策略: {strategy}")
+            return False
+
+        return await self.update_setting(session, "team_placement_strategy", strategy)
+
     async def get_log_level(self, session: AsyncSession) -> str:
         """
         获取日志级别
@@ -382,4 +509,4 @@ class SettingsService:
 
 
 # 创建全局实例
-settings_service = SettingsService()
+settings_service = SettingsService(sync_interval=app_settings.settings_cache_sync_interval)
@@ -0,0 +1,133 @@
+"""
+统计服务
+用分组聚合查询统计 Team 和兑换码的状态数量, 结果短时间缓存, 写入时增量更新
+"""
+import logging
+from typing import Dict, Optional
+
+from sqlalchemy import case, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import RedemptionCode, Team
+from app.utils.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+
+CODE_STATUSES = ("unused", "used", "expired", "warranty_active")
+TEAM_STATUSES = ("active", "full", "expired", "error", "banned")
+
+
+class StatsService:
+    """
+    统计服务类
+
+    - 兑换码: 按 status 分组计数; 生成/兑换/回退/删除时按状态变化增量调整缓存
+    - Team: 按 status 分组计数并统计可用 Team 数; 成员数变化点较多,
+      Team 变更提交后直接使缓存失效, 下次读取重新聚合
+    - 缓存超过 CACHE_TTL_SECONDS 后重新查询, 多 worker 部署时各进程的偏差不会长期存在
+    """
+
+    CACHE_TTL_SECONDS = 30.0
+    CODES_KEY = "codes"
+    TEAMS_KEY = "teams"
+
+    def __init__(self):
+        self._cache = TTLCache(ttl=self.CACHE_TTL_SECONDS, maxsize=2)
+
+    async def get_code_stats(self, db_session: AsyncSession) -> Dict[str, int]:
+        """
+        获取兑换码状态统计
+
+        Args:
+            db_session: 数据库会话
+
+        Returns:
+            包含 total 及各状态数量的字典
+        """
+        counts = self._cache.get(self.CODES_KEY)
+        if counts is None:
+            stmt = select(RedemptionCode.status, func.count(RedemptionCode.id)).group_by(RedemptionCode.status)
+            result = await db_session.execute(stmt)
+            counts = {status: 0 for status in CODE_STATUSES}
+            for status, count in result.all():
+                counts[status or "unused"] = counts.get(status or "unused", 0) + count
+            self._cache.set(self.CODES_KEY, counts)
+
+        stats = dict(counts)
+        stats["total"] = sum(counts.values())
+        return stats
+
+    async def get_team_stats(self, db_session: AsyncSession) -> Dict[str, int]:
+        """
+        获取 Team 状态统计
+
+        Args:
+            db_session: 数据库会话
+
+        Returns:
+            包含 total, available (active 且未满) 及各状态数量的字典
+        """
+        counts = self._cache.get(self.TEAMS_KEY)
+        if counts is None:
+            # 聚合期间 Team 变更提交会使缓存失效, 此时不写入可能已过期的结果
+            generation = self._cache.generation
+            stmt = select(
+                Team.status,
+                func.count(Team.id),
+                func.sum(case((Team.current_members < Team.max_members, 1), else_=0))
+            ).group_by(Team.status)
+            result = await db_session.execute(stmt)
+            counts = {status: 0 for status in TEAM_STATUSES}
+            available = 0
+            for status, count, not_full in result.all():
+                counts[status] = counts.get(status, 0) + count
+                if status == "active":
+                    available = int(not_full or 0)
+            counts["total"] = sum(counts.values())
+            counts["available"] = available
+            self._cache.set(self.TEAMS_KEY, counts, generation=generation)
+
+        return dict(counts)
+
+    def bump_codes(self, **deltas: int):
+        """
+        按状态增量调整兑换码计数 (在对应写入提交后调用)
+
+        Args:
+            **deltas: 状态 -> 变化量, 如 bump_codes(unused=-1, used=1)
+        """
+        counts = self._cache.get(self.CODES_KEY)
+        if counts is None:
+            return
+        for status, delta in deltas.items():
+            counts[status] = max(0, counts.get(status, 0) + delta)
+
+    def code_transition(self, old_status: Optional[str], new_status: Optional[str]):
+        """
+        记录单个兑换码的状态变化
+
+        Args:
+            old_status: 原状态, None 表示新建
+            new_status: 新状态, None 表示删除
+        """
+        if old_status == new_status:
+            return
+        deltas: Dict[str, int] = {}
+        if old_status:
+            deltas[old_status] = -1
+        if new_status:
+            deltas[new_status] = deltas.get(new_status, 0) + 1
+        self.bump_codes(**deltas)
+
+    def invalidate_codes(self):
+        """使兑换码统计缓存失效"""
+        self._cache.delete(self.CODES_KEY)
+
+    def invalidate_teams(self):
+        """使 Team 统计缓存失效"""
+        self._cache.delete(self.TEAMS_KEY)
+
+
+# 创建全局实例
+stats_service = StatsService()
@@ -1,40 +1,100 @@
+import asyncio
 import json
 import os
+import tempfile
+import time
 import aiofiles
-from typing import Any, Dict
+from typing import Any, Dict, Optional, Tuple
 
 SETTINGS_FILE = "data/settings.json"
 
+# 检查文件是否被其他 worker 修改的最小间隔 (秒)
+CHECK_INTERVAL = 1.0
+
+
+def _file_signature() -> Optional[Tuple[int, int]]:
+    try:
+        stat = os.stat(SETTINGS_FILE)
+    except FileNotFoundError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def _write_file(content: str):
+    # 先写同目录临时文件再替换, 其他 worker 读到的要么是旧文件要么是完整的新文件
+    directory = os.path.dirname(SETTINGS_FILE) or "."
+    fd, tmp_path = tempfile.mkstemp(prefix=".settings.", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        # mkstemp 创建的文件权限为 0600, 恢复为普通文件权限
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, SETTINGS_FILE)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
 class SystemSettingsService:
     def __init__(self):
         self._cache: Dict[str, Any] = {}
+        # 空字典也是有效配置, 是否已加载单独记录
+        self._loaded = False
+        self._signature: Optional[Tuple[int, int]] = None
+        self._checked_at = 0.0
+        self._write_lock = asyncio.Lock()
         self._ensure_file_exists()
 
     def _ensure_file_exists(self):
         if not os.path.exists("data"):
             os.makedirs("data")
         if not os.path.exists(SETTINGS_FILE):
-            with open(SETTINGS_FILE, "w", encoding="utf-8") as f:
-                json.dump({}, f)
-
-    async def _load_settings(self):
-        if not self._cache:
-            try:
-                async with aiofiles.open(SETTINGS_FILE, "r", encoding="utf-8") as f:
-                    content = await f.read()
-                    self._cache = json.loads(content) if content else {}
-            except Exception as e:
-                print(f"Error loading settings: {e}")
+            _write_file(json.dumps({}))
+
+    async def _load_settings(self, force: bool = False):
+        now = time.monotonic()
+        if self._loaded and not force and now - self._checked_at < CHECK_INTERVAL:
+            return
+        self._checked_at = now
+
+        signature = _file_signature()
+        if self._loaded and signature == self._signature:
+            return
+
+        try:
+            async with aiofiles.open(SETTINGS_FILE, "r", encoding="utf-8") as f:
+                content = await f.read()
+                self._cache = json.loads(content) if content else {}
+        except FileNotFoundError:
+            self._cache = {}
+        except Exception as e:
+            # 保留已加载的配置, 文件再次变化时重试
+            print(f"Error loading settings: {e}")
+            if not self._loaded:
                 self._cache = {}
+        self._signature = signature
+        self._loaded = True
 
     async def get_setting(self, key: str, default: Any = None) -> Any:
         await self._load_settings()
         return self._cache.get(key, default)
 
     async def set_setting(self, key: str, value: Any):
-        await self._load_settings()
-        self._cache[key] = value
-        async with aiofiles.open(SETTINGS_FILE, "w", encoding="utf-8") as f:
-            await f.write(json.dumps(self._cache, indent=2, ensure_ascii=False))
+        async with self._write_lock:
+            # 写入前确认读到的是最新文件, 不覆盖其他 worker 刚写入的配置
+            await self._load_settings(force=True)
+            settings = dict(self._cache)
+            settings[key] = value
+            await asyncio.to_thread(
+                _write_file, json.dumps(settings, indent=2, ensure_ascii=False)
+            )
+            self._cache = settings
+            self._signature = _file_signature()
+            self._checked_at = time.monotonic()
 
 system_settings_service = SystemSettingsService()
@@ -5,19 +5,59 @@ Team 管理服务
 import logging
 from typing import Optional, Dict, Any, List
 from datetime import datetime
-from sqlalchemy import select, update, delete, func
+from itertools import chain
+from sqlalchemy import case, select, update, delete, func, event
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
+from sqlalchemy.orm import Session, selectinload
+from sqlalchemy.orm.attributes import set_committed_value
 
+from app.config import settings
+from app.db_writer import db_writer
 from app.models import Team, TeamAccount
 from app.services.chatgpt import ChatGPTService
 from app.services.encryption import encryption_service
+from app.services.search_index import search_index_service
+from app.services.stats import stats_service
+from app.services.upstream_scheduler import PRIORITY_BACKGROUND, upstream_priority
 from app.utils.token_parser import TokenParser
 from app.utils.jwt_parser import JWTParser
+from app.utils.cache import TTLCache
+from app.utils.pagination import keyset_paginate
 from app.utils.time_utils import get_now
 
 logger = logging.getLogger(__name__)
 
+# 兑换页可用 Team 列表的微缓存: 同一时刻所有用户看到的列表相同, 无需每次重新查询和序列化
+AVAILABLE_TEAMS_CACHE_KEY = "available_teams"
+available_teams_cache = TTLCache(
+    ttl=max(1.0, min(5.0, settings.available_teams_cache_ttl)),
+    maxsize=1
+)
+
+
+# 带搜索条件的 Team 总数缓存, 翻页时不必每次重新 count
+search_count_cache = TTLCache(ttl=30.0, maxsize=256)
+
+
+@event.listens_for(Session, "after_flush")
+def _mark_team_changes(session, flush_context):
+    """记录本次事务是否修改了 Team (席位、状态等)"""
+    if any(isinstance(obj, Team) for obj in chain(session.new, session.dirty, session.deleted)):
+        session.info["team_changed"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_available_teams(session):
+    """Team 变更提交后立即使可用 Team 列表和 Team 统计缓存失效"""
+    if session.info.pop("team_changed", False):
+        available_teams_cache.clear()
+        stats_service.invalidate_teams()
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_team_changes(session):
+    session.info.pop("team_changed", None)
+
 
 class TeamService:
     """Team 管理服务类"""
@@ -89,19 +129,23 @@ class TeamService:
                 status_desc = "失效"
                 
             logger.warning(f"检测到账号{status_desc} (code={error_code}, msg={error_msg}), 更新 Team {team.id} ({team.email}) 状态为 banned")
-            team.status = "banned"
-            await db_session.commit()
+            await self._write_team_state(team, db_session, status="banned")
             return True
 
         # 2. 判定是否为“席位已满”错误
         full_keywords = ["maximum number of seats", "reached maximum number of seats"]
         if any(kw in error_msg for kw in full_keywords):
             logger.warning(f"检测到 Team 席位已满 (msg={error_msg}), 更新 Team {team.id} ({team.email}) 状态为 full")
-            team.status = "full"
             # 修正当前成员数以防万一
-            if team.current_members < team.max_members:
-                team.current_members = team.max_members
-            await db_session.commit()
+            await self._write_team_state(
+                team,
+                db_session,
+                status="full",
+                current_members=case(
+                    (Team.current_members < Team.max_members, Team.max_members),
+                    else_=Team.current_members
+                )
+            )
             return True
 
         # 3. 判定是否为 Token 过期 (需刷新)
@@ -111,34 +155,75 @@ class TeamService:
         # 只要走到这里，说明不是封号也不是满员，统统记录错误
         logger.warning(f"Team {team.id} ({team.email}) 请求出错 (code={error_code}, msg={error_msg})")
         
-        team.error_count = (team.error_count or 0) + 1
+        # 在写锁内基于最新值累加, 并发出错时不会互相覆盖
+        # 如果错误次数达标且是 Token 问题，标记为 expired 提高可读性
+        error_count = func.coalesce(Team.error_count, 0) + 1
+        await self._write_team_state(
+            team,
+            db_session,
+            error_count=error_count,
+            status=case((error_count >= 3, "expired" if is_token_expired else "error"), else_=Team.status)
+        )
         if team.error_count >= 3:
-            # 如果错误次数达标且是 Token 问题，标记为 expired 提高可读性
             if is_token_expired:
                 logger.error(f"Team {team.id} 连续 Token 错误，标记为 expired")
-                team.status = "expired"
             else:
                 logger.error(f"Team {team.id} 连续错误 {team.error_count} 次，标记为 error")
-                team.status = "error"
         
         # 如果是 Token 过期，尝试立即刷新一次（为下次重试做准备）
         if is_token_expired:
             logger.info(f"Team {team.id} Token 过期，尝试后台刷新...")
             # 注意：此处不等待刷新结果，仅作为修复尝试
             await self.ensure_access_token(team, db_session)
-            
-        await db_session.commit()
+            if db_session.new or db_session.dirty or db_session.deleted:
+                await db_session.commit()
         return True
         
     async def _reset_error_status(self, team: Team, db_session: AsyncSession) -> None:
         """
         成功执行请求后重置错误计数并尝试从 error 状态恢复
         """
-        team.error_count = 0
         if team.status == "error":
             logger.info(f"Team {team.id} ({team.email}) 请求成功, 将状态从 error 恢复为 active")
-            team.status = "active"
-        await db_session.commit()
+        await self._write_team_state(
+            team,
+            db_session,
+            error_count=0,
+            status=case((Team.status == "error", "active"), else_=Team.status)
+        )
+
+    async def _write_team_state(self, team: Team, db_session: AsyncSession, **values) -> None:
+        """
+        通过写入队列原子更新 Team 状态字段, 并把结果同步到调用方会话中的 team 对象
+
+        调用方会话中 team 的其他未提交修改 (如刚刷新的 Token) 照常提交
+
+        Args:
+            team: Team 对象
+            db_session: 调用方的数据库会话
+            **values: 列名 -> 新值, 可以是 SQL 表达式 (在写锁内基于最新值计算)
+        """
+        team_id = team.id
+        names = list(values)
+
+        async def unit(write_session: AsyncSession):
+            result = await write_session.execute(
+                update(Team)
+                .where(Team.id == team_id)
+                .values(**values)
+                .returning(*(getattr(Team, name) for name in names))
+                .execution_options(synchronize_session=False)
+            )
+            # Core UPDATE 不经过 flush, 需手动标记以便提交后使缓存失效
+            write_session.info["team_changed"] = True
+            row = result.one_or_none()
+            return dict(zip(names, row)) if row else {}
+
+        for name, value in (await db_writer.run(unit, label=f"team_state:{team_id}")).items():
+            set_committed_value(team, name, value)
+
+        if db_session.new or db_session.dirty or db_session.deleted:
+            await db_session.commit()
 
     async def ensure_access_token(self, team: Team, db_session: AsyncSession) -> Optional[str]:
         """
@@ -676,15 +761,17 @@ class TeamService:
             failed_count = 0
 
             for i, data in enumerate(parsed_data):
-                result = await self.import_team_single(
-                    access_token=data.get("token"),
-                    db_session=db_session,
-                    email=data.get("email"),
-                    account_id=data.get("account_id"),
-                    refresh_token=data.get("refresh_token"),
-                    session_token=data.get("session_token"),
-                    client_id=data.get("client_id")
-                )
+                # 批量导入作为后台任务, 为用户兑换让出上游并发
+                with upstream_priority(PRIORITY_BACKGROUND):
+                    result = await self.import_team_single(
+                        access_token=data.get("token"),
+                        db_session=db_session,
+                        email=data.get("email"),
+                        account_id=data.get("account_id"),
+                        refresh_token=data.get("refresh_token"),
+                        session_token=data.get("session_token"),
+                        client_id=data.get("client_id")
+                    )
 
                 if result["success"]:
                     success_count += 1
@@ -981,7 +1068,8 @@ class TeamService:
             failed_count = 0
 
             for team in teams:
-                result = await self.sync_team_info(team.id, db_session)
+                with upstream_priority(PRIORITY_BACKGROUND):
+                    result = await self.sync_team_info(team.id, db_session)
 
                 if result["success"]:
                     success_count += 1
@@ -1470,6 +1558,7 @@ class TeamService:
     ) -> Dict[str, Any]:
         """
         获取可用的 Team 列表 (用于用户兑换页面)
+        结果会被短暂缓存 (1-5 秒), Team 发生变更时立即失效
 
         Args:
             db_session: 数据库会话
@@ -1477,6 +1566,16 @@ class TeamService:
         Returns:
             结果字典,包含 success, teams, error
         """
+        cached = available_teams_cache.get(AVAILABLE_TEAMS_CACHE_KEY)
+        if cached is not None:
+            return {
+                "success": True,
+                "teams": cached,
+                "error": None
+            }
+
+        # 查询期间若有 Team 变更提交, 失效钩子会递增 generation, 查询结果不再写入缓存
+        generation = available_teams_cache.generation
         try:
             # 查询 status='active' 且 current_members < max_members 的 Team
             stmt = select(Team).where(
@@ -1498,6 +1597,8 @@ class TeamService:
                     "subscription_plan": team.subscription_plan
                 })
 
+            available_teams_cache.set(AVAILABLE_TEAMS_CACHE_KEY, team_list, generation=generation)
+
             logger.info(f"获取可用 Team 列表成功: 共 {len(team_list)} 个")
 
             return {
@@ -1643,62 +1744,62 @@ class TeamService:
     async def get_all_teams(
         self,
         db_session: AsyncSession,
-        page: int = 1,
         per_page: int = 20,
-        search: Optional[str] = None
+        search: Optional[str] = None,
+        cursor: Optional[str] = None
     ) -> Dict[str, Any]:
         """
-        获取所有 Team 列表 (用于管理员页面)
+        获取所有 Team 列表 (用于管理员页面, 按创建时间倒序游标分页)
 
         Args:
             db_session: 数据库会话
-            page: 页码
             per_page: 每页数量
             search: 搜索关键词
+            cursor: 分页游标 (上一次结果中的 next_cursor/prev_cursor), 为空表示第一页
 
         Returns:
-            结果字典,包含 success, teams, total, total_pages, current_page, error
+            结果字典,包含 success, teams, total, total_pages, current_page, next_cursor, prev_cursor, error
         """
         try:
             # 1. 构建查询语句
             stmt = select(Team)
-            
+
             # 2. 如果有搜索词,添加过滤条件
             if search:
-                from sqlalchemy import or_, cast, String
-                search_filter = f"%{search}%"
-                stmt = stmt.where(
-                    or_(
+                from sqlalchemy import or_
+                indexed = search_index_service.match(Team, search)
+                if indexed is not None:
+                    conditions = [indexed]
+                else:
+                    search_filter = f"%{search}%"
+                    conditions = [
                         Team.email.ilike(search_filter),
                         Team.account_id.ilike(search_filter),
-                        Team.team_name.ilike(search_filter),
-                        cast(Team.id, String).ilike(search_filter)
+                        Team.team_name.ilike(search_filter)
+                    ]
+                # 纯数字按 ID 精确匹配, 不对 cast(id) 做模糊匹配
+                if search.strip().isdigit():
+                    conditions.append(Team.id == int(search.strip()))
+                stmt = stmt.where(or_(*conditions))
+
+            # 3. 获取总数 (无搜索时取统计缓存, 有搜索时短时缓存)
+            if search:
+                total = search_count_cache.get(search)
+                if total is None:
+                    count_result = await db_session.execute(
+                        select(func.count()).select_from(stmt.subquery())
                     )
-                )
+                    total = count_result.scalar() or 0
+                    search_count_cache.set(search, total)
+            else:
+                total = (await stats_service.get_team_stats(db_session))["total"]
 
-            # 3. 获取总数
-            count_stmt = select(func.count()).select_from(stmt.subquery())
-            count_result = await db_session.execute(count_stmt)
-            total = count_result.scalar() or 0
-
-            # 4. 计算分页
-            import math
-            total_pages = math.ceil(total / per_page) if total > 0 else 1
-            if page < 1:
-                page = 1
-            if total_pages > 0 and page > total_pages:
-                page = total_pages
-            
-            offset = (page - 1) * per_page
-
-            # 5. 查询分页数据
-            final_stmt = stmt.order_by(Team.created_at.desc()).limit(per_page).offset(offset)
-            result = await db_session.execute(final_stmt)
-            teams = result.scalars().all()
+            # 4. 游标分页查询
+            page_result = await keyset_paginate(db_session, stmt, Team, total, per_page, cursor)
 
             # 构建返回数据
             team_list = []
-            for team in teams:
+            for team in page_result["items"]:
                 team_list.append({
                     "id": team.id,
                     "email": team.email,
@@ -1714,14 +1815,16 @@ class TeamService:
                     "created_at": team.created_at.isoformat() if team.created_at else None
                 })
 
-            logger.info(f"获取所有 Team 列表成功: 第 {page} 页, 共 {len(team_list)} 个 / 总数 {total}")
+            logger.info(f"获取所有 Team 列表成功: 第 {page_result['current_page']} 页, 共 {len(team_list)} 个 / 总数 {total}")
 
             return {
                 "success": True,
                 "teams": team_list,
                 "total": total,
-                "total_pages": total_pages,
-                "current_page": page,
+                "total_pages": page_result["total_pages"],
+                "current_page": page_result["current_page"],
+                "next_cursor": page_result["next_cursor"],
+                "prev_cursor": page_result["prev_cursor"],
                 "error": None
             }
 
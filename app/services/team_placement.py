@@ -0,0 +1,149 @@
+"""
+Team 分配策略
+自动选择 Team 时使用的可插拔策略，决定候选 Team 的排序与最终选取
+"""
+import random
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional
+
+from app.models import Team
+
+DEFAULT_PLACEMENT_STRATEGY = "earliest_expiry"
+
+
+class TeamPlacementStrategy(ABC):
+    """
+    Team 分配策略基类
+
+    策略分两步工作:
+    1. order_by() 提供 SQL 排序条件, 由数据库完成候选筛选 (子类必须实现)
+    2. choose() 从至多 candidate_limit 个候选中选出最终 Team
+
+    策略在注册到 PLACEMENT_STRATEGIES 时实例化, 未实现 order_by() 的策略在导入时即报错
+    """
+
+    name: str = ""
+    label: str = ""
+    # 从数据库取回的候选数量, 大多数策略只需要排序后的第一个
+    candidate_limit: int = 1
+
+    @abstractmethod
+    def order_by(self) -> list:
+        """返回候选 Team 的 SQL 排序条件"""
+
+    def choose(self, candidates: List[Team]) -> Optional[Team]:
+        """
+        从候选列表中选出最终 Team
+
+        Args:
+            candidates: 已按 order_by() 排序的候选 Team
+
+        Returns:
+            选中的 Team, 没有候选时返回 None
+        """
+        return candidates[0] if candidates else None
+
+
+class EarliestExpiryStrategy(TeamPlacementStrategy):
+    """优先使用过期时间最早的 Team (原有默认行为)"""
+
+    name = "earliest_expiry"
+    label = "最早到期优先"
+
+    def order_by(self) -> list:
+        return [Team.expires_at.asc(), Team.id.asc()]
+
+
+class PackDensestStrategy(TeamPlacementStrategy):
+    """优先填满剩余车位最少的 Team, 尽量少开新车"""
+
+    name = "pack_densest"
+    label = "优先填满 (最满优先)"
+
+    def order_by(self) -> list:
+        return [
+            (Team.max_members - Team.current_members).asc(),
+            Team.expires_at.asc(),
+            Team.id.asc(),
+        ]
+
+
+class SpreadLeastLoadedStrategy(TeamPlacementStrategy):
+    """优先分配到当前成员最少的 Team, 均摊负载"""
+
+    name = "spread_least_loaded"
+    label = "均衡分配 (最空优先)"
+
+    def order_by(self) -> list:
+        return [
+            Team.current_members.asc(),
+            Team.expires_at.asc(),
+            Team.id.asc(),
+        ]
+
+
+class LowErrorCountStrategy(TeamPlacementStrategy):
+    """优先分配到近期报错次数最少的 Team"""
+
+    name = "low_error_count"
+    label = "低报错优先"
+
+    def order_by(self) -> list:
+        return [
+            Team.error_count.asc(),
+            Team.expires_at.asc(),
+            Team.id.asc(),
+        ]
+
+
+class WeightedRandomStrategy(TeamPlacementStrategy):
+    """
+    按剩余车位加权随机选择
+
+    并发兑换时各请求会落到不同 Team, 避免所有请求争抢同一个 Team
+    """
+
+    name = "weighted_random"
+    label = "加权随机 (按剩余车位)"
+    candidate_limit = 20
+
+    def order_by(self) -> list:
+        return [Team.expires_at.asc(), Team.id.asc()]
+
+    def choose(self, candidates: List[Team]) -> Optional[Team]:
+        if not candidates:
+            return None
+
+        weights = [
+            max(1, (team.max_members or 0) - (team.current_members or 0))
+            for team in candidates
+        ]
+        return random.choices(candidates, weights=weights, k=1)[0]
+
+
+PLACEMENT_STRATEGIES: Dict[str, TeamPlacementStrategy] = {
+    strategy.name: strategy
+    for strategy in (
+        EarliestExpiryStrategy(),
+        PackDensestStrategy(),
+        SpreadLeastLoadedStrategy(),
+        LowErrorCountStrategy(),
+        WeightedRandomStrategy(),
+    )
+}
+
+
+def get_placement_strategy(name: Optional[str]) -> TeamPlacementStrategy:
+    """
+    根据名称获取分配策略, 未知名称回退到默认策略
+
+    Args:
+        name: 策略名称
+
+    Returns:
+        分配策略实例
+    """
+    return PLACEMENT_STRATEGIES.get(
+        (name or "").strip(),
+        PLACEMENT_STRATEGIES[DEFAULT_PLACEMENT_STRATEGY]
+    )
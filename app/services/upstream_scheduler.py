@@ -0,0 +1,161 @@
+"""
+上游请求调度服务
+按优先级分配访问 ChatGPT 上游的并发名额: 用户兑换 > 管理员操作 > 后台任务
+"""
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, Dict, Iterator, List, Tuple
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+# 优先级 (数值越小越优先)
+PRIORITY_REDEEM = 0
+PRIORITY_ADMIN = 1
+PRIORITY_BACKGROUND = 2
+
+PRIORITY_NAMES = {
+    PRIORITY_REDEEM: "redeem",
+    PRIORITY_ADMIN: "admin",
+    PRIORITY_BACKGROUND: "background",
+}
+
+# 当前上下文的上游请求优先级, 未设置时视为管理员操作
+_current_priority: ContextVar[int] = ContextVar("upstream_priority", default=PRIORITY_ADMIN)
+
+
+@contextmanager
+def upstream_priority(priority: int) -> Iterator[None]:
+    """
+    在上下文内设置上游请求优先级
+
+    Args:
+        priority: PRIORITY_REDEEM / PRIORITY_ADMIN / PRIORITY_BACKGROUND
+    """
+    token = _current_priority.set(priority)
+    try:
+        yield
+    finally:
+        _current_priority.reset(token)
+
+
+def get_upstream_priority() -> int:
+    """获取当前上下文的上游请求优先级"""
+    return _current_priority.get()
+
+
+class UpstreamScheduler:
+    """
+    上游请求并发调度器
+
+    - 总并发不超过 max_concurrency, 名额释放时优先分配给高优先级等待者
+    - 管理员操作最多占用 max_concurrency - 1 个名额, 始终给兑换保留一个
+    - 后台任务平时最多占用 1/4 名额; 近期有兑换请求时只保留 1 个, 避免饿死
+    """
+
+    # 最近一次兑换请求后多久内视为兑换高峰 (秒)
+    REDEEM_ACTIVE_SECONDS = 10.0
+
+    def __init__(self, max_concurrency: int = 8):
+        self.max_concurrency = max(2, int(max_concurrency))
+        self._inflight: Dict[int, int] = {p: 0 for p in PRIORITY_NAMES}
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._last_redeem = 0.0
+        self.granted_count: Dict[int, int] = {p: 0 for p in PRIORITY_NAMES}
+        self.waited_count: Dict[int, int] = {p: 0 for p in PRIORITY_NAMES}
+
+    def _limit(self, priority: int) -> int:
+        """计算该优先级当前允许的最大并发"""
+        if priority == PRIORITY_REDEEM:
+            return self.max_concurrency
+        if priority == PRIORITY_ADMIN:
+            return self.max_concurrency - 1
+        if time.monotonic() - self._last_redeem < self.REDEEM_ACTIVE_SECONDS:
+            return 1
+        return max(1, self.max_concurrency // 4)
+
+    def _can_grant(self, priority: int) -> bool:
+        total = sum(self._inflight.values())
+        return total < self.max_concurrency and self._inflight[priority] < self._limit(priority)
+
+    def _dispatch(self):
+        """按优先级把空闲名额分配给等待者"""
+        pending = []
+        while self._waiters and sum(self._inflight.values()) < self.max_concurrency:
+            priority, seq, future = heapq.heappop(self._waiters)
+            if future.done():
+                continue
+            if self._can_grant(priority):
+                self._inflight[priority] += 1
+                self.granted_count[priority] += 1
+                future.set_result(None)
+            else:
+                pending.append((priority, seq, future))
+        for item in pending:
+            heapq.heappush(self._waiters, item)
+
+    async def acquire(self, priority: int):
+        """获取名额"""
+        if priority == PRIORITY_REDEEM:
+            self._last_redeem = time.monotonic()
+
+        # 没有同级或更高优先级的等待者时直接获取, 保证同级 FIFO
+        has_earlier = any(p <= priority and not f.done() for p, _, f in self._waiters)
+        if not has_earlier and self._can_grant(priority):
+            self._inflight[priority] += 1
+            self.granted_count[priority] += 1
+            return
+
+        self.waited_count[priority] += 1
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # 已分配名额但调用方被取消, 归还名额
+                self.release(priority)
+            raise
+
+    def release(self, priority: int):
+        """归还名额"""
+        self._inflight[priority] = max(0, self._inflight[priority] - 1)
+        self._dispatch()
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """按当前上下文的优先级占用一个上游请求名额"""
+        priority = get_upstream_priority()
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release(priority)
+
+    def get_stats(self) -> Dict[str, Dict[str, int]]:
+        """获取调度统计信息"""
+        waiting = {p: 0 for p in PRIORITY_NAMES}
+        for priority, _, future in self._waiters:
+            if not future.done():
+                waiting[priority] += 1
+        return {
+            name: {
+                "inflight": self._inflight[p],
+                "waiting": waiting[p],
+                "granted": self.granted_count[p],
+                "waited": self.waited_count[p],
+            }
+            for p, name in PRIORITY_NAMES.items()
+        }
+
+
+# 创建全局实例
+upstream_scheduler = UpstreamScheduler(max_concurrency=settings.upstream_max_concurrency)
@@ -0,0 +1,214 @@
+"""
+WAL 检查点服务
+后台定期检查 WAL 文件大小, 超过阈值时在请求路径之外执行检查点, 避免 WAL 无限增长
+拖慢读取, 也避免由某个提交请求承担自动检查点的开销
+"""
+import asyncio
+import logging
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from app.config import settings
+from app.database import engine
+from app.db_migrations import get_db_path
+
+logger = logging.getLogger(__name__)
+
+
+class WalCheckpointService:
+    """
+    WAL 检查点服务类
+
+    - WAL 超过 checkpoint_bytes: PASSIVE 检查点, 不等待读者, 不阻塞写入
+    - WAL 超过 truncate_bytes: TRUNCATE 检查点, 等待读者完成后把 WAL 截断为 0
+      (只有在 busy_timeout 内拿不到锁时才会失败, 下个周期重试)
+    """
+
+    def __init__(
+        self,
+        interval: float = 30.0,
+        checkpoint_mb: int = 4,
+        truncate_mb: int = 64
+    ):
+        """
+        Args:
+            interval: 检查间隔 (秒)
+            checkpoint_mb: 触发 PASSIVE 检查点的 WAL 大小 (MiB)
+            truncate_mb: 触发 TRUNCATE 检查点的 WAL 大小 (MiB)
+        """
+        self.interval = max(1.0, float(interval))
+        self.checkpoint_bytes = max(0, int(checkpoint_mb)) * 1024 * 1024
+        self.truncate_bytes = max(self.checkpoint_bytes, int(truncate_mb) * 1024 * 1024)
+        self._loop_task: Optional[asyncio.Task] = None
+
+        self.checks = 0
+        self.checkpoints: Dict[str, int] = {"PASSIVE": 0, "TRUNCATE": 0}
+        self.busy_count = 0
+        self.error_count = 0
+        self.pages_checkpointed = 0
+        self.max_wal_bytes = 0
+        self.last_wal_bytes = 0
+        self.last_mode: Optional[str] = None
+        self.last_duration_ms: Optional[float] = None
+        self.last_checkpoint_at: Optional[float] = None
+
+    @staticmethod
+    def wal_path() -> Optional[Path]:
+        """WAL 文件路径, 非 SQLite 数据库返回 None"""
+        db_path = get_db_path()
+        if db_path is None:
+            return None
+        return db_path.with_name(db_path.name + "-wal")
+
+    def wal_size(self) -> int:
+        """当前 WAL 文件大小 (字节), 文件不存在时为 0"""
+        wal_path = self.wal_path()
+        if wal_path is None:
+            return 0
+        try:
+            return os.path.getsize(wal_path)
+        except OSError:
+            return 0
+
+    async def checkpoint(self, mode: str = "PASSIVE") -> Dict[str, Any]:
+        """
+        执行一次检查点
+
+        Args:
+            mode: PASSIVE 或 TRUNCATE
+
+        Returns:
+            包含 success, mode, busy, wal_pages, checkpointed_pages, duration_ms, error 的字典
+        """
+        mode = mode.upper()
+        if mode not in self.checkpoints:
+            return {"success": False, "mode": mode, "error": f"不支持的检查点模式: {mode}"}
+
+        started = time.perf_counter()
+        try:
+            async with engine.connect() as conn:
+                result = await conn.exec_driver_sql(f"PRAGMA wal_checkpoint({mode})")
+                busy, wal_pages, checkpointed_pages = result.one()
+        except Exception as e:
+            self.error_count += 1
+            logger.warning(f"WAL 检查点 ({mode}) 执行失败: {e}")
+            return {"success": False, "mode": mode, "error": str(e)}
+
+        duration_ms = round((time.perf_counter() - started) * 1000, 2)
+        self.checkpoints[mode] += 1
+        self.busy_count += int(bool(busy))
+        self.pages_checkpointed += max(0, checkpointed_pages)
+        self.last_mode = mode
+        self.last_duration_ms = duration_ms
+        self.last_checkpoint_at = time.time()
+
+        if busy:
+            logger.info(f"WAL 检查点 ({mode}) 未完成: 有读写事务占用, 已写回 {checkpointed_pages}/{wal_pages} 页")
+        else:
+            logger.debug(f"WAL 检查点 ({mode}) 完成: 写回 {checkpointed_pages}/{wal_pages} 页, 耗时 {duration_ms}ms")
+
+        return {
+            "success": not busy,
+            "mode": mode,
+            "busy": bool(busy),
+            "wal_pages": wal_pages,
+            "checkpointed_pages": checkpointed_pages,
+            "duration_ms": duration_ms,
+            "error": None
+        }
+
+    async def run_once(self) -> Optional[Dict[str, Any]]:
+        """
+        检查 WAL 大小, 超过阈值时执行对应的检查点
+
+        Returns:
+            检查点结果, 未达到阈值时返回 None
+        """
+        size = self.wal_size()
+        self.checks += 1
+        self.last_wal_bytes = size
+        self.max_wal_bytes = max(self.max_wal_bytes, size)
+
+        if size >= self.truncate_bytes:
+            return await self.checkpoint("TRUNCATE")
+        if size >= self.checkpoint_bytes:
+            return await self.checkpoint("PASSIVE")
+        return None
+
+    async def _worker_loop(self):
+        logger.info("WAL 检查点任务已启动")
+        try:
+            while True:
+                await asyncio.sleep(self.interval)
+                try:
+                    await self.run_once()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"WAL 检查点循环异常: {e}")
+        except asyncio.CancelledError:
+            logger.info("WAL 检查点任务收到取消信号")
+            raise
+        finally:
+            logger.info("WAL 检查点任务已停止")
+
+    async def start_worker(self) -> bool:
+        """
+        启动后台检查点循环
+
+        Returns:
+            是否新启动了任务 (False 表示已在运行)
+        """
+        if self._loop_task and not self._loop_task.done():
+            return False
+
+        self._loop_task = asyncio.create_task(self._worker_loop())
+        return True
+
+    async def stop_worker(self):
+        """停止后台检查点循环, 并在退出前截断 WAL"""
+        task = self._loop_task
+        if not task:
+            return
+
+        if not task.done():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+            except Exception as e:
+                logger.warning(f"停止 WAL 检查点任务时出现异常: {e}")
+
+        self._loop_task = None
+        await self.checkpoint("TRUNCATE")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取检查点统计信息"""
+        return {
+            "running": bool(self._loop_task and not self._loop_task.done()),
+            "interval": self.interval,
+            "checkpoint_bytes": self.checkpoint_bytes,
+            "truncate_bytes": self.truncate_bytes,
+            "wal_bytes": self.wal_size(),
+            "last_wal_bytes": self.last_wal_bytes,
+            "max_wal_bytes": self.max_wal_bytes,
+            "checks": self.checks,
+            "checkpoints": dict(self.checkpoints),
+            "busy": self.busy_count,
+            "errors": self.error_count,
+            "pages_checkpointed": self.pages_checkpointed,
+            "last_mode": self.last_mode,
+            "last_duration_ms": self.last_duration_ms,
+            "last_checkpoint_at": self.last_checkpoint_at,
+        }
+
+
+# 创建全局实例
+wal_checkpoint_service = WalCheckpointService(
+    interval=settings.sqlite_checkpoint_interval,
+    checkpoint_mb=settings.sqlite_checkpoint_mb,
+    truncate_mb=settings.sqlite_checkpoint_truncate_mb
+)
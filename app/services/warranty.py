@@ -4,18 +4,20 @@
 """
 import logging
 from typing import Optional, Dict, Any, List
-from datetime import datetime, timedelta
+from datetime import timedelta
 from sqlalchemy import select, and_, or_
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.models import RedemptionCode, RedemptionRecord, Team
+from app.services.upstream_scheduler import PRIORITY_BACKGROUND, upstream_priority
+from app.utils.rate_limiter import RateLimiter
 from app.utils.time_utils import get_now
 
 logger = logging.getLogger(__name__)
 
-# 全局频率限制字典: {(type, key): last_time}
-# type: 'email' or 'code'
-_query_rate_limit = {}
+# 质保查询频率限制: 每个邮箱或每个码 30 秒只能查一次
+# 键: (type, key), type 为 'email' 或 'code'
+_query_rate_limit = RateLimiter(capacity=1, period=30)
 
 
 class WarrantyService:
@@ -52,16 +54,13 @@ class WarrantyService:
                 }
 
             # 0. 频率限制 (每个邮箱或每个码 30 秒只能查一次)
-            now = datetime.now()
             limit_key = ("email", email) if email else ("code", code)
-            last_time = _query_rate_limit.get(limit_key)
-            if last_time and (now - last_time).total_seconds() < 30:
-                wait_time = int(30 - (now - last_time).total_seconds())
+            allowed, wait_time = _query_rate_limit.hit(limit_key)
+            if not allowed:
                 return {
                     "success": False,
-                    "error": f"查询太频繁,请 {wait_time} 秒后再试"
+                    "error": f"查询太频繁,请 {int(wait_time)} 秒后再试"
                 }
-            _query_rate_limit[limit_key] = now
 
             # 1. 查找兑换记录和相关联的 Team, Code
             records_data = []
@@ -173,7 +172,8 @@ class WarrantyService:
                 # 同步 Team 状态
                 if team.status != "banned":
                     logger.info(f"质保查询: 正在实时测试 Team {team.id} ({team.team_name}) 的状态")
-                    await self.team_service.sync_team_info(team.id, db_session)
+                    with upstream_priority(PRIORITY_BACKGROUND):
+                        await self.team_service.sync_team_info(team.id, db_session)
                     # 同步后 team 对象的属性会自动更新
 
                 # 动态计算/提取质保信息
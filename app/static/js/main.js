@@ -673,8 +673,8 @@ async function generateBatch(event) {
     const hasWarranty = form.hasWarranty.checked;
     const warrantyDays = form.warrantyDays ? form.warrantyDays.value : 30;
 
-    if (count < 1 || count > 1000) {
-        showToast('生成数量必须在1-1000之间', 'error');
+    if (count < 1 || count > 200000) {
+        showToast('生成数量必须在1-200000之间', 'error');
         return;
     }
 
@@ -694,6 +694,16 @@ async function generateBatch(event) {
     if (result.success) {
         document.getElementById('batchTotal').textContent = result.data.total;
         document.getElementById('batchCodes').value = result.data.codes.join('\n');
+        // 数量较多时只返回前一部分兑换码, 完整列表按批次导出
+        const truncatedEl = document.getElementById('batchTruncated');
+        if (truncatedEl) {
+            truncatedEl.style.display = result.data.truncated ? 'block' : 'none';
+            if (result.data.truncated) {
+                document.getElementById('batchShown').textContent = result.data.codes.length;
+                document.getElementById('batchExportLink').href =
+                    `/admin/codes/export?format=csv&batch=${encodeURIComponent(result.data.batch_created_at)}`;
+            }
+        }
         document.getElementById('batchResult').style.display = 'block';
         form.reset();
         showToast(`成功生成 ${result.data.total} 个兑换码`, 'success');
@@ -287,8 +287,8 @@ function showSuccessResult(data) {
 
     resultContent.innerHTML = `
         <div class="result-success">
-            <div class="result-icon"><i data-lucide="check-circle" style="width: 64px; height: 64px; color: var(--success);"></i></div>
-            <div class="result-title">兑换成功!</div>
+            <div class="result-icon"><i data-lucide="${data.pending ? 'clock' : 'check-circle'}" style="width: 64px; height: 64px; color: var(--success);"></i></div>
+            <div class="result-title">${data.pending ? '兑换成功，邀请处理中' : '兑换成功!'}</div>
             <div class="result-message">${escapeHtml(data.message) || '您已成功加入 Team'}</div>
 
             <div class="result-details">
@@ -308,8 +308,10 @@ function showSuccessResult(data) {
                 ` : ''}
             </div>
 
-            <p style="color: var(--text-muted); font-size: 0.9rem; margin-bottom: 2rem; background: rgba(255,255,255,0.05); padding: 1rem; border-radius: 8px;">
-                邀请邮件已发送到您的邮箱，请查收并按照邮件指引接受邀请。
+            <p id="inviteStatusText" style="color: var(--text-muted); font-size: 0.9rem; margin-bottom: 2rem; background: rgba(255,255,255,0.05); padding: 1rem; border-radius: 8px;">
+                ${data.pending
+                    ? '上游服务暂时繁忙，系统会在后台自动重试发送邀请，通常几分钟内送达，请稍后查收邮件。'
+                    : '邀请邮件已发送到您的邮箱，请查收并按照邮件指引接受邀请。'}
             </p>
 
             <button onclick="location.reload()" class="btn btn-primary">
@@ -320,6 +322,46 @@ function showSuccessResult(data) {
     if (window.lucide) lucide.createIcons();
 
     showStep(3);
+
+    if (data.pending) {
+        pollInviteStatus(currentEmail, currentCode);
+    }
+}
+
+// 轮询排队邀请的状态, 直到发送成功或最终失败
+const INVITE_STATUS_POLL_MS = 20000;
+const INVITE_STATUS_MAX_POLLS = 90;
+
+async function pollInviteStatus(email, code, polls = 0) {
+    if (polls >= INVITE_STATUS_MAX_POLLS) return;
+    await new Promise(resolve => setTimeout(resolve, INVITE_STATUS_POLL_MS));
+
+    const statusText = document.getElementById('inviteStatusText');
+    if (!statusText) return;
+
+    try {
+        const response = await fetch('/redeem/status', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify({ email, code })
+        });
+        const data = await response.json();
+
+        if (response.ok && data.found && data.status !== 'pending') {
+            if (data.status === 'failed') {
+                showErrorResult(data.message);
+            } else {
+                statusText.textContent = data.message;
+            }
+            return;
+        }
+    } catch (error) {
+        console.warn('Invite status poll failed:', error);
+    }
+
+    pollInviteStatus(email, code, polls + 1);
 }
 
 // 显示错误结果
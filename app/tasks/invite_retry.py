@@ -0,0 +1,23 @@
+"""
+邀请重试任务
+负责在应用生命周期内启动/停止邀请重试队列的后台处理循环。
+"""
+import logging
+
+from app.services.invite_retry import invite_retry_service
+
+logger = logging.getLogger(__name__)
+
+
+async def start_invite_retry_task():
+    """启动邀请重试任务。"""
+    started = await invite_retry_service.start_worker()
+    if started:
+        logger.info("邀请重试任务已注册")
+    else:
+        logger.info("邀请重试任务已在运行，跳过重复注册")
+
+
+async def stop_invite_retry_task():
+    """停止邀请重试任务。"""
+    await invite_retry_service.stop_worker()
@@ -0,0 +1,28 @@
+"""
+WAL 检查点任务
+负责在应用生命周期内启动/停止 WAL 检查点的后台循环。
+"""
+import logging
+
+from app.database import IS_SQLITE
+from app.services.wal_checkpoint import wal_checkpoint_service
+
+logger = logging.getLogger(__name__)
+
+
+async def start_wal_checkpoint_task():
+    """启动 WAL 检查点任务。"""
+    if not IS_SQLITE:
+        logger.info("当前数据库不是 SQLite，跳过 WAL 检查点任务")
+        return
+
+    started = await wal_checkpoint_service.start_worker()
+    if started:
+        logger.info("WAL 检查点任务已注册")
+    else:
+        logger.info("WAL 检查点任务已在运行，跳过重复注册")
+
+
+async def stop_wal_checkpoint_task():
+    """停止 WAL 检查点任务。"""
+    await wal_checkpoint_service.stop_worker()
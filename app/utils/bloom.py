@@ -0,0 +1,54 @@
+"""
+布隆过滤器
+用于以极小内存判断某个值"一定不存在"
+"""
+import hashlib
+import math
+
+
+class BloomFilter:
+    """
+    标准布隆过滤器
+
+    - 判定为不存在时一定不存在
+    - 判定为存在时可能误判 (概率约为 error_rate)
+    - 不支持删除, 需要时整体重建
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        """
+        Args:
+            capacity: 预计元素数量
+            error_rate: 目标误判率
+        """
+        capacity = max(1, int(capacity))
+        self.capacity = capacity
+        self.error_rate = error_rate
+
+        # m = -n * ln(p) / (ln2)^2, k = m / n * ln2
+        self.num_bits = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, int(round(self.num_bits / capacity * math.log(2))))
+        self._bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, value: str):
+        """使用双重哈希计算 k 个比特位置"""
+        digest = hashlib.blake2b(value.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add(self, value: str):
+        """添加元素"""
+        for pos in self._positions(value):
+            self._bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, value: str) -> bool:
+        return all(self._bits[pos >> 3] & (1 << (pos & 7)) for pos in self._positions(value))
+
+    @property
+    def size_bytes(self) -> int:
+        """占用内存 (字节)"""
+        return len(self._bits)
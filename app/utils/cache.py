@@ -0,0 +1,86 @@
+"""
+进程内缓存工具
+提供带 TTL 和容量上限的简单缓存
+"""
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+
+class TTLCache:
+    """
+    带过期时间和容量上限的 LRU 缓存
+
+    - 读取时惰性淘汰过期项
+    - 超过容量时淘汰最久未使用的项
+    - delete / clear 递增 generation; 查询前记下 generation 并在写入时传入,
+      查询期间发生过失效则放弃写入, 避免把失效前读到的旧结果缓存一个完整 TTL
+    """
+
+    def __init__(self, ttl: float, maxsize: int = 1024):
+        """
+        Args:
+            ttl: 缓存有效期 (秒)
+            maxsize: 最大缓存项数量
+        """
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.generation = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """获取缓存值, 不存在或已过期返回默认值"""
+        item = self._data.get(key)
+        if item is None:
+            return default
+
+        expires_at, value = item
+        if expires_at <= time.monotonic():
+            self._data.pop(key, None)
+            return default
+
+        self._data.move_to_end(key)
+        return value
+
+    def set(
+        self,
+        key: Hashable,
+        value: Any,
+        ttl: Optional[float] = None,
+        generation: Optional[int] = None
+    ) -> bool:
+        """
+        写入缓存值
+
+        Args:
+            key: 缓存键
+            value: 缓存值
+            ttl: 有效期 (秒), 默认使用缓存的 ttl
+            generation: 开始查询前读取的 generation, 与当前值不同时不写入
+
+        Returns:
+            是否已写入
+        """
+        if generation is not None and generation != self.generation:
+            return False
+
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+        return True
+
+    def delete(self, key: Hashable):
+        """删除缓存项"""
+        self.generation += 1
+        self._data.pop(key, None)
+
+    def clear(self):
+        """清空缓存"""
+        self.generation += 1
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
@@ -0,0 +1,161 @@
+"""
+请求对冲工具
+幂等读请求在超过历史 p95 延迟仍未返回时, 再发一份副本, 取先返回的结果
+"""
+import asyncio
+import time
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Optional
+
+
+class _EndpointStats:
+    """单个接口的延迟样本与计数"""
+
+    __slots__ = ("latencies", "requests", "hedges", "hedge_wins")
+
+    def __init__(self, window: int):
+        self.latencies: Deque[float] = deque(maxlen=window)
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+
+class RequestHedger:
+    """
+    对冲请求执行器
+
+    - 每个接口单独统计最近 window 次成功响应的延迟, 样本不足 min_samples 时不对冲;
+      异常和不可采用的结果 (通常很快返回) 不计入样本, 对冲胜出时被取消的原请求
+      按已等待的时间计入一个下限样本, 避免阈值被持续拉低、对冲越来越频繁
+    - 对冲预算为令牌桶: 每次请求增加 budget_ratio 个令牌, 每次对冲消耗 1 个,
+      长期对冲比例不超过 budget_ratio
+    """
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        budget_ratio: float = 0.1,
+        window: int = 200,
+        min_samples: int = 20,
+        max_burst: float = 5.0
+    ):
+        """
+        Args:
+            enabled: 是否启用对冲
+            budget_ratio: 对冲请求占总请求的最大比例
+            window: 延迟样本窗口大小
+            min_samples: 开始对冲所需的最少样本数
+            max_burst: 预算令牌上限
+        """
+        self.enabled = enabled
+        self.budget_ratio = max(0.0, budget_ratio)
+        self.window = window
+        self.min_samples = min_samples
+        self.max_burst = max_burst
+        self._tokens = 0.0
+        self._stats: Dict[str, _EndpointStats] = {}
+
+    def _get(self, key: str) -> _EndpointStats:
+        stats = self._stats.get(key)
+        if stats is None:
+            stats = self._stats[key] = _EndpointStats(self.window)
+        return stats
+
+    def threshold(self, key: str) -> Optional[float]:
+        """获取对冲阈值 (p95 延迟, 秒), 样本不足时返回 None"""
+        stats = self._stats.get(key)
+        if not stats or len(stats.latencies) < self.min_samples:
+            return None
+        ordered = sorted(stats.latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    async def _timed(
+        self,
+        key: str,
+        factory: Callable[[], Awaitable[Any]],
+        is_final: Callable[[Any], bool]
+    ) -> Any:
+        """执行请求, 只记录可采用结果的延迟"""
+        started = time.monotonic()
+        result = await factory()
+        if is_final(result):
+            self._get(key).latencies.append(time.monotonic() - started)
+        return result
+
+    async def run(
+        self,
+        key: str,
+        factory: Callable[[], Awaitable[Any]],
+        is_final: Callable[[Any], bool] = lambda result: True
+    ) -> Any:
+        """
+        执行请求, 必要时发送对冲副本
+
+        Args:
+            key: 接口名称 (用于分别统计延迟)
+            factory: 创建请求协程的函数, 对冲时会再调用一次
+            is_final: 判断结果是否可直接采用; 先返回的结果不可采用时继续等待另一份
+
+        Returns:
+            先返回且可采用的结果
+        """
+        stats = self._get(key)
+        stats.requests += 1
+        self._tokens = min(self.max_burst, self._tokens + self.budget_ratio)
+
+        threshold = self.threshold(key) if self.enabled else None
+        if threshold is None:
+            return await self._timed(key, factory, is_final)
+
+        primary_started = time.monotonic()
+        primary = asyncio.ensure_future(self._timed(key, factory, is_final))
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=threshold)
+        except asyncio.CancelledError:
+            primary.cancel()
+            raise
+        if done or self._tokens < 1:
+            return await primary
+
+        self._tokens -= 1
+        stats.hedges += 1
+        hedge = asyncio.ensure_future(self._timed(key, factory, is_final))
+        pending = {primary, hedge}
+        fallback = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None and is_final(task.result()):
+                        if task is hedge:
+                            stats.hedge_wins += 1
+                            if not primary.done():
+                                # 原请求至少已耗时这么久, 作为下限样本
+                                stats.latencies.append(time.monotonic() - primary_started)
+                        return task.result()
+                    # 两份都不可采用时, 优先返回正常结果而不是异常
+                    if fallback is None or fallback.exception() is not None:
+                        fallback = task
+            return fallback.result()
+        finally:
+            for task in (primary, hedge):
+                if not task.done():
+                    task.cancel()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取对冲统计信息"""
+        endpoints = {}
+        for key, stats in self._stats.items():
+            threshold = self.threshold(key)
+            endpoints[key] = {
+                "requests": stats.requests,
+                "hedges": stats.hedges,
+                "hedge_wins": stats.hedge_wins,
+                "p95_ms": round(threshold * 1000, 1) if threshold is not None else None,
+            }
+        return {
+            "enabled": self.enabled,
+            "budget_ratio": self.budget_ratio,
+            "budget_tokens": round(self._tokens, 2),
+            "endpoints": endpoints,
+        }
@@ -0,0 +1,185 @@
+"""
+游标分页工具
+按 (created_at, id) 倒序做 keyset 分页, 任意页的查询代价与第一页相同
+"""
+import base64
+import json
+import math
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import Select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+# 特殊游标: 跳到最后一页
+LAST_PAGE_CURSOR = "last"
+
+
+def encode_cursor(created_at: Optional[datetime], row_id: int, direction: str, page: int) -> str:
+    """
+    生成不透明游标
+
+    Args:
+        created_at: 边界行的创建时间
+        row_id: 边界行的 ID
+        direction: next (取边界之后更旧的行) 或 prev (取边界之前更新的行)
+        page: 目标页码 (仅用于页面显示)
+
+    Returns:
+        URL 安全的游标字符串
+    """
+    payload = {
+        "t": created_at.isoformat() if created_at else None,
+        "i": row_id,
+        "d": direction,
+        "p": page,
+    }
+    raw = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Optional[Dict[str, Any]]:
+    """
+    解析游标, 格式无效时返回 None
+
+    Args:
+        cursor: encode_cursor 生成的游标
+
+    Returns:
+        包含 created_at, id, direction, page 的字典
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw)
+        direction = payload["d"]
+        if direction not in ("next", "prev"):
+            return None
+        return {
+            "created_at": datetime.fromisoformat(payload["t"]) if payload.get("t") else None,
+            "id": int(payload["i"]),
+            "direction": direction,
+            "page": max(1, int(payload.get("p") or 1)),
+        }
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+async def _seek(
+    db_session: AsyncSession,
+    stmt: Select,
+    model,
+    created_at: Optional[datetime],
+    row_id: int,
+    older: bool,
+    limit: int
+) -> List[Any]:
+    """
+    从边界 (created_at, id) 开始按排序方向取 limit 行
+
+    批量生成的数据常共用同一个 created_at, (created_at, id) 行值比较只能用上索引的
+    第一列, 会逐行扫描所有同时间戳的行. 这里拆成两次都能走索引的查询:
+    先取同一 created_at 中 id 更小/更大的行, 不足一页再取 created_at 更早/更晚的行
+    """
+    if older:
+        order = (model.created_at.desc(), model.id.desc())
+        same_time = stmt.where(model.created_at == created_at, model.id < row_id)
+        beyond = stmt.where(model.created_at < created_at)
+    else:
+        order = (model.created_at.asc(), model.id.asc())
+        same_time = stmt.where(model.created_at == created_at, model.id > row_id)
+        beyond = stmt.where(model.created_at > created_at)
+
+    result = await db_session.execute(same_time.order_by(*order).limit(limit))
+    items = list(result.scalars().all())
+    if len(items) < limit:
+        result = await db_session.execute(beyond.order_by(*order).limit(limit - len(items)))
+        items.extend(result.scalars().all())
+    return items
+
+
+async def keyset_paginate(
+    db_session: AsyncSession,
+    stmt: Select,
+    model,
+    total: int,
+    per_page: int,
+    cursor: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    按 (created_at DESC, id DESC) 执行游标分页
+
+    Args:
+        db_session: 数据库会话
+        stmt: 已添加筛选条件的 select(model) 查询
+        model: 带 created_at 和 id 列的模型
+        total: 总数 (用于显示总页数)
+        per_page: 每页数量
+        cursor: 游标, 为空表示第一页, LAST_PAGE_CURSOR 表示最后一页
+
+    Returns:
+        包含 items, total, total_pages, current_page, next_cursor, prev_cursor 的字典
+    """
+    per_page = max(1, per_page)
+    total_pages = math.ceil(total / per_page) if total > 0 else 1
+    decoded = decode_cursor(cursor) if cursor and cursor != LAST_PAGE_CURSOR else None
+
+    if cursor == LAST_PAGE_CURSOR:
+        # 最后一页: 反向取不足一页的余数部分
+        direction = "prev"
+        page = total_pages
+        limit = total - (total_pages - 1) * per_page if total > 0 else per_page
+        result = await db_session.execute(
+            stmt.order_by(model.created_at.asc(), model.id.asc()).limit(limit)
+        )
+        items: List[Any] = list(result.scalars().all())
+    elif decoded:
+        direction = decoded["direction"]
+        page = decoded["page"]
+        items = await _seek(
+            db_session, stmt, model, decoded["created_at"], decoded["id"],
+            older=direction == "next", limit=per_page + 1
+        )
+    else:
+        direction = "next"
+        page = 1
+        result = await db_session.execute(
+            stmt.order_by(model.created_at.desc(), model.id.desc()).limit(per_page + 1)
+        )
+        items = list(result.scalars().all())
+
+    # 多取的一行只用于判断该方向是否还有数据
+    has_more = len(items) > per_page
+    items = items[:per_page]
+    if cursor == LAST_PAGE_CURSOR:
+        items.reverse()
+        has_prev = total_pages > 1
+        has_next = False
+    elif direction == "prev":
+        # 从后一页翻回来, 后面必然还有数据
+        items.reverse()
+        has_prev = has_more
+        has_next = True
+        if not has_prev:
+            page = 1
+    else:
+        has_prev = decoded is not None
+        has_next = has_more
+    page = min(max(page, 1), total_pages)
+
+    next_cursor = None
+    prev_cursor = None
+    if items and has_next:
+        last = items[-1]
+        next_cursor = encode_cursor(last.created_at, last.id, "next", page + 1)
+    if items and has_prev:
+        first = items[0]
+        prev_cursor = encode_cursor(first.created_at, first.id, "prev", page - 1)
+
+    return {
+        "items": items,
+        "total": total,
+        "total_pages": total_pages,
+        "current_page": page,
+        "next_cursor": next_cursor,
+        "prev_cursor": prev_cursor,
+    }
@@ -0,0 +1,87 @@
+"""
+限流工具
+基于令牌桶的进程内限流器, 内存占用有上限并自动淘汰过期键
+"""
+import time
+from collections import OrderedDict
+from typing import Hashable, Tuple
+
+
+class RateLimiter:
+    """
+    令牌桶限流器
+
+    - 每个键一个令牌桶, 容量为 capacity, 每 period 秒补满 capacity 个令牌
+    - 每次检查 O(1)
+    - 令牌桶补满后即可丢弃 (等价于从未访问), 因此按 TTL 淘汰不会放宽限制
+    - 超过 max_keys 时淘汰最久未访问的键
+    """
+
+    def __init__(self, capacity: int, period: float, max_keys: int = 10000):
+        """
+        Args:
+            capacity: 令牌桶容量 (窗口内允许的请求数)
+            period: 补满令牌桶所需时间 (秒)
+            max_keys: 最多跟踪的键数量
+        """
+        self.capacity = max(1, int(capacity))
+        self.period = float(period)
+        self.rate = self.capacity / self.period
+        self.max_keys = max_keys
+        self._buckets: "OrderedDict[Hashable, Tuple[float, float]]" = OrderedDict()
+        self.rejected_count = 0
+
+    def _current(self, key: Hashable, now: float) -> float:
+        """获取键当前的令牌数"""
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            return float(self.capacity)
+        tokens, updated_at = bucket
+        return min(float(self.capacity), tokens + (now - updated_at) * self.rate)
+
+    def _evict(self, now: float):
+        """淘汰已补满的最旧键, 并保证键数量不超过上限"""
+        while self._buckets:
+            key, (tokens, updated_at) = next(iter(self._buckets.items()))
+            if len(self._buckets) > self.max_keys or now - updated_at >= self.period:
+                self._buckets.popitem(last=False)
+            else:
+                break
+
+    def peek(self, key: Hashable) -> Tuple[bool, float]:
+        """
+        检查是否还有令牌 (不消耗)
+
+        Returns:
+            (是否允许, 需要等待的秒数)
+        """
+        tokens = self._current(key, time.monotonic())
+        if tokens >= 1:
+            return True, 0.0
+        return False, (1 - tokens) / self.rate
+
+    def hit(self, key: Hashable) -> Tuple[bool, float]:
+        """
+        消耗一个令牌
+
+        Returns:
+            (是否允许, 需要等待的秒数)
+        """
+        now = time.monotonic()
+        tokens = self._current(key, now)
+
+        if tokens < 1:
+            self.rejected_count += 1
+            return False, (1 - tokens) / self.rate
+
+        self._buckets[key] = (tokens - 1, now)
+        self._buckets.move_to_end(key)
+        self._evict(now)
+        return True, 0.0
+
+    def reset(self, key: Hashable):
+        """清除指定键的限流状态"""
+        self._buckets.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._buckets)
@@ -0,0 +1,3 @@
+"""
+性能与并发压测脚本
+"""
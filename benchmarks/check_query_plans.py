@@ -0,0 +1,265 @@
+"""
+热点查询执行计划检查
+
+在临时 SQLite 数据库中建表并执行全部迁移, 对兑换、列表、统计等热点查询运行
+EXPLAIN QUERY PLAN, 确认每条查询使用了预期的索引, 并且没有全表扫描或临时排序
+(USE TEMP B-TREE FOR ORDER BY)。新增或调整索引后运行此脚本, 索引的作用是被检查出来的,
+而不是假设出来的。
+
+用法:
+    python -m benchmarks.check_query_plans
+    python -m benchmarks.check_query_plans --db data/team_manage.db   # 检查现有数据库 (只读)
+
+存在不符合预期的执行计划时以退出码 1 结束。同一组检查在 tests/test_query_plans.py 中
+作为测试运行, 执行计划退化时测试失败。
+"""
+import argparse
+import asyncio
+import logging
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+from typing import Any, List, NamedTuple, Optional, Tuple
+
+
+class PlanCheck(NamedTuple):
+    """单条查询的执行计划预期"""
+    name: str
+    statement: Any
+    # 计划中必须出现的索引
+    indexes: Tuple[str, ...]
+    # 计划中必须出现的步骤片段 (如同一 created_at 内按 rowid 范围定位)
+    steps: Tuple[str, ...] = ()
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="热点查询执行计划检查")
+    parser.add_argument("--db", help="检查指定的现有 SQLite 数据库 (默认新建临时数据库)")
+    parser.add_argument("-v", "--verbose", action="store_true", help="输出每条查询的完整执行计划")
+    return parser.parse_args(argv)
+
+
+def build_checks() -> List[PlanCheck]:
+    """构建与业务代码一致的热点查询"""
+    from datetime import datetime
+
+    from sqlalchemy import case, func, select
+
+    from app.models import InviteRetryJob, RedemptionCode, RedemptionRecord, Team
+
+    now = datetime(2025, 1, 1)
+    email = "user@example.com"
+
+    joined_before = select(RedemptionRecord.id).where(
+        func.lower(RedemptionRecord.email) == email,
+        RedemptionRecord.team_id == Team.id
+    )
+    pending_invite = select(InviteRetryJob.id).where(
+        func.lower(InviteRetryJob.email) == email,
+        InviteRetryJob.team_id == Team.id,
+        InviteRetryJob.status == "pending"
+    )
+    available = (Team.status == "active", Team.current_members < Team.max_members)
+    # 与 utils.pagination 一致: 往后翻页 (更旧) 倒序, 往前翻页和最后一页正序
+    older = (RedemptionCode.created_at.desc(), RedemptionCode.id.desc())
+    newer = (RedemptionCode.created_at.asc(), RedemptionCode.id.asc())
+
+    return [
+        PlanCheck(
+            "兑换选择 Team (redeem_flow.select_team_auto)",
+            select(Team).where(*available, ~joined_before.exists(), ~pending_invite.exists())
+            .order_by(Team.expires_at.asc(), Team.id.asc()).limit(1),
+            ("idx_team_available", "idx_email_lower_team", "idx_retry_email_team"),
+        ),
+        PlanCheck(
+            "剩余车位总数 (team.get_total_available_spots)",
+            select(func.sum(Team.max_members - Team.current_members)).where(*available),
+            ("idx_team_available",),
+        ),
+        PlanCheck(
+            "Team 状态统计 (stats.get_team_stats)",
+            select(
+                Team.status,
+                func.count(Team.id),
+                func.sum(case((Team.current_members < Team.max_members, 1), else_=0))
+            ).group_by(Team.status),
+            ("idx_team_available",),
+        ),
+        PlanCheck(
+            "查询兑换码 (redemption.validate_code)",
+            select(RedemptionCode).where(RedemptionCode.code == "CODE"),
+            ("sqlite_autoindex_redemption_codes_1",),
+        ),
+        PlanCheck(
+            "布隆过滤器未命中确认 (code_filter.might_exist)",
+            select(RedemptionCode.id).where(RedemptionCode.code == "CODE").limit(1),
+            ("sqlite_autoindex_redemption_codes_1",),
+            ("COVERING INDEX",),
+        ),
+        PlanCheck(
+            "兑换码列表第一页 (pagination.keyset_paginate)",
+            select(RedemptionCode).order_by(*older).limit(51),
+            ("idx_code_created_at",),
+        ),
+        PlanCheck(
+            "兑换码列表下一页: 同一创建时间 (pagination._seek)",
+            select(RedemptionCode).where(RedemptionCode.created_at == now, RedemptionCode.id < 100)
+            .order_by(*older).limit(51),
+            ("idx_code_created_at",),
+            ("rowid<?",),
+        ),
+        PlanCheck(
+            "兑换码列表下一页: 更早创建时间 (pagination._seek)",
+            select(RedemptionCode).where(RedemptionCode.created_at < now).order_by(*older).limit(51),
+            ("idx_code_created_at",),
+        ),
+        PlanCheck(
+            "兑换码列表上一页: 同一创建时间 (pagination._seek)",
+            select(RedemptionCode).where(RedemptionCode.created_at == now, RedemptionCode.id > 100)
+            .order_by(*newer).limit(51),
+            ("idx_code_created_at",),
+            ("rowid>?",),
+        ),
+        PlanCheck(
+            "兑换码列表上一页: 更晚创建时间 (pagination._seek)",
+            select(RedemptionCode).where(RedemptionCode.created_at > now).order_by(*newer).limit(51),
+            ("idx_code_created_at",),
+        ),
+        PlanCheck(
+            "兑换码列表最后一页 (pagination.keyset_paginate)",
+            select(RedemptionCode).order_by(*newer).limit(50),
+            ("idx_code_created_at",),
+        ),
+        PlanCheck(
+            "未使用兑换码 (redemption.get_unused_codes)",
+            select(RedemptionCode).where(RedemptionCode.status == "unused")
+            .order_by(RedemptionCode.created_at.desc()),
+            ("idx_code_status_created",),
+        ),
+        PlanCheck(
+            "兑换码状态统计 (stats.get_code_stats)",
+            select(RedemptionCode.status, func.count(RedemptionCode.id)).group_by(RedemptionCode.status),
+            ("idx_code_status_created",),
+        ),
+        PlanCheck(
+            "兑换码的兑换记录 (warranty.validate_warranty_reuse, redeem_flow._release_seat)",
+            select(RedemptionRecord).where(RedemptionRecord.code == "CODE")
+            .order_by(RedemptionRecord.redeemed_at.desc()),
+            ("idx_record_code_redeemed",),
+        ),
+        PlanCheck(
+            "按 Team 筛选使用记录 (redemption.get_records_page)",
+            select(RedemptionRecord).where(RedemptionRecord.team_id == 1)
+            .order_by(RedemptionRecord.redeemed_at.desc(), RedemptionRecord.id.desc()).limit(20),
+            ("idx_record_team_redeemed",),
+        ),
+        PlanCheck(
+            "按日期筛选使用记录 (redemption.get_records_page)",
+            select(RedemptionRecord).where(RedemptionRecord.redeemed_at >= now)
+            .order_by(RedemptionRecord.redeemed_at.desc()).limit(20),
+            ("idx_redeemed_at",),
+        ),
+    ]
+
+
+def explain(cursor: sqlite3.Cursor, statement: Any) -> List[str]:
+    """运行 EXPLAIN QUERY PLAN, 返回计划的 detail 列"""
+    from sqlalchemy.dialects import sqlite
+
+    sql = str(statement.compile(dialect=sqlite.dialect(), compile_kwargs={"literal_binds": True}))
+    cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+    return [row[3] for row in cursor.fetchall()]
+
+
+def check_plan(check: PlanCheck, plan: List[str]) -> List[str]:
+    """
+    检查执行计划是否符合预期
+
+    Returns:
+        问题描述列表, 为空表示通过
+    """
+    problems = []
+    for index in check.indexes:
+        if not any(f"INDEX {index}" in step for step in plan):
+            problems.append(f"未使用索引 {index}")
+    for fragment in check.steps:
+        if not any(fragment in step for step in plan):
+            problems.append(f"计划中缺少 {fragment}")
+    for step in plan:
+        # "SCAN t USING INDEX ..." 是按索引顺序遍历, 只有不带索引的 SCAN 才是全表扫描
+        if step.startswith("SCAN ") and " INDEX " not in step:
+            problems.append(f"全表扫描: {step}")
+        if "USE TEMP B-TREE" in step:
+            problems.append(f"临时排序: {step}")
+    return problems
+
+
+async def prepare_database():
+    """建表并执行全部迁移"""
+    from app import models  # noqa: F401  注册模型后 init_db 才会建表
+    from app.database import close_db, init_db
+    from app.db_migrations import run_migrations
+
+    await init_db()
+    await run_migrations()
+    await close_db()
+
+
+def main(args: argparse.Namespace, db_path: str) -> int:
+    """执行检查"""
+    if not args.db:
+        asyncio.run(prepare_database())
+
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    failed = 0
+    try:
+        cursor = conn.cursor()
+        for check in build_checks():
+            plan = explain(cursor, check.statement)
+            problems = check_plan(check, plan)
+            failed += bool(problems)
+
+            print(f"[{'FAIL' if problems else ' OK '}] {check.name}")
+            for problem in problems:
+                print(f"       {problem}")
+            if problems or args.verbose:
+                for step in plan:
+                    print(f"         | {step}")
+    finally:
+        conn.close()
+
+    print("-" * 60)
+    if failed:
+        print(f"{failed} 条查询的执行计划不符合预期")
+        return 1
+    print("执行计划检查通过")
+    return 0
+
+
+def run(argv: Optional[List[str]] = None) -> int:
+    """命令行入口"""
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.ERROR)
+
+    temp_dir = None
+    db_path = args.db
+    if not db_path:
+        temp_dir = tempfile.mkdtemp(prefix="check_query_plans_")
+        db_path = os.path.join(temp_dir, "plans.db")
+
+    # 必须在导入 app 之前设置, app.config 在导入时读取环境变量
+    os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{os.path.abspath(db_path)}"
+    os.environ["DEBUG"] = "false"
+
+    try:
+        return main(args, os.path.abspath(db_path))
+    finally:
+        if temp_dir:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(run())
@@ -0,0 +1,505 @@
+"""
+兑换流程并发压测
+
+在临时 SQLite 数据库 (或 --database-url 指定的数据库) 中初始化 N 个 Team 和 M 个兑换码,
+用本地模拟上游替换 ChatGPTService 的 HTTP 会话, 由 K 个并发兑换者执行完整的兑换流程
+(与 /redeem/confirm 相同, 每个请求独立的数据库会话), 最后输出:
+
+- 吞吐量与 p50/p99 延迟
+- 每次成功兑换的重试次数
+- 进入重试队列的邀请数量及其最终结果 (压测结束后忽略退避时间立即处理)
+- 不变量检查结果 (Team 超员、兑换码重复使用、上游超额邀请等)
+
+用法:
+    python -m benchmarks.stress_redeem --teams 10 --seats 5 --codes 80 --concurrency 40
+    # 在本地 PostgreSQL 上压测 (会清空该库中的业务表)
+    python -m benchmarks.stress_redeem --database-url postgresql+asyncpg://postgres@127.0.0.1/stress
+
+存在不变量违规时以退出码 1 结束, 可用于回归检查。
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="兑换流程并发压测")
+    parser.add_argument("--teams", type=int, default=10, help="Team 数量 (N)")
+    parser.add_argument("--seats", type=int, default=5, help="每个 Team 的席位数")
+    parser.add_argument("--codes", type=int, default=80, help="兑换码数量 (M)")
+    parser.add_argument("--concurrency", type=int, default=40, help="并发兑换者数量 (K)")
+    parser.add_argument(
+        "--duplicate-ratio", type=float, default=0.2,
+        help="额外用其他邮箱重复提交已有兑换码的请求比例 (模拟抢码)"
+    )
+    parser.add_argument(
+        "--same-email-ratio", type=float, default=0.1,
+        help="用同一邮箱兑换多个不同兑换码的请求比例"
+    )
+    parser.add_argument(
+        "--hidden-members", type=int, default=0,
+        help="每个 Team 在上游已占用但数据库不知道的席位数 (模拟计数不一致)"
+    )
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="上游平均响应延迟 (毫秒)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="上游返回 500 的概率")
+    parser.add_argument("--strategy", default=None, help="Team 分配策略 (默认使用系统设置)")
+    parser.add_argument("--seed", type=int, default=None, help="随机种子")
+    parser.add_argument("--db", default=None, help="SQLite 数据库文件路径 (默认使用临时文件)")
+    parser.add_argument(
+        "--database-url",
+        default=None,
+        help="使用指定的数据库 URL (如 postgresql+asyncpg://...), 压测前会删除并重建业务表"
+    )
+    parser.add_argument("--keep-db", action="store_true", help="结束后保留临时数据库")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出结果")
+    parser.add_argument("--log-level", default="ERROR", help="应用日志级别")
+    return parser.parse_args(argv)
+
+
+class MockResponse:
+    """模拟 curl_cffi 响应对象"""
+
+    def __init__(self, status_code: int, payload: Dict[str, Any]):
+        self.status_code = status_code
+        self._payload = payload
+        self.text = json.dumps(payload)
+
+    def json(self) -> Dict[str, Any]:
+        return self._payload
+
+
+class MockUpstream:
+    """
+    本地模拟上游
+
+    - 每个 account 有真实席位上限, 满员后返回 422 "maximum number of seats"
+    - 同一邮箱重复邀请返回 409
+    - 按配置注入随机延迟和 500 错误
+    """
+
+    def __init__(self, seats: int, hidden_members: int, latency_ms: float, error_rate: float, rng: random.Random):
+        self.seats = seats
+        self.hidden_members = hidden_members
+        self.latency = latency_ms / 1000
+        self.error_rate = error_rate
+        self.rng = rng
+        self.members: Dict[str, set] = {}
+        self.invite_requests = 0
+        self.server_errors = 0
+        self.seat_rejections = 0
+        self.duplicate_invites = 0
+
+    async def _delay(self):
+        if self.latency > 0:
+            await asyncio.sleep(self.rng.expovariate(1 / self.latency))
+
+    async def post(self, url: str, headers: Optional[Dict[str, str]] = None, json: Optional[Dict[str, Any]] = None):
+        await self._delay()
+        if not url.endswith("/invites"):
+            return MockResponse(404, {"detail": "Not Found"})
+
+        self.invite_requests += 1
+        if self.rng.random() < self.error_rate:
+            self.server_errors += 1
+            return MockResponse(500, {"detail": "Internal Server Error"})
+
+        account_id = url.rstrip("/").split("/")[-2]
+        members = self.members.setdefault(account_id, set())
+        invites = []
+        for email in (json or {}).get("email_addresses", []):
+            if email in members:
+                self.duplicate_invites += 1
+                return MockResponse(409, {"detail": "User is already a member"})
+            if len(members) + self.hidden_members >= self.seats:
+                self.seat_rejections += 1
+                return MockResponse(422, {"detail": "Team has reached maximum number of seats"})
+            members.add(email)
+            invites.append({"email_address": email, "role": "standard-user"})
+        return MockResponse(200, {"account_invites": invites})
+
+    async def get(self, url: str, headers: Optional[Dict[str, str]] = None):
+        await self._delay()
+        return MockResponse(404, {"detail": "Not Found"})
+
+    async def delete(self, url: str, headers: Optional[Dict[str, str]] = None, json: Optional[Dict[str, Any]] = None):
+        await self._delay()
+        return MockResponse(404, {"detail": "Not Found"})
+
+
+def percentile(values: List[float], p: float) -> float:
+    """计算已排序列表的分位数"""
+    if not values:
+        return 0.0
+    index = min(len(values) - 1, max(0, int(round(p / 100 * (len(values) - 1)))))
+    return values[index]
+
+
+async def seed(args: argparse.Namespace) -> List[str]:
+    """初始化数据库并写入 Team 和兑换码"""
+    from datetime import timedelta
+
+    from app.database import AsyncSessionLocal, Base, engine, init_db
+    from app.db_migrations import run_migrations
+    from app.models import RedemptionCode, Team
+    from app.services.settings import settings_service
+    from app.utils.time_utils import get_now
+
+    if args.database_url:
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.drop_all)
+            await conn.exec_driver_sql("DROP TABLE IF EXISTS schema_version")
+
+    await init_db()
+    await run_migrations()
+
+    now = get_now()
+    codes = [f"STRESS{i:08d}" for i in range(args.codes)]
+    async with AsyncSessionLocal() as session:
+        session.add_all([
+            Team(
+                email=f"owner{i}@stress.local",
+                access_token_encrypted="mock",
+                account_id=f"acct-{i:04d}",
+                team_name=f"Stress Team {i}",
+                expires_at=now + timedelta(days=30 + i),
+                current_members=0,
+                max_members=args.seats,
+                status="active"
+            )
+            for i in range(args.teams)
+        ])
+        session.add_all([RedemptionCode(code=code, status="unused") for code in codes])
+        await session.commit()
+
+        if args.strategy:
+            await settings_service.update_team_placement_strategy(session, args.strategy)
+
+    return codes
+
+
+def install_mocks(upstream: MockUpstream) -> Counter:
+    """
+    替换上游 HTTP 会话和 Token 校验, 并统计兑换尝试与回退次数
+
+    Returns:
+        计数器 (attempts, rollbacks)
+    """
+    from app.services.chatgpt import chatgpt_service
+    from app.services.redeem_flow import redeem_flow_service
+
+    counters: Counter = Counter()
+
+    # _make_request 仅在没有会话时创建, 直接放入模拟会话即可保留真实的重试逻辑
+    chatgpt_service.session = upstream
+
+    async def ensure_access_token(team, db_session):
+        return "mock-access-token"
+
+    redeem_flow_service.team_service.ensure_access_token = ensure_access_token
+
+    validate_code = redeem_flow_service.redemption_service.validate_code
+    rollback_redemption = redeem_flow_service._rollback_redemption
+
+    async def counted_validate_code(code, db_session):
+        counters["attempts"] += 1
+        return await validate_code(code, db_session)
+
+    async def counted_rollback(db_session, code, team_id):
+        counters["rollbacks"] += 1
+        return await rollback_redemption(db_session, code, team_id)
+
+    redeem_flow_service.redemption_service.validate_code = counted_validate_code
+    redeem_flow_service._rollback_redemption = counted_rollback
+    return counters
+
+
+async def run_load(
+    args: argparse.Namespace,
+    jobs: List[Tuple[str, str]]
+) -> Tuple[List[Dict[str, Any]], float]:
+    """并发执行兑换请求"""
+    from app.database import AsyncSessionLocal
+    from app.services.redeem_flow import redeem_flow_service
+
+    queue: asyncio.Queue = asyncio.Queue()
+    for job in jobs:
+        queue.put_nowait(job)
+
+    outcomes: List[Dict[str, Any]] = []
+
+    async def redeemer():
+        while True:
+            try:
+                email, code = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+
+            started = time.perf_counter()
+            try:
+                async with AsyncSessionLocal() as session:
+                    result = await redeem_flow_service.redeem_and_join_team(email, code, None, session)
+            except Exception as e:
+                result = {"success": False, "error": f"未捕获异常: {e}"}
+
+            outcomes.append({
+                "email": email,
+                "code": code,
+                "success": bool(result and result.get("success")),
+                "pending": bool(result and result.get("pending")),
+                "error": (result or {}).get("error") or ("返回为空" if not result else None),
+                "team_id": ((result or {}).get("team_info") or {}).get("team_id"),
+                "latency": time.perf_counter() - started
+            })
+
+    started = time.perf_counter()
+    await asyncio.gather(*(redeemer() for _ in range(max(1, args.concurrency))))
+    return outcomes, time.perf_counter() - started
+
+
+async def drain_retry_queue() -> Dict[str, int]:
+    """忽略退避时间处理完重试队列, 返回各状态的任务数"""
+    from datetime import timedelta
+
+    from sqlalchemy import func, select
+
+    from app.database import AsyncSessionLocal
+    from app.models import InviteRetryJob
+    from app.services.invite_retry import invite_retry_service
+    from app.utils.time_utils import get_now
+
+    far_future = get_now() + timedelta(days=1)
+    while await invite_retry_service.process_due(limit=1000, now=far_future):
+        pass
+
+    async with AsyncSessionLocal() as session:
+        stmt = select(InviteRetryJob.status, func.count()).group_by(InviteRetryJob.status)
+        return {status: count for status, count in (await session.execute(stmt)).all()}
+
+
+async def check_invariants(upstream: MockUpstream, outcomes: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """压测结束后检查数据一致性"""
+    from sqlalchemy import func, select
+
+    from app.database import AsyncSessionLocal
+    from app.models import RedemptionCode, RedemptionRecord, Team
+
+    violations: List[str] = []
+    leaked_seats = 0
+
+    async with AsyncSessionLocal() as session:
+        teams = (await session.execute(select(Team))).scalars().all()
+        records = (await session.execute(select(RedemptionRecord))).scalars().all()
+        codes = (await session.execute(select(RedemptionCode))).scalars().all()
+
+        record_counts = Counter(record.code for record in records)
+        records_by_team = Counter(record.team_id for record in records)
+
+        for team in teams:
+            invited = len(upstream.members.get(team.account_id, ()))
+            if team.current_members > team.max_members:
+                violations.append(
+                    f"Team {team.id} 超员: current_members={team.current_members} > max_members={team.max_members}"
+                )
+            if team.current_members < invited:
+                violations.append(
+                    f"Team {team.id} 计数偏低: 数据库 {team.current_members}, 上游已邀请 {invited}"
+                )
+            elif team.current_members > invited:
+                leaked_seats += team.current_members - invited
+            if records_by_team[team.id] != invited:
+                violations.append(
+                    f"Team {team.id} 兑换记录数 {records_by_team[team.id]} 与上游邀请数 {invited} 不一致"
+                )
+
+        for code in codes:
+            count = record_counts[code.code]
+            if not code.has_warranty and count > 1:
+                violations.append(f"兑换码 {code.code} 被使用 {count} 次")
+            if code.status in ("used", "warranty_active") and count == 0:
+                violations.append(f"兑换码 {code.code} 状态为 {code.status} 但没有兑换记录")
+            if code.status == "unused" and count > 0:
+                violations.append(f"兑换码 {code.code} 有兑换记录但状态为 unused")
+
+        stmt = select(
+            func.lower(RedemptionRecord.email), RedemptionRecord.team_id, func.count()
+        ).group_by(func.lower(RedemptionRecord.email), RedemptionRecord.team_id).having(func.count() > 1)
+        for email, team_id, count in (await session.execute(stmt)).all():
+            violations.append(f"邮箱 {email} 在 Team {team_id} 中有 {count} 条兑换记录")
+
+    recorded = {(record.email, record.code) for record in records}
+    for outcome in outcomes:
+        if outcome["success"] and not outcome["pending"] and (outcome["email"], outcome["code"]) not in recorded:
+            violations.append(f"{outcome['email']} 兑换成功但没有兑换记录 ({outcome['code']})")
+
+    return {"violations": violations, "leaked_seats": leaked_seats}
+
+
+def build_report(
+    args: argparse.Namespace,
+    upstream: MockUpstream,
+    counters: Counter,
+    outcomes: List[Dict[str, Any]],
+    elapsed: float,
+    retry_queue: Dict[str, int],
+    invariants: Dict[str, Any]
+) -> Dict[str, Any]:
+    """汇总压测结果"""
+    latencies = sorted(outcome["latency"] for outcome in outcomes)
+    successes = sum(1 for outcome in outcomes if outcome["success"])
+    retries = max(0, counters["attempts"] - len(outcomes))
+    errors = Counter(outcome["error"] for outcome in outcomes if not outcome["success"])
+
+    return {
+        "config": {
+            "teams": args.teams,
+            "seats": args.seats,
+            "codes": args.codes,
+            "requests": len(outcomes),
+            "concurrency": args.concurrency,
+            "latency_ms": args.latency_ms,
+            "error_rate": args.error_rate,
+            "hidden_members": args.hidden_members,
+        },
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_per_second": round(len(outcomes) / elapsed, 2) if elapsed else 0.0,
+        "successes": successes,
+        "failures": len(outcomes) - successes,
+        "pending": sum(1 for outcome in outcomes if outcome["pending"]),
+        "retry_queue": retry_queue,
+        "latency_ms": {
+            "p50": round(percentile(latencies, 50) * 1000, 1),
+            "p99": round(percentile(latencies, 99) * 1000, 1),
+            "max": round(latencies[-1] * 1000, 1) if latencies else 0.0,
+        },
+        "attempts": counters["attempts"],
+        "retries": retries,
+        "retries_per_success": round(retries / successes, 3) if successes else None,
+        "rollbacks": counters["rollbacks"],
+        "upstream": {
+            "invite_requests": upstream.invite_requests,
+            "server_errors": upstream.server_errors,
+            "seat_rejections": upstream.seat_rejections,
+            "duplicate_invites": upstream.duplicate_invites,
+        },
+        "errors": dict(errors.most_common()),
+        "leaked_seats": invariants["leaked_seats"],
+        "violations": invariants["violations"],
+    }
+
+
+def print_report(report: Dict[str, Any]):
+    """以文本形式输出结果"""
+    config = report["config"]
+    print("=" * 60)
+    print(
+        f"Team: {config['teams']} x {config['seats']} 席位, 兑换码: {config['codes']}, "
+        f"请求: {config['requests']}, 并发: {config['concurrency']}"
+    )
+    print(
+        f"上游延迟: {config['latency_ms']} ms, 500 概率: {config['error_rate']}, "
+        f"隐藏成员: {config['hidden_members']}"
+    )
+    print("-" * 60)
+    print(f"耗时: {report['elapsed_seconds']} s, 吞吐量: {report['throughput_per_second']} 次/秒")
+    print(f"成功: {report['successes']} (其中排队: {report['pending']}), 失败: {report['failures']}")
+    if report["retry_queue"]:
+        queue = report["retry_queue"]
+        print(
+            f"重试队列: 完成 {queue.get('done', 0)}, 失败 {queue.get('failed', 0)}, "
+            f"未处理 {queue.get('pending', 0)}"
+        )
+    latency = report["latency_ms"]
+    print(f"延迟 p50: {latency['p50']} ms, p99: {latency['p99']} ms, max: {latency['max']} ms")
+    print(
+        f"兑换尝试: {report['attempts']}, 重试: {report['retries']}, "
+        f"每次成功重试: {report['retries_per_success']}, 占位回退: {report['rollbacks']}"
+    )
+    upstream = report["upstream"]
+    print(
+        f"上游邀请请求: {upstream['invite_requests']}, 500: {upstream['server_errors']}, "
+        f"席位不足: {upstream['seat_rejections']}, 重复邀请: {upstream['duplicate_invites']}"
+    )
+    if report["errors"]:
+        print("失败原因:")
+        for error, count in report["errors"].items():
+            print(f"  {count:>5}  {error}")
+    print(f"未使用的占位席位: {report['leaked_seats']}")
+    print("-" * 60)
+    if report["violations"]:
+        print(f"不变量违规: {len(report['violations'])}")
+        for violation in report["violations"]:
+            print(f"  - {violation}")
+    else:
+        print("不变量检查通过")
+    print("=" * 60)
+
+
+async def main(args: argparse.Namespace) -> int:
+    """执行压测"""
+    rng = random.Random(args.seed)
+
+    codes = await seed(args)
+    jobs = [(f"user{i}@stress.local", code) for i, code in enumerate(codes)]
+    for i in range(int(len(codes) * max(0.0, args.same_email_ratio))):
+        jobs[i] = (rng.choice(jobs)[0], jobs[i][1])
+    extra = int(len(codes) * max(0.0, args.duplicate_ratio))
+    for i in range(extra):
+        jobs.append((f"dup{i}@stress.local", rng.choice(codes)))
+    rng.shuffle(jobs)
+
+    upstream = MockUpstream(args.seats, args.hidden_members, args.latency_ms, args.error_rate, rng)
+    counters = install_mocks(upstream)
+
+    outcomes, elapsed = await run_load(args, jobs)
+    retry_queue = await drain_retry_queue()
+    invariants = await check_invariants(upstream, outcomes)
+    report = build_report(args, upstream, counters, outcomes, elapsed, retry_queue, invariants)
+
+    from app.database import close_db
+    await close_db()
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print_report(report)
+
+    return 1 if report["violations"] else 0
+
+
+def run(argv: Optional[List[str]] = None) -> int:
+    """命令行入口"""
+    args = parse_args(argv)
+    logging.basicConfig(level=getattr(logging, args.log_level.upper(), logging.ERROR))
+
+    temp_dir = None
+    db_path = args.db
+    if not db_path and not args.database_url:
+        temp_dir = tempfile.mkdtemp(prefix="stress_redeem_")
+        db_path = os.path.join(temp_dir, "stress.db")
+
+    # 必须在导入 app 之前设置, app.config 在导入时读取环境变量
+    os.environ["DATABASE_URL"] = args.database_url or f"sqlite+aiosqlite:///{os.path.abspath(db_path)}"
+    os.environ["DEBUG"] = "false"
+
+    try:
+        return asyncio.run(main(args))
+    finally:
+        if temp_dir:
+            if args.keep_db:
+                print(f"数据库已保留: {db_path}", file=sys.stderr)
+            else:
+                shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(run())
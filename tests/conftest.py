@@ -0,0 +1,55 @@
+"""
+测试公共配置
+测试使用临时目录中的 SQLite 数据库; app.config 在导入时读取环境变量, 必须在导入 app 之前设置
+"""
+import asyncio
+import os
+import tempfile
+
+import pytest
+
+_TEMP_DIR = tempfile.mkdtemp(prefix="team_manage_tests_")
+_DB_PATH = os.path.join(_TEMP_DIR, "test.db")
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{_DB_PATH}"
+
+
+async def _reset_database():
+    """删除数据库文件后重新建表并执行全部迁移"""
+    from app import models  # noqa: F401  注册模型后 init_db 才会建表
+    from app.database import close_db, init_db
+    from app.db_migrations import run_migrations
+    from app.services.settings import settings_service
+
+    await close_db()
+    for suffix in ("", "-wal", "-shm"):
+        try:
+            os.remove(_DB_PATH + suffix)
+        except FileNotFoundError:
+            pass
+    await init_db()
+    await run_migrations()
+    settings_service.clear_cache()
+
+
+@pytest.fixture
+def run_db():
+    """
+    在全新数据库上运行协程
+
+    每次调用使用独立的事件循环, 结束时停止写入队列并关闭连接池, 避免连接跨事件循环复用
+    """
+    from app.database import close_db
+    from app.db_writer import db_writer
+
+    def runner(coro_fn, *args, **kwargs):
+        async def scenario():
+            await _reset_database()
+            try:
+                return await coro_fn(*args, **kwargs)
+            finally:
+                await db_writer.stop()
+                await close_db()
+
+        return asyncio.run(scenario())
+
+    return runner
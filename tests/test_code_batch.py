@@ -0,0 +1,69 @@
+"""批量生成兑换码测试"""
+from datetime import datetime
+
+from sqlalchemy import func, select
+
+from app.database import AsyncSessionLocal
+from app.models import RedemptionCode
+from app.services.redemption import RedemptionService
+
+
+async def _count_codes():
+    async with AsyncSessionLocal() as session:
+        return (await session.execute(select(func.count(RedemptionCode.id)))).scalar()
+
+
+def test_batch_result_is_capped_and_exportable_by_batch(run_db, monkeypatch):
+    service = RedemptionService()
+    monkeypatch.setattr(service, "MAX_RETURNED_CODES", 10)
+    monkeypatch.setattr(service, "INSERT_CHUNK_SIZE", 7)
+
+    async def scenario():
+        await service.generate_code_batch(count=3)
+        result = await service.generate_code_batch(count=25)
+
+        exported = []
+        async with AsyncSessionLocal() as session:
+            async for rows in service.iter_codes_for_export(
+                session, created_at=datetime.fromisoformat(result["batch_created_at"])
+            ):
+                exported.extend(row.code for row in rows)
+        return result, exported, await _count_codes()
+
+    result, exported, stored = run_db(scenario)
+
+    assert result["success"]
+    assert result["total"] == 25
+    assert result["truncated"]
+    assert len(result["codes"]) == 10
+    assert stored == 28
+    assert len(exported) == 25
+    assert set(result["codes"]) <= set(exported)
+
+
+def test_batch_partial_failure_reports_committed_codes(run_db, monkeypatch):
+    service = RedemptionService()
+    monkeypatch.setattr(service, "INSERT_CHUNK_SIZE", 5)
+    insert_code_rows = RedemptionService._insert_code_rows
+    calls = []
+
+    async def failing_insert(db_session, rows):
+        calls.append(len(rows))
+        if len(calls) == 3:
+            raise RuntimeError("disk I/O error")
+        return await insert_code_rows(db_session, rows)
+
+    monkeypatch.setattr(service, "_insert_code_rows", failing_insert)
+
+    async def scenario():
+        result = await service.generate_code_batch(count=20)
+        return result, await _count_codes()
+
+    result, stored = run_db(scenario)
+
+    assert not result["success"]
+    assert result["total"] == stored == 10
+    assert len(result["codes"]) == 10
+    assert not result["truncated"]
+    assert result["batch_created_at"]
+    assert "10/20" in result["error"]
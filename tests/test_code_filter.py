@@ -0,0 +1,107 @@
+"""兑换码过滤器测试"""
+from app.database import AsyncSessionLocal
+from app.models import RedemptionCode
+from app.services.code_filter import CodeLookupFilter, InvalidCodeTracker
+
+
+async def _insert_codes(codes):
+    """模拟其他 worker 直接写入数据库, 不经过当前进程的过滤器"""
+    async with AsyncSessionLocal() as session:
+        session.add_all([RedemptionCode(code=code, status="unused") for code in codes])
+        await session.commit()
+
+
+def test_rebuild_loads_existing_codes(run_db):
+    async def scenario():
+        await _insert_codes(["CODE-A", "CODE-B"])
+        code_filter = CodeLookupFilter()
+        async with AsyncSessionLocal() as session:
+            await code_filter.rebuild(session)
+            return (
+                code_filter.ready,
+                await code_filter.might_exist("CODE-A", session),
+                await code_filter.might_exist("CODE-B", session),
+                await code_filter.might_exist("CODE-MISSING", session),
+                code_filter.get_stats(),
+            )
+
+    ready, found_a, found_b, found_missing, stats = run_db(scenario)
+
+    assert ready
+    assert found_a and found_b
+    assert not found_missing
+    assert stats["codes"] == 2
+    assert stats["rejected"] == 1
+
+
+def test_code_from_other_worker_within_sync_interval(run_db):
+    """其他 worker 刚生成的兑换码在增量同步间隔内也不能被判为不存在"""
+    async def scenario():
+        code_filter = CodeLookupFilter()
+        async with AsyncSessionLocal() as session:
+            await code_filter.rebuild(session)
+
+        await _insert_codes(["CODE-NEW"])
+
+        async with AsyncSessionLocal() as session:
+            found = await code_filter.might_exist("CODE-NEW", session)
+            found_again = await code_filter.might_exist("CODE-NEW", session)
+        return found, found_again, code_filter.rejected_count
+
+    found, found_again, rejected = run_db(scenario)
+
+    assert found
+    assert found_again
+    assert rejected == 0
+
+
+def test_incremental_sync_picks_up_new_codes(run_db):
+    async def scenario():
+        code_filter = CodeLookupFilter()
+        async with AsyncSessionLocal() as session:
+            await code_filter.rebuild(session)
+
+        await _insert_codes(["CODE-X", "CODE-Y"])
+        # 让下一次未命中触发增量同步
+        code_filter._last_sync -= CodeLookupFilter.SYNC_INTERVAL_SECONDS
+
+        async with AsyncSessionLocal() as session:
+            found_missing = await code_filter.might_exist("CODE-MISSING", session)
+        return found_missing, "CODE-X" in code_filter._bloom, "CODE-Y" in code_filter._bloom
+
+    found_missing, has_x, has_y = run_db(scenario)
+
+    assert not found_missing
+    assert has_x and has_y
+
+
+def test_mark_deleted_rebuilds_when_stale(run_db):
+    async def scenario():
+        await _insert_codes([f"CODE-{i}" for i in range(5)])
+        code_filter = CodeLookupFilter()
+        async with AsyncSessionLocal() as session:
+            await code_filter.rebuild(session)
+            bloom_before = code_filter._bloom
+            await code_filter.mark_deleted(session, count=2)
+            return bloom_before is not code_filter._bloom, code_filter.get_stats()
+
+    rebuilt, stats = run_db(scenario)
+
+    assert rebuilt
+    assert stats["stale"] == 0
+    assert stats["codes"] == 5
+
+
+def test_invalid_code_tracker_blocks_after_max_misses():
+    tracker = InvalidCodeTracker()
+
+    for _ in range(InvalidCodeTracker.MAX_MISSES):
+        assert not tracker.is_blocked("198.51.100.5")
+        tracker.record_miss("198.51.100.5")
+
+    assert tracker.is_blocked("198.51.100.5")
+    assert not tracker.is_blocked("198.51.100.6")
+    # 无法识别 IP 时不拦截
+    tracker.record_miss(None)
+    assert not tracker.is_blocked(None)
+    assert tracker.shed_count == 1
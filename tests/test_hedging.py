@@ -0,0 +1,61 @@
+"""请求对冲测试"""
+import asyncio
+
+import pytest
+
+from app.utils.hedging import RequestHedger
+
+
+def _sleeping(delay, result="ok"):
+    async def request():
+        await asyncio.sleep(delay)
+        return result
+    return request
+
+
+async def _prime(hedger, key, delay=0.02, count=20):
+    for _ in range(count):
+        await hedger.run(key, _sleeping(delay))
+
+
+def test_errors_and_unusable_results_are_not_sampled():
+    """异常和不可采用的结果不计入延迟样本, 阈值不变"""
+    hedger = RequestHedger(budget_ratio=1.0, window=20, min_samples=5, max_burst=100)
+
+    async def failing():
+        raise ConnectionError("upstream reset")
+
+    async def scenario():
+        await _prime(hedger, "account")
+        before = list(hedger._stats["account"].latencies)
+
+        for _ in range(10):
+            with pytest.raises(ConnectionError):
+                await hedger.run("account", failing)
+        for _ in range(10):
+            await hedger.run("account", _sleeping(0, result=503), is_final=lambda status: status < 500)
+
+        return before, list(hedger._stats["account"].latencies)
+
+    before, after = asyncio.run(scenario())
+    assert after == before
+
+
+def test_cancelled_primary_keeps_threshold_from_dropping():
+    """对冲胜出时原请求按已等待时间计入下限样本, 阈值不会被快速的对冲副本拉低"""
+    hedger = RequestHedger(budget_ratio=1.0, window=20, min_samples=5, max_burst=100)
+
+    async def scenario():
+        await _prime(hedger, "session")
+        initial = hedger.threshold("session")
+
+        for _ in range(20):
+            calls = iter([_sleeping(1.0, result="slow"), _sleeping(0, result="fast")])
+            result = await hedger.run("session", lambda: next(calls)())
+            assert result == "fast"
+
+        return initial, hedger.threshold("session"), hedger._stats["session"]
+
+    initial, after, stats = asyncio.run(scenario())
+    assert stats.hedges == stats.hedge_wins == 20
+    assert after >= initial
@@ -0,0 +1,96 @@
+"""邀请重试队列测试"""
+from datetime import timedelta
+
+from sqlalchemy import update
+
+from app.database import AsyncSessionLocal
+from app.models import InviteRetryJob, RedemptionCode, Team
+from app.services.invite_retry import invite_retry_service
+from app.services.redeem_flow import redeem_flow_service
+from app.utils.time_utils import get_now
+
+
+async def _create_team_and_code(code):
+    async with AsyncSessionLocal() as session:
+        team = Team(
+            email="owner@example.com",
+            access_token_encrypted="encrypted",
+            account_id="account-0",
+            team_name="Team 0",
+            expires_at=get_now() + timedelta(days=30),
+            current_members=1,
+            max_members=6,
+            status="active",
+        )
+        session.add(team)
+        session.add(RedemptionCode(code=code, status="unused"))
+        await session.commit()
+        return team.id
+
+
+def test_final_failure_releases_seat_and_reports_failed(run_db, monkeypatch):
+    """重试次数用尽后回退席位占位, 用户能查询到 failed 状态"""
+    async def send_invite(access_token, account_id, email, db_session, max_retries=None):
+        return {"success": False, "status_code": 503, "error": "upstream unavailable"}
+
+    async def ensure_access_token(team, db_session):
+        return "access-token"
+
+    monkeypatch.setattr(redeem_flow_service.chatgpt_service, "send_invite", send_invite)
+    monkeypatch.setattr(redeem_flow_service.team_service, "ensure_access_token", ensure_access_token)
+
+    async def scenario():
+        team_id = await _create_team_and_code("CODE-RETRY")
+
+        async with AsyncSessionLocal() as session:
+            redeemed = await redeem_flow_service.redeem_and_join_team(
+                "User@Example.com", "CODE-RETRY", None, session
+            )
+        async with AsyncSessionLocal() as session:
+            pending = await invite_retry_service.get_job_status(session, "user@example.com", "CODE-RETRY")
+
+        # 跳到最后一次尝试
+        async with AsyncSessionLocal() as session:
+            await session.execute(
+                update(InviteRetryJob).values(
+                    attempts=invite_retry_service.MAX_ATTEMPTS - 1,
+                    next_attempt_at=get_now() - timedelta(seconds=1)
+                )
+            )
+            await session.commit()
+        processed = await invite_retry_service.process_due()
+
+        async with AsyncSessionLocal() as session:
+            failed = await invite_retry_service.get_job_status(session, "USER@example.com", "CODE-RETRY")
+            team = await session.get(Team, team_id)
+            code = await session.get(RedemptionCode, 1)
+            job = await session.get(InviteRetryJob, 1)
+            return redeemed, pending, processed, failed, team, code, job
+
+    redeemed, pending, processed, failed, team, code, job = run_db(scenario)
+
+    assert redeemed["success"] and redeemed["pending"]
+    assert pending["found"] and pending["status"] == "pending"
+    assert processed == 1
+
+    assert failed["found"] and failed["status"] == "failed"
+    assert failed["attempts"] == invite_retry_service.MAX_ATTEMPTS
+    assert "重新兑换" in failed["message"]
+    assert job.last_error == "upstream unavailable"
+
+    assert team.current_members == 1
+    assert team.status == "active"
+    assert code.status == "unused"
+    assert code.used_by_email is None
+
+
+def test_status_without_job(run_db):
+    async def scenario():
+        async with AsyncSessionLocal() as session:
+            return await invite_retry_service.get_job_status(session, "user@example.com", "CODE-NONE")
+
+    result = run_db(scenario)
+
+    assert result["success"]
+    assert not result["found"]
+    assert result["status"] is None
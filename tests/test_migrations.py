@@ -0,0 +1,143 @@
+"""数据库迁移测试"""
+import os
+import sqlite3
+
+from sqlalchemy.engine import make_url
+
+from app.database import close_db
+from app.db_migrations import LATEST_VERSION, MIGRATIONS, run_migrations
+
+# 迁移新增的索引和列, 引入迁移之前的数据库 (基线) 中都不存在
+MIGRATED_INDEXES = [
+    "idx_email_lower_team",
+    "idx_redeemed_at",
+    "idx_code_created_at",
+    "idx_team_available",
+    "idx_code_status_created",
+    "idx_record_code_redeemed",
+    "idx_record_team_redeemed",
+    "idx_retry_email_team",
+]
+MIGRATED_COLUMNS = [
+    ("redemption_codes", "has_warranty"),
+    ("redemption_codes", "warranty_expires_at"),
+    ("redemption_codes", "warranty_days"),
+    ("redemption_records", "is_warranty_redemption"),
+    ("teams", "refresh_token_encrypted"),
+    ("teams", "session_token_encrypted"),
+    ("teams", "client_id"),
+    ("teams", "error_count"),
+    ("teams", "account_role"),
+    ("settings", "generation"),
+]
+
+
+def _connect() -> sqlite3.Connection:
+    return sqlite3.connect(make_url(os.environ["DATABASE_URL"]).database)
+
+
+def _downgrade_to_baseline(keep_columns=()):
+    """把已迁移的数据库还原为基线结构: 删除迁移新增的索引、列、全文索引和版本表"""
+    conn = _connect()
+    try:
+        fts_objects = conn.execute(
+            "SELECT type, name FROM sqlite_master WHERE name LIKE '%\\_fts%' ESCAPE '\\' AND type IN ('table', 'trigger')"
+        ).fetchall()
+        for object_type, name in fts_objects:
+            if object_type == "trigger":
+                conn.execute(f"DROP TRIGGER IF EXISTS {name}")
+        for object_type, name in fts_objects:
+            if object_type == "table":
+                conn.execute(f"DROP TABLE IF EXISTS {name}")
+        for index in MIGRATED_INDEXES:
+            conn.execute(f"DROP INDEX IF EXISTS {index}")
+        for table, column in MIGRATED_COLUMNS:
+            if (table, column) not in keep_columns:
+                conn.execute(f"ALTER TABLE {table} DROP COLUMN {column}")
+        conn.execute("DROP TABLE schema_version")
+        conn.execute("INSERT INTO redemption_codes (code, status) VALUES ('BASELINE-CODE', 'unused')")
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _inspect():
+    conn = _connect()
+    try:
+        indexes = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        columns = {
+            (table, row[1])
+            for table in {table for table, _ in MIGRATED_COLUMNS}
+            for row in conn.execute(f"PRAGMA table_info({table})")
+        }
+        versions = [row[0] for row in conn.execute("SELECT version FROM schema_version ORDER BY version")]
+        code = conn.execute(
+            "SELECT status, has_warranty, warranty_days FROM redemption_codes WHERE code = 'BASELINE-CODE'"
+        ).fetchone()
+        fts_tables = {
+            row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE '%_fts'")
+        }
+        return indexes, columns, versions, code, fts_tables
+    finally:
+        conn.close()
+
+
+def test_upgrades_baseline_database(run_db):
+    async def scenario():
+        await close_db()
+        _downgrade_to_baseline()
+        applied = await run_migrations()
+        state = _inspect()
+        applied_again = await run_migrations()
+        return applied, state, applied_again
+
+    applied, (indexes, columns, versions, code, fts_tables), applied_again = run_db(scenario)
+
+    assert applied == [migration.version for migration in MIGRATIONS]
+    assert versions == list(range(1, LATEST_VERSION + 1))
+    assert set(MIGRATED_INDEXES) <= indexes
+    assert set(MIGRATED_COLUMNS) <= columns
+    assert fts_tables
+    # 已有数据保留, 新增列取默认值
+    assert code == ("unused", 0, 30)
+    # 已是最新版本时不再执行任何迁移
+    assert applied_again == []
+
+
+def test_upgrades_database_migrated_by_legacy_code(run_db):
+    """引入版本号之前的旧迁移已添加部分列, 重新执行加列步骤时跳过已存在的列"""
+    async def scenario():
+        await close_db()
+        _downgrade_to_baseline(keep_columns=MIGRATED_COLUMNS[:4])
+        applied = await run_migrations()
+        return applied, _inspect()
+
+    applied, (indexes, columns, versions, code, fts_tables) = run_db(scenario)
+
+    assert applied == [migration.version for migration in MIGRATIONS]
+    assert versions == list(range(1, LATEST_VERSION + 1))
+    assert set(MIGRATED_COLUMNS) <= columns
+    assert set(MIGRATED_INDEXES) <= indexes
+    assert code[0] == "unused"
+
+
+def test_applies_only_pending_migrations(run_db):
+    async def scenario():
+        await close_db()
+        conn = _connect()
+        try:
+            conn.execute("DROP INDEX idx_retry_email_team")
+            conn.execute("ALTER TABLE settings DROP COLUMN generation")
+            conn.execute("DELETE FROM schema_version WHERE version >= 8")
+            conn.commit()
+        finally:
+            conn.close()
+        applied = await run_migrations()
+        return applied, _inspect()
+
+    applied, (indexes, columns, versions, code, fts_tables) = run_db(scenario)
+
+    assert applied == [8, 9]
+    assert versions == list(range(1, LATEST_VERSION + 1))
+    assert "idx_retry_email_team" in indexes
+    assert ("settings", "generation") in columns
@@ -0,0 +1,118 @@
+"""游标分页测试"""
+import base64
+import json
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+
+from app.database import AsyncSessionLocal
+from app.models import RedemptionCode
+from app.utils.pagination import LAST_PAGE_CURSOR, decode_cursor, encode_cursor, keyset_paginate
+
+BASE_TIME = datetime(2025, 1, 1, 12, 0, 0)
+
+
+async def _insert_codes():
+    """25 个兑换码: 前 12 个共用同一创建时间 (批量生成), 其余各不相同"""
+    async with AsyncSessionLocal() as session:
+        session.add_all([
+            RedemptionCode(code=f"CODE-{i:02d}", status="unused", created_at=BASE_TIME)
+            for i in range(12)
+        ])
+        session.add_all([
+            RedemptionCode(code=f"CODE-{i:02d}", status="unused", created_at=BASE_TIME + timedelta(minutes=i))
+            for i in range(12, 25)
+        ])
+        await session.commit()
+
+        result = await session.execute(
+            select(RedemptionCode.code).order_by(RedemptionCode.created_at.desc(), RedemptionCode.id.desc())
+        )
+        return list(result.scalars().all())
+
+
+async def _page(cursor=None, per_page=10):
+    async with AsyncSessionLocal() as session:
+        page = await keyset_paginate(session, select(RedemptionCode), RedemptionCode, 25, per_page, cursor)
+    page["codes"] = [item.code for item in page["items"]]
+    return page
+
+
+def _raw_cursor(payload) -> str:
+    raw = json.dumps(payload).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def test_cursor_round_trip():
+    cursor = encode_cursor(BASE_TIME, 42, "prev", 3)
+
+    assert decode_cursor(cursor) == {
+        "created_at": BASE_TIME,
+        "id": 42,
+        "direction": "prev",
+        "page": 3,
+    }
+
+
+def test_invalid_cursors_are_rejected():
+    assert decode_cursor("not-a-cursor!!") is None
+    assert decode_cursor(_raw_cursor({"t": None, "i": 1, "d": "sideways", "p": 1})) is None
+    assert decode_cursor(_raw_cursor({"t": None, "i": "abc", "d": "next", "p": 1})) is None
+    assert decode_cursor(_raw_cursor({"t": "yesterday", "i": 1, "d": "next", "p": 1})) is None
+    assert decode_cursor(_raw_cursor({"t": None, "d": "next"})) is None
+    assert decode_cursor(_raw_cursor([1, 2, 3])) is None
+    # 页码只用于显示, 越界时修正而不是报错
+    assert decode_cursor(_raw_cursor({"t": None, "i": 1, "d": "next", "p": -5}))["page"] == 1
+
+
+def test_walks_tied_created_at_without_gaps(run_db):
+    async def scenario():
+        expected = await _insert_codes()
+
+        pages = [await _page()]
+        while pages[-1]["next_cursor"]:
+            pages.append(await _page(pages[-1]["next_cursor"]))
+
+        back = await _page(pages[-1]["prev_cursor"])
+        return expected, pages, back
+
+    expected, pages, back = run_db(scenario)
+
+    assert [page["current_page"] for page in pages] == [1, 2, 3]
+    assert [code for page in pages for code in page["codes"]] == expected
+    assert pages[0]["prev_cursor"] is None
+    assert pages[-1]["next_cursor"] is None
+    # 第 2、3 页的分界落在同一创建时间的兑换码中间, 往回翻页结果一致
+    assert back["current_page"] == 2
+    assert back["codes"] == pages[1]["codes"]
+    assert back["next_cursor"] and back["prev_cursor"]
+
+
+def test_last_page_cursor(run_db):
+    async def scenario():
+        expected = await _insert_codes()
+        last = await _page(LAST_PAGE_CURSOR)
+        before_last = await _page(last["prev_cursor"])
+        return expected, last, before_last
+
+    expected, last, before_last = run_db(scenario)
+
+    assert last["current_page"] == 3
+    assert last["codes"] == expected[20:]
+    assert last["next_cursor"] is None
+    assert last["prev_cursor"]
+    assert before_last["current_page"] == 2
+    assert before_last["codes"] == expected[10:20]
+
+
+def test_tampered_cursor_falls_back_to_first_page(run_db):
+    async def scenario():
+        expected = await _insert_codes()
+        page = await _page(_raw_cursor({"t": "garbage", "i": 1, "d": "next", "p": 2}))
+        return expected, page
+
+    expected, page = run_db(scenario)
+
+    assert page["current_page"] == 1
+    assert page["codes"] == expected[:10]
+    assert page["prev_cursor"] is None
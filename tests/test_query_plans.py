@@ -0,0 +1,33 @@
+"""热点查询执行计划测试 (检查定义见 benchmarks/check_query_plans.py)"""
+import os
+import sqlite3
+
+import pytest
+from sqlalchemy.engine import make_url
+
+from benchmarks.check_query_plans import build_checks, check_plan, explain
+
+
+async def _noop():
+    return None
+
+
+def _check_id(check) -> str:
+    # pytest 会转义非 ASCII 的用例 ID, 用名称括号中的代码位置作为 ID
+    return check.name.rsplit("(", 1)[-1].rstrip(")")
+
+
+@pytest.mark.parametrize("check", build_checks(), ids=_check_id)
+def test_query_plan(run_db, check):
+    # run_db 在全新数据库上建表并执行全部迁移
+    run_db(_noop)
+
+    db_path = make_url(os.environ["DATABASE_URL"]).database
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        plan = explain(conn.cursor(), check.statement)
+    finally:
+        conn.close()
+
+    problems = check_plan(check, plan)
+    assert not problems, "\n".join([check.name] + problems + plan)
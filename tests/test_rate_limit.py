@@ -0,0 +1,55 @@
+"""客户端 IP 解析测试"""
+from starlette.requests import Request
+
+from app.dependencies.rate_limit import get_client_ip, parse_trusted_proxies
+
+TRUSTED = parse_trusted_proxies("127.0.0.1, 172.16.0.0/12, not-an-ip")
+
+
+def _request(peer, headers=()):
+    return Request({
+        "type": "http",
+        "method": "GET",
+        "path": "/",
+        "headers": [(name.lower().encode(), value.encode()) for name, value in headers],
+        "client": (peer, 12345) if peer else None,
+    })
+
+
+def test_untrusted_peer_ignores_forwarded_headers():
+    """直连地址不是可信代理时, 伪造的转发头不生效"""
+    request = _request("203.0.113.9", [("X-Forwarded-For", "198.51.100.1"), ("X-Real-IP", "198.51.100.2")])
+    assert get_client_ip(request, TRUSTED) == "203.0.113.9"
+
+
+def test_trusted_peer_uses_rightmost_untrusted_forwarded_hop():
+    """可信代理转发时取最右侧的不可信地址, 客户端在最左侧伪造的地址被忽略"""
+    request = _request("172.18.0.1", [("X-Forwarded-For", "10.9.9.9, 198.51.100.7, 127.0.0.1")])
+    assert get_client_ip(request, TRUSTED) == "198.51.100.7"
+
+
+def test_trusted_peer_merges_multiple_forwarded_headers():
+    request = _request("127.0.0.1", [("X-Forwarded-For", "198.51.100.7"), ("X-Forwarded-For", "198.51.100.8")])
+    assert get_client_ip(request, TRUSTED) == "198.51.100.8"
+
+
+def test_trusted_peer_falls_back_to_real_ip_then_peer():
+    assert get_client_ip(_request("127.0.0.1", [("X-Real-IP", "198.51.100.3")]), TRUSTED) == "198.51.100.3"
+    assert get_client_ip(_request("127.0.0.1", [("X-Real-IP", "garbage")]), TRUSTED) == "127.0.0.1"
+    assert get_client_ip(_request("127.0.0.1"), TRUSTED) == "127.0.0.1"
+
+
+def test_malformed_forwarded_hop_falls_back_to_peer():
+    request = _request("127.0.0.1", [("X-Forwarded-For", "198.51.100.7, bogus")])
+    assert get_client_ip(request, TRUSTED) == "127.0.0.1"
+
+
+def test_different_clients_behind_proxy_get_different_keys():
+    """同一代理后的不同访客不会共用限流额度"""
+    first = _request("127.0.0.1", [("X-Forwarded-For", "198.51.100.1")])
+    second = _request("127.0.0.1", [("X-Forwarded-For", "198.51.100.2")])
+    assert get_client_ip(first, TRUSTED) != get_client_ip(second, TRUSTED)
+
+
+def test_missing_client():
+    assert get_client_ip(_request(None), TRUSTED) is None
@@ -0,0 +1,97 @@
+"""令牌桶限流器测试"""
+import pytest
+
+from app.utils import rate_limiter as rate_limiter_module
+from app.utils.rate_limiter import RateLimiter
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """可手动推进的 time.monotonic"""
+    now = [1000.0]
+    monkeypatch.setattr(rate_limiter_module.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_rejects_when_bucket_is_empty(clock):
+    limiter = RateLimiter(capacity=3, period=60)
+
+    assert [limiter.hit("ip")[0] for _ in range(3)] == [True, True, True]
+    allowed, retry_after = limiter.hit("ip")
+
+    assert not allowed
+    assert retry_after == pytest.approx(20.0)
+    assert limiter.rejected_count == 1
+    # 其他键不受影响
+    assert limiter.hit("other")[0]
+
+
+def test_tokens_refill_over_time(clock):
+    limiter = RateLimiter(capacity=3, period=60)
+    for _ in range(3):
+        limiter.hit("ip")
+
+    clock[0] += 20
+    assert limiter.hit("ip")[0]
+    assert not limiter.hit("ip")[0]
+
+
+def test_peek_does_not_consume(clock):
+    limiter = RateLimiter(capacity=1, period=60)
+
+    assert limiter.peek("ip") == (True, 0.0)
+    assert limiter.peek("ip") == (True, 0.0)
+    assert len(limiter) == 0
+
+    limiter.hit("ip")
+    allowed, retry_after = limiter.peek("ip")
+    assert not allowed
+    assert retry_after == pytest.approx(60.0)
+
+
+def test_refilled_buckets_are_evicted(clock):
+    limiter = RateLimiter(capacity=2, period=10)
+    limiter.hit("a")
+    limiter.hit("b")
+    assert len(limiter) == 2
+
+    clock[0] += 10
+    limiter.hit("c")
+
+    # a, b 已补满, 丢弃后等价于从未访问
+    assert len(limiter) == 1
+    assert limiter.hit("a")[0] and limiter.hit("a")[0]
+
+
+def test_recently_limited_bucket_is_kept(clock):
+    limiter = RateLimiter(capacity=1, period=10)
+    limiter.hit("a")
+    clock[0] += 5
+    limiter.hit("b")
+
+    # a 尚未补满, 不能被按 TTL 淘汰
+    assert len(limiter) == 2
+    assert not limiter.hit("a")[0]
+
+
+def test_max_keys_evicts_least_recently_used(clock):
+    limiter = RateLimiter(capacity=5, period=60, max_keys=2)
+    limiter.hit("a")
+    clock[0] += 1
+    limiter.hit("b")
+    clock[0] += 1
+    limiter.hit("a")
+    clock[0] += 1
+    limiter.hit("c")
+
+    assert len(limiter) == 2
+    assert set(limiter._buckets) == {"a", "c"}
+
+
+def test_reset_clears_key(clock):
+    limiter = RateLimiter(capacity=1, period=60)
+    limiter.hit("ip")
+    assert not limiter.hit("ip")[0]
+
+    limiter.reset("ip")
+    assert limiter.hit("ip")[0]
@@ -0,0 +1,80 @@
+"""兑换流程测试"""
+from datetime import timedelta
+
+from sqlalchemy import select
+
+from app.database import AsyncSessionLocal
+from app.models import InviteRetryJob, RedemptionCode, RedemptionRecord, Team
+from app.services.redeem_flow import redeem_flow_service
+from app.utils.time_utils import get_now
+
+
+async def _create_teams_and_codes(codes):
+    now = get_now()
+    async with AsyncSessionLocal() as session:
+        teams = [
+            Team(
+                email=f"owner{i}@example.com",
+                access_token_encrypted="encrypted",
+                account_id=f"account-{i}",
+                team_name=f"Team {i}",
+                expires_at=now + timedelta(days=30 + i),
+                current_members=1,
+                max_members=6,
+                status="active",
+            )
+            for i in range(2)
+        ]
+        session.add_all(teams)
+        session.add_all([RedemptionCode(code=code, status="unused") for code in codes])
+        await session.commit()
+        return [team.id for team in teams]
+
+
+def test_pending_invite_excludes_team_for_same_email(run_db, monkeypatch):
+    """邀请排队重试期间, 同一邮箱兑换第二个兑换码不能分配到同一个 Team"""
+    invite_results = [
+        {"success": False, "status_code": 503, "error": "upstream unavailable"},
+        {"success": True, "data": {}},
+    ]
+    invited_accounts = []
+
+    async def send_invite(access_token, account_id, email, db_session, max_retries=None):
+        invited_accounts.append(account_id)
+        return invite_results.pop(0)
+
+    async def ensure_access_token(team, db_session):
+        return "access-token"
+
+    monkeypatch.setattr(redeem_flow_service.chatgpt_service, "send_invite", send_invite)
+    monkeypatch.setattr(redeem_flow_service.team_service, "ensure_access_token", ensure_access_token)
+
+    async def scenario():
+        team_ids = await _create_teams_and_codes(["CODE-PENDING", "CODE-SECOND"])
+
+        async with AsyncSessionLocal() as session:
+            first = await redeem_flow_service.redeem_and_join_team(
+                "User@Example.com", "CODE-PENDING", None, session
+            )
+        async with AsyncSessionLocal() as session:
+            second = await redeem_flow_service.redeem_and_join_team(
+                "user@example.com", "CODE-SECOND", None, session
+            )
+
+        async with AsyncSessionLocal() as session:
+            jobs = (await session.execute(select(InviteRetryJob))).scalars().all()
+            records = (await session.execute(select(RedemptionRecord))).scalars().all()
+        return team_ids, first, second, jobs, records
+
+    team_ids, first, second, jobs, records = run_db(scenario)
+
+    assert first["success"] and first.get("pending")
+    assert second["success"] and not second.get("pending")
+    assert len(jobs) == 1 and jobs[0].status == "pending"
+    assert len(records) == 1
+
+    pending_team_id = first["team_info"]["team_id"]
+    assert pending_team_id == team_ids[0]
+    assert jobs[0].team_id == pending_team_id
+    assert second["team_info"]["team_id"] == records[0].team_id == team_ids[1]
+    assert invited_accounts == ["account-0", "account-1"]
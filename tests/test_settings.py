@@ -0,0 +1,47 @@
+"""系统设置缓存测试"""
+from datetime import timedelta
+
+from app.database import AsyncSessionLocal
+from app.services import settings as settings_module
+from app.services.settings import SettingsService
+
+
+def test_cache_sees_writes_with_out_of_order_timestamps(run_db, monkeypatch):
+    """时间戳比已缓存的修改更早的写入 (时钟偏差 / 乱序提交) 也能被其他 worker 读到"""
+    writer = SettingsService(sync_interval=0)
+    reader = SettingsService(sync_interval=0)
+
+    async def scenario():
+        async with AsyncSessionLocal() as session:
+            assert await writer.update_settings(session, {"proxy": "http://a:1", "cf_clearance": "first"})
+            assert await reader.get_setting(session, "cf_clearance") == "first"
+
+            # 模拟时钟落后的节点写入
+            skewed_now = settings_module.get_now() - timedelta(minutes=10)
+            monkeypatch.setattr(settings_module, "get_now", lambda: skewed_now)
+            assert await writer.update_setting(session, "cf_clearance", "second")
+            await session.rollback()
+
+            values = await reader.get_settings(session, ["proxy", "cf_clearance", "missing"], default="-")
+        return values
+
+    values = run_db(scenario)
+    assert values == {"proxy": "http://a:1", "cf_clearance": "second", "missing": "-"}
+
+
+def test_cache_checks_generation_at_most_once_per_interval(run_db):
+    """检查间隔内的读取不查询数据库"""
+    writer = SettingsService(sync_interval=0)
+    reader = SettingsService(sync_interval=60)
+
+    async def scenario():
+        async with AsyncSessionLocal() as session:
+            assert await reader.get_setting(session, "log_level", "INFO") == "INFO"
+            assert await writer.update_setting(session, "log_level", "DEBUG")
+            stale = await reader.get_setting(session, "log_level", "INFO")
+
+            reader._checked_at -= 61
+            fresh = await reader.get_setting(session, "log_level", "INFO")
+        return stale, fresh
+
+    assert run_db(scenario) == ("INFO", "DEBUG")